@@ -192,6 +192,9 @@ const AdminPage = () => {
                           <p><strong>👤 User ID:</strong> {ride.user_id || 'N/A'}</p>
                           <p><strong>📍 Pickup:</strong> {ride.pickup ? `(${ride.pickup[0]}, ${ride.pickup[1]})` : 'N/A'}</p>
                           <p><strong>🎯 Destination:</strong> {ride.destination ? `(${ride.destination[0]}, ${ride.destination[1]})` : 'N/A'}</p>
+                          {ride.queued_at && (
+                            <p><strong>🕐 Queued:</strong> {new Date(ride.queued_at).toLocaleTimeString()}</p>
+                          )}
                         </div>
                       </div>
                     ))}
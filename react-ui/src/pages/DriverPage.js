@@ -2,7 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { Car, MapPin, Activity, Users, DollarSign, TrendingUp, Star, Zap, AlertCircle } from 'lucide-react';
 import Header from '../components/common/Header';
-import { rideAPI } from '../services/api';
+import { rideAPI, subscribeRideEvents } from '../services/api';
 
 const DriverPage = () => {
   const [driverData, setDriverData] = useState({
@@ -132,8 +132,8 @@ ${ridesCount > 0 ? '🔔 Rides available for pickup!' : '😴 No rides pending'}
   useEffect(() => {
     if (locationData.driver_id) {
       getActiveRides();
-      const interval = setInterval(getActiveRides, 10000);
-      return () => clearInterval(interval);
+      // Refetch only when the server pushes a change for this driver
+      return subscribeRideEvents({ driverId: locationData.driver_id }, getActiveRides);
     }
   }, [locationData.driver_id]);
 
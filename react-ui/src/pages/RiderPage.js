@@ -2,7 +2,9 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { MapPin, Navigation, Clock, Car, AlertTriangle, Users, Zap } from 'lucide-react';
 import Header from '../components/common/Header';
-import { rideAPI } from '../services/api';
+import { rideAPI, subscribeRideEvents } from '../services/api';
+
+const AVAILABLE_DRIVERS_PAGE = 50;
 
 const RiderPage = () => {
   const [rideData, setRideData] = useState({
@@ -18,6 +20,7 @@ const RiderPage = () => {
   const [userRides, setUserRides] = useState([]);
   const [activeRides, setActiveRides] = useState([]);
   const [availableDrivers, setAvailableDrivers] = useState([]);
+  const [moreDrivers, setMoreDrivers] = useState(false);
   const [loading, setLoading] = useState(false);
   const [isEmergency, setIsEmergency] = useState(false);
   const [applySurge, setApplySurge] = useState(true);
@@ -67,7 +70,7 @@ const RiderPage = () => {
 
       // Auto add to queue with priority
       const queuePayload = { ...rideData, priority: isEmergency ? 'EMERGENCY' : 'NORMAL' };
-      await rideAPI.addToQueue(queuePayload);
+      await rideAPI.addToQueue(queuePayload, response.data.id);
     } catch (error) {
       setRideStatus(`❌ Error: ${error.response?.data?.detail || error.message}`);
     }
@@ -141,8 +144,13 @@ const RiderPage = () => {
 
   const getAvailableDrivers = async () => {
     try {
-      const response = await rideAPI.getAvailableDrivers();
+      // First page only, with just the fields the list shows
+      const response = await rideAPI.getAvailableDrivers({
+        limit: AVAILABLE_DRIVERS_PAGE,
+        fields: 'name,car_no,latitude,longitude',
+      });
       setAvailableDrivers(response.data);
+      setMoreDrivers(Boolean(response.headers['x-next-cursor']));
     } catch (error) {
       console.error('Error fetching drivers:', error);
     }
@@ -157,8 +165,13 @@ const RiderPage = () => {
   useEffect(() => {
     if (rideData.user_id) {
       getActiveRides();
-      const interval = setInterval(getActiveRides, 10000);
-      return () => clearInterval(interval);
+      // Refetch only when the server pushes a change for this rider
+      return subscribeRideEvents({ userId: rideData.user_id }, (event) => {
+        if (event.type === 'ride_assigned') {
+          setRideStatus(`🚗 Driver #${event.driver_id} assigned to ride ${event.ride_id} (ETA ${event.eta_minutes} min)`);
+        }
+        getActiveRides();
+      });
     }
   }, [rideData.user_id]);
 
@@ -588,7 +601,7 @@ const RiderPage = () => {
               <Car size={20} />
               <h3>Available Drivers</h3>
               <span className="badge badge-success" style={{ marginLeft: 'auto' }}>
-                {availableDrivers.length}
+                {availableDrivers.length}{moreDrivers ? '+' : ''}
               </span>
             </div>
 
@@ -16,13 +16,13 @@ export const rideAPI = {
   requestEmergencyRide: (rideData) => api.post('/request_emergency_ride', rideData),
   requestEmergencyRideContainer: (rideData) => api.post('/request_emergency_ride_container', rideData),
   getUserRides: (userId) => api.get(`/rides/${userId}`),
-  addToQueue: (rideData) => api.post('/add_to_queue', rideData),
+  addToQueue: (rideData, rideId) => api.post('/add_to_queue', rideData, { params: { ride_id: rideId } }),
 
   // Driver operations
   registerDriver: (driverData) => api.post('/register_driver', driverData),
   registerDriversBulk: (driversData) => api.post('/register_drivers_bulk', driversData),
-  getAllDrivers: () => api.get('/drivers'),
-  getAvailableDrivers: () => api.get('/drivers/available'),
+  getAllDrivers: (params) => api.get('/drivers', { params }),
+  getAvailableDrivers: (params) => api.get('/drivers/available', { params }),
   getDriver: (driverId) => api.get(`/driver/${driverId}`),
   addDriverLocation: (driverId, latitude, longitude) =>
     api.post(`/add_driver_location?driver_id=${driverId}&latitude=${latitude}&longitude=${longitude}`),
@@ -47,4 +47,58 @@ export const rideAPI = {
   cleanupContainers: () => api.post('/cleanup_containers'),
 };
 
+// Push channel for ride events: WebSocket first, Server-Sent Events if the socket cannot open.
+// Calls onEvent(event) for every event and returns a function that closes the subscription.
+export const subscribeRideEvents = ({ userId, driverId }, onEvent) => {
+  const params = new URLSearchParams();
+  if (userId) params.set('user_id', userId);
+  if (driverId) params.set('driver_id', driverId);
+  const query = params.toString();
+  let socket = null;
+  let source = null;
+  let retry = null;
+  let closed = false;
+
+  const useEventSource = () => {
+    source = new EventSource(`${API_BASE}/events/rides?${query}`);
+    ['ride_assigned', 'ride_requeued', 'ride_completed', 'driver_status', 'ride_container'].forEach((type) =>
+      source.addEventListener(type, (message) => onEvent(JSON.parse(message.data)))
+    );
+  };
+
+  const connect = () => {
+    if (typeof WebSocket === 'undefined') {
+      useEventSource();
+      return;
+    }
+    let opened = false;
+    socket = new WebSocket(`${API_BASE.replace(/^http/, 'ws')}/ws/rides?${query}`);
+    socket.onopen = () => { opened = true; };
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type !== 'heartbeat') onEvent(event);
+    };
+    socket.onclose = () => {
+      if (closed) return;
+      if (!opened) {
+        useEventSource();
+        return;
+      }
+      // Dropped or evicted for falling behind: reconnect and let the page refetch once
+      retry = setTimeout(() => {
+        connect();
+        onEvent({ type: 'reconnected' });
+      }, 3000);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    if (socket) socket.close();
+    if (source) source.close();
+  };
+};
+
 export default api;
\ No newline at end of file
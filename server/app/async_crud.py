@@ -0,0 +1,115 @@
+from datetime import datetime
+from sqlalchemy import bindparam, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, schemas
+from .crud import update_driver_stmt, update_ride_stmt
+
+# Async variants of the crud.py functions used by the async hot-path endpoints.
+# Same names and semantics, but awaitable on an AsyncSession.
+
+# Postgres batches at least this large are loaded with COPY instead of INSERT ... RETURNING
+COPY_THRESHOLD = 20_000
+DRIVER_COLUMNS = ("name", "car_no", "status", "latitude", "longitude")
+
+async def get_available_drivers(db: AsyncSession):
+    result = await db.execute(select(models.Driver).where(models.Driver.status == "available"))
+    return result.scalars().all()
+
+async def get_driver_by_id(db: AsyncSession, driver_id: int):
+    return await db.get(models.Driver, driver_id)
+
+async def insert_drivers(db: AsyncSession, drivers: list[schemas.DriverCreate]) -> list[dict]:
+    """
+    Insert drivers without committing and return them as response rows
+
+    One multi-row INSERT ... RETURNING id (COPY for large Postgres batches);
+    rows are built from the input plus the new ids, so nothing is read back.
+    """
+    rows = [driver.dict() for driver in drivers]
+    if not rows:
+        return rows
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql" and len(rows) >= COPY_THRESHOLD:
+        ids = await _copy_drivers(conn, rows)
+    else:
+        table = models.Driver.__table__
+        result = await conn.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        ids = result.scalars().all()
+    for row, driver_id in zip(rows, ids):
+        row["id"] = driver_id
+    return rows
+
+async def _copy_drivers(conn, rows: list[dict]) -> list[int]:
+    # COPY returns nothing, so reserve the ids from the sequence first and copy them in explicitly
+    result = await conn.execute(
+        text("SELECT nextval(pg_get_serial_sequence('drivers', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(rows)}
+    )
+    ids = result.scalars().all()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        models.Driver.__tablename__,
+        records=[(driver_id, *(row[column] for column in DRIVER_COLUMNS)) for driver_id, row in zip(ids, rows)],
+        columns=("id", *DRIVER_COLUMNS)
+    )
+    return ids
+
+async def create_bulk_drivers(db: AsyncSession, drivers: list[schemas.DriverCreate]) -> list[dict]:
+    rows = await insert_drivers(db, drivers)
+    await db.commit()
+    return rows
+
+async def create_ride_request(db: AsyncSession, ride: schemas.RideRequestCreate):
+    db_ride = models.RideRequest(**ride.dict())
+    db.add(db_ride)
+    await db.commit()
+    await db.refresh(db_ride)
+    return db_ride
+
+async def assign_driver_to_ride(db: AsyncSession, ride_id: int, driver_id: int):
+    """Mark the driver busy and the ride in progress in one transaction"""
+    await db.execute(update_driver_stmt(driver_id, status="busy"))
+    ride = (await db.execute(update_ride_stmt(
+        ride_id, driver_id=driver_id, status="in_progress", assigned_at=datetime.now()
+    ))).first()
+    await db.commit()
+    return ride
+
+async def assign_rides_to_drivers_bulk(db: AsyncSession, pairs: list[tuple[int, int]]):
+    """Persist many (ride_id, driver_id) assignments in a single transaction"""
+    if not pairs:
+        return
+    now = datetime.now()
+    await db.execute(
+        update(models.Driver)
+        .where(models.Driver.id.in_([driver_id for _, driver_id in pairs]))
+        .values(status="busy")
+    )
+    rides = models.RideRequest.__table__
+    await db.execute(
+        update(rides)
+        .where(rides.c.id == bindparam("ride_id"))
+        .values(driver_id=bindparam("assigned_driver_id"), status="in_progress", assigned_at=now),
+        [{"ride_id": ride_id, "assigned_driver_id": driver_id} for ride_id, driver_id in pairs]
+    )
+    await db.commit()
+
+async def release_and_assign_rides(db: AsyncSession, released_ride_ids: list[int], pairs: list[tuple[int, int]]):
+    """Send pre-empted rides back to pending and persist (ride_id, driver_id) assignments in one transaction"""
+    if released_ride_ids:
+        await db.execute(
+            update(models.RideRequest)
+            .where(models.RideRequest.id.in_(released_ride_ids))
+            .values(status="pending", driver_id=None, assigned_at=None)
+        )
+    await assign_rides_to_drivers_bulk(db, pairs)
+
+async def end_ride(db: AsyncSession, ride_id: int):
+    """Complete the ride and free its driver at the drop point, in one transaction"""
+    ride = (await db.execute(update_ride_stmt(ride_id, status="completed", completed_at=datetime.now()))).first()
+    if ride and ride.driver_id:
+        await db.execute(update_driver_stmt(
+            ride.driver_id, status="available", latitude=ride.drop_lat, longitude=ride.drop_lon
+        ))
+    await db.commit()
+    return ride
@@ -1,62 +1,347 @@
+"""
+Async ride dispatcher on Redis
+
+POST /async_rides hands a ride to AsyncRideManager, which matches and runs
+it in the background while the request returns the ride id at once:
+
+1. Available drivers live in the GEO set {prefix}drivers, the same set
+   RedisRideService uses, so with RIDE_SERVICE_BACKEND=redis both
+   dispatchers draw from one pool. The `candidates` nearest come from
+   GEOSEARCH, widening through SEARCH_RADII_KM, and are tried fastest first
+   (by road when a road graph is loaded, see pickup_etas)
+2. Claiming a driver is one Lua script: ZREM from the pool and, only if that
+   ZREM won, HSET the assignment on {prefix}async:{ride_id}, so two tasks or
+   replicas never get the same driver. Every other state change is a single
+   MULTI pipeline (HSET + EXPIRE, plus UPSERT_DRIVER_SCRIPT when the driver
+   goes back to the pool): one round trip per transition. Drivers leave and
+   rejoin the pool through RedisRideService's Lua helpers, so the surge
+   supply counts ({prefix}surge:supply) stay right
+3. Lifecycles run as tasks owned by the manager. At most max_active run at
+   once; submit() raises DispatcherBusy beyond that (503 from the endpoint).
+   A done callback drops finished tasks and logs crashes, and cancel() stops
+   a ride, marks it cancelled and returns a claimed driver to the pool
+4. stop() refuses new rides, waits up to drain_s for the running ones, then
+   cancels what is left the same way
+
+Progress after assignment (pickup, in_transit, arriving) is still simulated,
+stage_s apart; on completion the driver rejoins the pool at the drop-off.
+"""
+
 import asyncio
+import logging
+import os
+import time
 import uuid
-from typing import Dict, List
 from datetime import datetime
-import json
-import redis.asyncio as redis
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import ASYNC_RIDES
+from .redis_ride_service import REMOVE_DRIVER_SCRIPT, SEARCH_RADII_KM, UPSERT_DRIVER_SCRIPT, ZONE_LUA
+from .ride_service import ETA_CANDIDATES, pickup_etas
+
+logger = logging.getLogger(__name__)
+
+RIDE_STAGES = ("pickup", "in_transit", "arriving")
+
+# Claim ARGV[1] for ride KEYS[2] if the ride still waits (else -1) and the driver is still in the pool (else 0)
+CLAIM_SCRIPT = ZONE_LUA + """
+if redis.call('HGET', KEYS[2], 'status') ~= 'processing' then return -1 end
+if pool_remove(KEYS[1], KEYS[3], KEYS[4], ARGV[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[2], unpack(ARGV, 2))
+return 1
+"""
+
+# End a ride that did not complete; a driver it had claimed goes back where it was claimed
+ABORT_SCRIPT = ZONE_LUA + """
+local ride = redis.call('HMGET', KEYS[1], 'status', 'driver_id', 'driver_lat', 'driver_lon')
+if ride[1] ~= 'processing' and ride[1] ~= 'driver_assigned' then return 0 end
+if ride[1] == 'driver_assigned' then
+    pool_add(KEYS[2], KEYS[3], KEYS[4], ride[2], ride[4], ride[3], tonumber(ARGV[5]))
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], 'error', ARGV[2], 'updated_at', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class DispatcherBusy(Exception):
+    """submit() while max_active rides are in progress or the manager is stopping"""
+
+
+class RideNotWaiting(Exception):
+    """The ride hash is no longer processing (ended elsewhere or expired) while its driver was being claimed"""
+
 
 class AsyncRideManager:
-    def __init__(self):
-        self.redis = redis.Redis(host='localhost', port=6379, decode_responses=True)
-        self.active_rides: Dict[str, Dict] = {}
-        self.driver_pool = []
-        
-    async def process_ride_request(self, ride_data: Dict) -> str:
-        """Process ride request asynchronously"""
+    """Matches rides to drivers in a Redis GEO set and runs their lifecycles as supervised tasks"""
+
+    def __init__(self, client, prefix: str = "rides:", max_active: int = 1000, candidates: int = 8,
+                 match_timeout_s: float = 30.0, retry_s: float = 0.5, stage_s: float = 1.0,
+                 drain_s: float = 10.0, ride_ttl_s: int = 3600, zone_size_deg: float = 0.02):
+        """
+        Args:
+            client: A redis.asyncio.Redis (or fakeredis.FakeAsyncRedis) client with decode_responses=True
+            prefix: Key prefix; the default shares the driver pool with RedisRideService
+            max_active: Most ride lifecycles running at once in this process
+            candidates: Nearest drivers considered per ride
+            match_timeout_s: How long a ride waits for a driver before it ends as no_driver
+            retry_s: Pause between searches while no driver is found
+            stage_s: Simulated time between ride stages
+            drain_s: How long stop() lets running rides finish before cancelling them
+            ride_ttl_s: Expiry of a ride hash, refreshed on every transition
+            zone_size_deg: Surge zone edge of the shared supply counts (SurgeEngine's zone_size)
+        """
+        self.redis = client
+        self.prefix = prefix
+        self.drivers_key = f"{prefix}drivers"
+        self.supply_key = f"{prefix}surge:supply"
+        self.driver_zone_key = f"{prefix}surge:driver_zone"
+        self.max_active = max_active
+        self.candidates = candidates
+        self.match_timeout_s = match_timeout_s
+        self.retry_s = retry_s
+        self.stage_s = stage_s
+        self.drain_s = drain_s
+        self.ride_ttl_s = ride_ttl_s
+        self.zone_size = zone_size_deg
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._abort = client.register_script(ABORT_SCRIPT)
+        self._upsert_driver = client.register_script(UPSERT_DRIVER_SCRIPT)
+        self._remove_driver = client.register_script(REMOVE_DRIVER_SCRIPT)
+        self._tasks: Dict[str, asyncio.Task] = {}  # ride_id -> lifecycle task
+        self._starting = 0  # submit() calls past the capacity check, task not created yet
+        self._accepting = True
+        self.submitted = 0
+        self.rejected = 0
+        self.claim_conflicts = 0
+        self.round_trips = 0
+        self.outcomes = {"completed": 0, "no_driver": 0, "cancelled": 0, "failed": 0}
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "AsyncRideManager":
+        import redis.asyncio as redis
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _ride_key(self, ride_id: str) -> str:
+        return f"{self.prefix}async:{ride_id}"
+
+    # ------------------------------------------------------------------
+    # Driver pool
+    # ------------------------------------------------------------------
+
+    async def upsert_driver(self, driver_id: int, latitude: float, longitude: float):
+        """Add a driver to the pool, or move it if already there"""
+        await self._upsert_driver(keys=self._pool_keys(),
+                                  args=[driver_id, repr(float(longitude)), repr(float(latitude)), repr(self.zone_size)])
+        self.round_trips += 1
+
+    async def remove_driver(self, driver_id: int) -> bool:
+        removed = await self._remove_driver(keys=self._pool_keys(), args=[driver_id])
+        self.round_trips += 1
+        return bool(removed)
+
+    def _pool_keys(self) -> List[str]:
+        return [self.drivers_key, self.supply_key, self.driver_zone_key]
+
+    async def _nearby_drivers(self, lat: float, lon: float) -> List[Tuple[float, int, Tuple[float, float]]]:
+        """Up to `candidates` nearest (distance_km, driver_id, (lat, lon)), widening the radius as needed"""
+        for radius in SEARCH_RADII_KM:
+            found = await self.redis.geosearch(self.drivers_key, longitude=lon, latitude=lat, radius=radius,
+                                               unit="km", sort="ASC", count=self.candidates,
+                                               withdist=True, withcoord=True)
+            self.round_trips += 1
+            if len(found) >= self.candidates or radius == SEARCH_RADII_KM[-1]:
+                return [(float(distance), int(driver_id), (coord[1], coord[0])) for driver_id, distance, coord in found]
+        return []
+
+    # ------------------------------------------------------------------
+    # Rides
+    # ------------------------------------------------------------------
+
+    async def submit(self, ride_data: Dict) -> str:
+        """
+        Store a ride as processing and start its lifecycle; returns the ride id
+
+        ride_data needs pickup_lat/pickup_lon/drop_lat/drop_lon; every field is
+        stored on the ride hash, so values must be str, int or float.
+        """
+        if not self._accepting:
+            raise DispatcherBusy("Dispatcher is shutting down")
+        if len(self._tasks) + self._starting >= self.max_active:
+            self.rejected += 1
+            raise DispatcherBusy(f"{self.max_active} rides already in progress")
         ride_id = str(uuid.uuid4())
-        
-        # Store in Redis for persistence
-        await self.redis.hset(f"ride:{ride_id}", mapping={
-            **ride_data,
-            'status': 'processing',
-            'created_at': datetime.now().isoformat()
-        })
-        
-        # Create async task for ride processing
-        asyncio.create_task(self._handle_ride_lifecycle(ride_id, ride_data))
-        
+        self._starting += 1
+        try:
+            await self._transition(ride_id, {**ride_data, "status": "processing",
+                                             "created_at": datetime.now().isoformat()})
+        finally:
+            self._starting -= 1
+        task = asyncio.get_running_loop().create_task(self._lifecycle(ride_id, ride_data),
+                                                      name=f"async-ride-{ride_id}")
+        self._tasks[ride_id] = task
+        task.add_done_callback(lambda done: self._task_done(ride_id, done))
+        self.submitted += 1
         return ride_id
-    
-    async def _handle_ride_lifecycle(self, ride_id: str, ride_data: Dict):
-        """Handle complete ride lifecycle"""
+
+    async def get_ride(self, ride_id: str) -> Optional[Dict]:
+        """The ride hash (string values), or None once it expired or if it never existed"""
+        ride = await self.redis.hgetall(self._ride_key(ride_id))
+        self.round_trips += 1
+        return ride or None
+
+    async def cancel(self, ride_id: str) -> bool:
+        """Cancel a ride running in this process and wait until it is written as cancelled"""
+        task = self._tasks.get(ride_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.wait({task})
+        return True
+
+    async def _lifecycle(self, ride_id: str, ride_data: Dict):
         try:
-            # Step 1: Find nearest driver
-            driver = await self._find_nearest_driver(ride_data)
-            await self.redis.hset(f"ride:{ride_id}", "driver_id", driver['id'])
-            await self.redis.hset(f"ride:{ride_id}", "status", "driver_assigned")
-            
-            # Step 2: Simulate ride progress
-            await self._simulate_ride_progress(ride_id)
-            
-            # Step 3: Complete ride
-            await self.redis.hset(f"ride:{ride_id}", "status", "completed")
-            
+            try:
+                driver = await self._match(ride_id, ride_data)
+            except RideNotWaiting:
+                logger.warning("Async ride %s stopped waiting for a driver; leaving it as it is", ride_id)
+                return
+            if driver is None:
+                await self._finish(ride_id, "no_driver")
+                return
+            for stage in RIDE_STAGES:
+                await asyncio.sleep(self.stage_s)
+                await self._transition(ride_id, {"stage": stage})
+            drop = (float(ride_data["drop_lat"]), float(ride_data["drop_lon"]))
+            await self._finish(ride_id, "completed", driver_at=(driver, drop))
+        except asyncio.CancelledError:
+            await self._abort_ride(ride_id, "cancelled", "")
+            raise
         except Exception as e:
-            await self.redis.hset(f"ride:{ride_id}", "status", "failed")
-            await self.redis.hset(f"ride:{ride_id}", "error", str(e))
-    
-    async def _find_nearest_driver(self, ride_data: Dict) -> Dict:
-        """Find nearest available driver"""
-        # Simulate async database query
-        await asyncio.sleep(0.1)
-        return {"id": 1, "name": "John", "distance": 2.5}
-    
-    async def _simulate_ride_progress(self, ride_id: str):
-        """Simulate ride progress"""
-        stages = ['pickup', 'in_transit', 'arriving']
-        for stage in stages:
-            await asyncio.sleep(1)
-            await self.redis.hset(f"ride:{ride_id}", "stage", stage)
-
-# Global instance
-async_ride_manager = AsyncRideManager()
\ No newline at end of file
+            logger.exception("Async ride %s failed", ride_id)
+            await self._abort_ride(ride_id, "failed", str(e))
+
+    async def _match(self, ride_id: str, ride_data: Dict) -> Optional[int]:
+        """
+        Claim the fastest free driver among the nearest, searching again until match_timeout_s
+
+        Sleeps retry_s between rounds that claimed nothing; raises RideNotWaiting
+        as soon as the ride hash is no longer processing.
+        """
+        pickup = (float(ride_data["pickup_lat"]), float(ride_data["pickup_lon"]))
+        deadline = time.monotonic() + self.match_timeout_s
+        while True:
+            nearby = await self._nearby_drivers(*pickup)
+            if nearby:
+                ranked = sorted(zip(pickup_etas(pickup, nearby), nearby))
+                for (eta_minutes, distance_km), (_, driver_id, location) in ranked:
+                    if await self._claim_driver(ride_id, driver_id, location, distance_km, eta_minutes):
+                        return driver_id
+                    self.claim_conflicts += 1
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(self.retry_s)
+
+    async def _claim_driver(self, ride_id: str, driver_id: int, location: Tuple[float, float],
+                            distance_km: float, eta_minutes: float) -> bool:
+        claimed = await self._claim(keys=[self.drivers_key, self._ride_key(ride_id), self.supply_key,
+                                          self.driver_zone_key], args=[
+            driver_id, "status", "driver_assigned", "driver_id", driver_id,
+            "driver_lat", location[0], "driver_lon", location[1], "distance_km", round(distance_km, 2),
+            "eta_minutes", round(eta_minutes, 1), "updated_at", datetime.now().isoformat()
+        ])
+        self.round_trips += 1
+        if claimed == -1:
+            raise RideNotWaiting(ride_id)
+        if claimed:
+            logger.info("Assigned driver %s to async ride %s (%.2f km)", driver_id, ride_id, distance_km)
+        return bool(claimed)
+
+    async def _transition(self, ride_id: str, fields: Dict,
+                          driver_at: Optional[Tuple[int, Tuple[float, float]]] = None):
+        """One MULTI round trip: the ride's new fields and expiry, plus a driver put back in the pool"""
+        key = self._ride_key(ride_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={**fields, "updated_at": datetime.now().isoformat()})
+            pipe.expire(key, self.ride_ttl_s)
+            if driver_at is not None:
+                driver_id, (lat, lon) = driver_at
+                await self._upsert_driver(keys=self._pool_keys(),
+                                          args=[driver_id, repr(float(lon)), repr(float(lat)), repr(self.zone_size)],
+                                          client=pipe)
+            await pipe.execute()
+        self.round_trips += 1
+
+    async def _finish(self, ride_id: str, status: str,
+                      driver_at: Optional[Tuple[int, Tuple[float, float]]] = None):
+        await self._transition(ride_id, {"status": status}, driver_at=driver_at)
+        self._count(status)
+
+    async def _abort_ride(self, ride_id: str, status: str, error: str):
+        aborted = await self._abort(keys=[self._ride_key(ride_id), *self._pool_keys()],
+                                    args=[status, error, datetime.now().isoformat(), self.ride_ttl_s, self.zone_size])
+        self.round_trips += 1
+        if aborted:  # Not when the ride had already ended
+            self._count(status)
+
+    def _count(self, status: str):
+        self.outcomes[status] += 1
+        ASYNC_RIDES.labels(status).inc()
+
+    def _task_done(self, ride_id: str, task: asyncio.Task):
+        self._tasks.pop(ride_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Only reached when even writing the failure to Redis failed
+            logger.error("Async ride %s lifecycle crashed", ride_id, exc_info=task.exception())
+
+    # ------------------------------------------------------------------
+    # Start / shutdown
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Accept rides (again)"""
+        self._accepting = True
+
+    async def stop(self):
+        """Refuse new rides, let running ones finish for up to drain_s, cancel the rest, close connections"""
+        self._accepting = False
+        tasks = set(self._tasks.values())
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_s)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning("Cancelled %d async rides still running after %.0f s", len(pending), self.drain_s)
+        # Connections belong to this event loop; the next start() may run on another one
+        await self.redis.connection_pool.disconnect()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict:
+        return {
+            "accepting": self._accepting,
+            "active": len(self._tasks),
+            "max_active": self.max_active,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            **self.outcomes,
+            "claim_conflicts": self.claim_conflicts,
+            "round_trips": self.round_trips
+        }
+
+
+def create_async_ride_manager() -> AsyncRideManager:
+    """AsyncRideManager on REDIS_URL (connected on first use) with the ASYNC_RIDE_* settings"""
+    return AsyncRideManager.from_url(
+        os.getenv("REDIS_URL", "redis://localhost:6379"),
+        max_active=int(os.getenv("ASYNC_RIDE_MAX_ACTIVE", "1000")),
+        candidates=ETA_CANDIDATES,
+        match_timeout_s=float(os.getenv("ASYNC_RIDE_MATCH_TIMEOUT_S", "30")),
+        stage_s=float(os.getenv("ASYNC_RIDE_STAGE_S", "1")),
+        drain_s=float(os.getenv("ASYNC_RIDE_DRAIN_S", "10"))
+    )
+
+
+async_ride_manager = create_async_ride_manager()
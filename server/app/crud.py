@@ -1,3 +1,5 @@
+from datetime import datetime
+from sqlalchemy import bindparam, insert, select, update
 from sqlalchemy.orm import Session
 from . import models, schemas
 
@@ -8,30 +10,25 @@ def create_driver(db: Session, driver: schemas.DriverCreate):
     db.refresh(db_driver)
     return db_driver
 
-def get_drivers(db: Session):
-    return db.query(models.Driver).all()
-
 def get_available_drivers(db: Session):
     return db.query(models.Driver).filter(models.Driver.status == "available").all()
 
 def get_driver_by_id(db: Session, driver_id: int):
     return db.query(models.Driver).filter(models.Driver.id == driver_id).first()
 
-def update_driver_status(db: Session, driver_id: int, status: str):
-    driver = db.query(models.Driver).filter(models.Driver.id == driver_id).first()
-    if driver:
-        driver.status = status
-        db.commit()
-        db.refresh(driver)
-    return driver
+# Mutations are single UPDATE ... RETURNING statements on the tables (no load/refresh
+# round trips); they return a read-only row with the same attribute names as the model
+def update_driver_stmt(driver_id: int, **values):
+    drivers = models.Driver.__table__
+    return update(drivers).where(drivers.c.id == driver_id).values(**values).returning(*drivers.c)
+
+def update_ride_stmt(ride_id: int, **values):
+    rides = models.RideRequest.__table__
+    return update(rides).where(rides.c.id == ride_id).values(**values).returning(*rides.c)
 
-def update_driver_location(db: Session, driver_id: int, latitude: float, longitude: float):
-    driver = db.query(models.Driver).filter(models.Driver.id == driver_id).first()
-    if driver:
-        driver.latitude = latitude
-        driver.longitude = longitude
-        db.commit()
-        db.refresh(driver)
+def update_driver_status(db: Session, driver_id: int, status: str):
+    driver = db.execute(update_driver_stmt(driver_id, status=status)).first()
+    db.commit()
     return driver
 
 def create_ride_request(db: Session, ride: schemas.RideRequestCreate):
@@ -41,46 +38,82 @@ def create_ride_request(db: Session, ride: schemas.RideRequestCreate):
     db.refresh(db_ride)
     return db_ride
 
-def get_rides_by_user(db: Session, user_id: int):
-    return db.query(models.RideRequest).filter(models.RideRequest.user_id == user_id).all()
+def select_page(model, *criteria, columns=None, after_id: int = None, limit: int = None):
+    """Keyset page: rows with id > after_id, ordered by id, projected to `columns` (default: all)"""
+    stmt = select(*(columns or model.__table__.columns)).where(*criteria).order_by(model.id)
+    if after_id is not None:
+        stmt = stmt.where(model.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def list_rows(db: Session, stmt) -> list[dict]:
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+def stream_rows(db: Session, stmt, batch_size: int = 1000):
+    """Yield lists of row dicts from a server-side cursor, batch_size rows at a time"""
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
 
 def create_bulk_drivers(db: Session, drivers: list[schemas.DriverCreate]):
-    db_drivers = [models.Driver(**driver.dict()) for driver in drivers]
-    db.add_all(db_drivers)
+    """Multi-row INSERT ... RETURNING id; the rows are built from the input, not read back"""
+    rows = [driver.dict() for driver in drivers]
+    if not rows:
+        return rows
+    table = models.Driver.__table__
+    ids = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+    db.commit()
+    for row, driver_id in zip(rows, ids):
+        row["id"] = driver_id
+    return rows
+
+def assign_rides_to_drivers_bulk(db: Session, pairs: list[tuple[int, int]]):
+    """Persist many (ride_id, driver_id) assignments in a single transaction"""
+    if not pairs:
+        return
+    now = datetime.now()
+    db.execute(
+        update(models.Driver)
+        .where(models.Driver.id.in_([driver_id for _, driver_id in pairs]))
+        .values(status="busy")
+    )
+    rides = models.RideRequest.__table__
+    db.execute(
+        update(rides)
+        .where(rides.c.id == bindparam("ride_id"))
+        .values(driver_id=bindparam("assigned_driver_id"), status="in_progress", assigned_at=now),
+        [{"ride_id": ride_id, "assigned_driver_id": driver_id} for ride_id, driver_id in pairs]
+    )
     db.commit()
-    for driver in db_drivers:
-        db.refresh(driver)
-    return db_drivers
-
-def assign_ride_to_driver(db: Session, ride_id: int, driver_id: int):
-    from datetime import datetime
-    ride = db.query(models.RideRequest).filter(models.RideRequest.id == ride_id).first()
-    if ride:
-        ride.driver_id = driver_id
-        ride.status = "in_progress"
-        ride.assigned_at = datetime.now()
-        db.commit()
-        db.refresh(ride)
-    return ride
-
-def complete_ride(db: Session, ride_id: int):
-    from datetime import datetime
-    ride = db.query(models.RideRequest).filter(models.RideRequest.id == ride_id).first()
-    if ride:
-        ride.status = "completed"
-        ride.completed_at = datetime.now()
-        db.commit()
-        db.refresh(ride)
-    return ride
+
+def release_and_assign_rides(db: Session, released_ride_ids: list[int], pairs: list[tuple[int, int]]):
+    """Send pre-empted rides back to pending and persist (ride_id, driver_id) assignments in one transaction"""
+    if released_ride_ids:
+        db.execute(
+            update(models.RideRequest)
+            .where(models.RideRequest.id.in_(released_ride_ids))
+            .values(status="pending", driver_id=None, assigned_at=None)
+        )
+    assign_rides_to_drivers_bulk(db, pairs)
+
+def is_active_ride():
+    # Statuses are rendered as literals so the planner can match the partial active-ride indexes
+    return models.RideRequest.status.in_(
+        bindparam("active_statuses", models.ACTIVE_RIDE_STATUSES, expanding=True, literal_execute=True)
+    )
 
 def get_active_rides_by_driver(db: Session, driver_id: int):
     return db.query(models.RideRequest).filter(
         models.RideRequest.driver_id == driver_id,
-        models.RideRequest.status.in_(["pending", "in_progress"])
+        is_active_ride()
     ).all()
 
 def get_active_rides_by_user(db: Session, user_id: int):
     return db.query(models.RideRequest).filter(
         models.RideRequest.user_id == user_id,
-        models.RideRequest.status.in_(["pending", "in_progress"])
-    ).all()
\ No newline at end of file
+        is_active_ride()
+    ).all()
+
+def get_ride_by_id(db: Session, ride_id: int):
+    return db.get(models.RideRequest, ride_id)
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""
+Earliest-deadline-first tracking of the emergency pickup guarantee
+
+/request_emergency_ride promises a pickup by guaranteed_by, EMERGENCY_GUARANTEE
+after the request. RideService orders its emergency queue by that deadline
+instead of by enqueue time (EDF), and DeadlineScheduler watches every queued
+emergency ride on a hashed timer wheel, escalating as the deadline nears:
+
+1. widen (widen_before_s left): the ride no longer waits for the next
+   /assign_driver call. Every tick until it is assigned, the rides at risk
+   (the head of the EDF queue) are batch-matched over their
+   widened_candidates nearest drivers instead of a handful
+2. preempt (preempt_before_s left): when no free driver can reach the
+   pickup before the deadline, the driver headed to a normal pickup that
+   gets there soonest, and in time, is reassigned; the normal ride goes
+   back to the front of its queue (RideService.preempt_driver). An
+   emergency ride dispatched on arrival does the same when its nearest
+   free driver would be late
+3. deadline: a ride still waiting counts as a missed guarantee; it keeps
+   its place at the head of the queue until forget_after_s later
+
+Each waiting ride holds one timer, so an assignment cancels it in O(1) and
+a tick only visits the wheel slots that elapsed. Every tracked assignment
+records its slack: deadline minus pickup time at the assigned ETA, negative
+when the guarantee was missed.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import DEADLINE_ESCALATIONS, EMERGENCY_GUARANTEES, EMERGENCY_SLACK
+
+logger = logging.getLogger(__name__)
+
+EMERGENCY_GUARANTEE = timedelta(minutes=5)
+
+# Timer stages of a waiting ride, in firing order; "forget" drops a missed ride nobody served
+STAGES = ("widen", "preempt", "deadline", "forget")
+
+
+def deadline_of(ride_data: Dict) -> Optional[float]:
+    """guaranteed_by of a ride as a timestamp, or None"""
+    guaranteed_by = ride_data.get("guaranteed_by")
+    return datetime.fromisoformat(guaranteed_by).timestamp() if guaranteed_by else None
+
+
+class TimerWheel:
+    """Hashed timing wheel: O(1) schedule and cancel, advance() visits only the slots that elapsed"""
+
+    def __init__(self, tick_s: float = 1.0, slots: int = 512, now: Optional[float] = None):
+        """
+        Args:
+            tick_s: Timer resolution in seconds
+            slots: Wheel size; timers further than slots * tick_s ahead wait extra revolutions
+            now: Current time (time.time() when omitted)
+        """
+        self.tick_s = tick_s
+        self.slots: List[Dict[Hashable, Tuple[int, object]]] = [{} for _ in range(slots)]  # key -> (tick, payload)
+        self._slot_of: Dict[Hashable, int] = {}
+        self.next_tick = self._tick(time.time() if now is None else now)
+
+    def _tick(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.tick_s)
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def schedule(self, key: Hashable, due: float, payload=None):
+        """(Re)arm the timer of key; a due time already past fires on the next advance()"""
+        self.cancel(key)
+        tick = max(self._tick(due), self.next_tick)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = (tick, payload)
+        self._slot_of[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._slot_of.pop(key, None)
+        if slot is None:
+            return False
+        del self.slots[slot][key]
+        return True
+
+    def advance(self, now: float) -> List[Tuple[Hashable, object]]:
+        """Pop every timer due at or before now as (key, payload), in due order"""
+        last = self._tick(now)
+        if last < self.next_tick:
+            return []
+        fired = []
+        # A gap longer than one revolution still visits each slot only once
+        for tick in range(self.next_tick, self.next_tick + min(last - self.next_tick + 1, len(self.slots))):
+            bucket = self.slots[tick % len(self.slots)]
+            for key in [key for key, (due_tick, _) in bucket.items() if due_tick <= last]:
+                due_tick, payload = bucket.pop(key)
+                del self._slot_of[key]
+                fired.append((due_tick, key, payload))
+        self.next_tick = last + 1
+        fired.sort(key=lambda timer: timer[0])
+        return [(key, payload) for _, key, payload in fired]
+
+
+class DeadlineScheduler:
+    """Timer wheel over waiting emergency rides, with guarantee hit rate and slack accounting"""
+
+    def __init__(self, widen_before_s: float = 180.0, preempt_before_s: float = 120.0,
+                 widened_candidates: int = 32, forget_after_s: float = 600.0, tick_s: float = 1.0,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            widen_before_s: Seconds before the deadline a waiting ride is dispatched by the scheduler
+            preempt_before_s: Seconds before the deadline a driver headed to a normal pickup may be taken;
+                0 disables pre-emption
+            widened_candidates: Nearest drivers considered per ride once escalated
+            forget_after_s: Seconds after a missed deadline the scheduler stops watching the ride
+            tick_s: Timer wheel resolution and escalation interval
+            clock: Wall-clock source (a simulated clock in benchmarks)
+        """
+        self.widen_before_s = widen_before_s
+        self.preempt_before_s = preempt_before_s
+        self.widened_candidates = widened_candidates
+        self.forget_after_s = forget_after_s
+        self.clock = clock
+        self.wheel = TimerWheel(tick_s, now=clock())
+        self.waiting: Dict[Hashable, Dict] = {}  # ride id -> {"deadline", "stage", "missed"}
+        self.at_risk: "OrderedDict[Hashable, Dict]" = OrderedDict()  # Waiting rides past their widen point
+        self.hits = 0
+        self.misses = 0
+        self.escalations = {"widened": 0, "preempted": 0}
+        self.recent_slack_s: deque = deque(maxlen=10_000)  # For the stats() percentiles
+        self._lock = threading.Lock()  # Rides are queued from worker threads, ticks run on the event loop
+        self._task: Optional[asyncio.Task] = None
+
+    def _arm(self, ride_id: Hashable, ride: Dict, stage: str):
+        offset = {"widen": -self.widen_before_s, "preempt": -self.preempt_before_s,
+                  "deadline": 0.0, "forget": self.forget_after_s}[stage]
+        self.wheel.schedule(ride_id, ride["deadline"] + offset, stage)
+
+    def track(self, ride_data: Dict):
+        """Start watching a queued emergency ride (needs id and guaranteed_by)"""
+        ride_id = ride_data.get("id")
+        deadline = deadline_of(ride_data)
+        if ride_id is None or deadline is None:
+            return
+        ride = {"deadline": deadline, "stage": None, "missed": False}
+        with self._lock:
+            self.waiting[ride_id] = ride
+            self._arm(ride_id, ride, "widen")
+
+    def assigned(self, request: Dict, eta_minutes: float):
+        """Record the assignment of a watched ride: slack, hit or miss; stops its timer"""
+        ride_id = request.get("id")
+        with self._lock:
+            ride = self.waiting.pop(ride_id, None)
+            if ride is None:
+                return
+            self.wheel.cancel(ride_id)
+            self.at_risk.pop(ride_id, None)
+            slack = ride["deadline"] - (self.clock() + eta_minutes * 60)
+            self.recent_slack_s.append(slack)
+            if not ride["missed"]:
+                self._outcome(slack >= 0)
+        EMERGENCY_SLACK.observe(slack)
+
+    def _outcome(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        EMERGENCY_GUARANTEES.labels("hit" if hit else "miss").inc()
+
+    def advance(self) -> Tuple[List[Tuple[Hashable, float]], List[Tuple[Hashable, float]]]:
+        """
+        Fire the timers that came due and return the rides to escalate
+
+        Returns:
+            (at_risk, preempt): (ride id, deadline) of every waiting ride past its
+            widen point, and of those also past their preempt point, earliest
+            deadline first
+        """
+        with self._lock:
+            for ride_id, stage in self.wheel.advance(self.clock()):
+                ride = self.waiting.get(ride_id)
+                if ride is None:
+                    continue
+                if stage == "forget":
+                    del self.waiting[ride_id]
+                    self.at_risk.pop(ride_id, None)
+                    continue
+                ride["stage"] = stage
+                self.at_risk[ride_id] = ride
+                if stage == "deadline":
+                    ride["missed"] = True
+                    self._outcome(False)
+                    logger.warning("Emergency ride %s is still waiting at its guaranteed pickup time", ride_id)
+                self._arm(ride_id, ride, STAGES[STAGES.index(stage) + 1])
+            at_risk = sorted(((ride_id, ride["deadline"]) for ride_id, ride in self.at_risk.items()),
+                             key=lambda item: item[1])
+            preempt = [(ride_id, deadline) for ride_id, deadline in at_risk
+                       if self.at_risk[ride_id]["stage"] != "widen" and self.preempt_before_s > 0]
+        return at_risk, preempt
+
+    def escalated(self, action: str, rides: int = 1):
+        """Count rides dispatched by an escalation ("widened" or "preempted")"""
+        self.escalations[action] += rides
+        DEADLINE_ESCALATIONS.labels(action).inc(rides)
+
+    # ------------------------------------------------------------------
+    # Background ticking
+    # ------------------------------------------------------------------
+
+    def start(self, escalate: Callable[[], Awaitable[None]]):
+        """Await escalate() every tick_s on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._tick_loop(escalate))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tick_loop(self, escalate: Callable[[], Awaitable[None]]):
+        while True:
+            await asyncio.sleep(self.wheel.tick_s)
+            try:
+                await escalate()
+            except Exception:
+                logger.exception("Deadline escalation tick failed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            slack = sorted(self.recent_slack_s)
+            decided = self.hits + self.misses
+            return {
+                "waiting": len(self.waiting),
+                "at_risk": len(self.at_risk),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / decided, 4) if decided else None,
+                # Over the last recent_slack_s.maxlen assignments
+                "slack_p05_s": round(slack[int(len(slack) * 0.05)], 1) if slack else None,
+                "slack_p50_s": round(slack[len(slack) // 2], 1) if slack else None,
+                "escalations": dict(self.escalations),
+                "widen_before_s": self.widen_before_s,
+                "preempt_before_s": self.preempt_before_s,
+                "widened_candidates": self.widened_candidates
+            }
+
+
+def create_deadline_scheduler() -> DeadlineScheduler:
+    """DeadlineScheduler with the DEADLINE_* settings"""
+    return DeadlineScheduler(
+        widen_before_s=float(os.getenv("DEADLINE_WIDEN_BEFORE_S", "180")),
+        preempt_before_s=float(os.getenv("DEADLINE_PREEMPT_BEFORE_S", "120")),
+        widened_candidates=int(os.getenv("DEADLINE_WIDENED_CANDIDATES", "32"))
+    )
@@ -0,0 +1,143 @@
+"""
+Array-backed store of driver locations
+
+Instead of one {"id", "location": (lat, lon)} dict per driver, positions
+live in contiguous NumPy arrays (structure of arrays):
+
+- lat / lon: float64 arrays indexed by slot
+- ids: int64 array mapping slot -> driver id (-1 marks a free slot)
+- slot_of: dict mapping driver id -> slot
+- free_slots: stack of slots released by removed drivers, reused first
+
+That is 24 bytes of array storage per driver, and distance queries run as
+one vectorized haversine pass over the candidate slots.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .geo import haversine_km_array, haversine_term_array
+
+FREE_SLOT = -1
+
+
+class DriverLocationStore:
+    """Structure-of-arrays driver location store with O(1) upsert/remove"""
+
+    def __init__(self, capacity: int = 1024):
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lon = np.zeros(capacity, dtype=np.float64)
+        self.ids = np.full(capacity, FREE_SLOT, dtype=np.int64)
+        self.slot_of: Dict[int, int] = {}
+        self.free_slots: List[int] = []
+        self.high_water = 0  # Slots [0, high_water) have been handed out at least once
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def __contains__(self, driver_id: int) -> bool:
+        return driver_id in self.slot_of
+
+    def __iter__(self) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        for driver_id, slot in self.slot_of.items():
+            yield driver_id, (float(self.lat[slot]), float(self.lon[slot]))
+
+    @property
+    def capacity(self) -> int:
+        return len(self.ids)
+
+    def _grow(self):
+        new_capacity = self.capacity * 2
+        self.lat = np.resize(self.lat, new_capacity)
+        self.lon = np.resize(self.lon, new_capacity)
+        ids = np.full(new_capacity, FREE_SLOT, dtype=np.int64)
+        ids[:self.high_water] = self.ids[:self.high_water]
+        self.ids = ids
+
+    def _allocate_slot(self) -> int:
+        if self.free_slots:
+            return self.free_slots.pop()
+        if self.high_water == self.capacity:
+            self._grow()
+        slot = self.high_water
+        self.high_water += 1
+        return slot
+
+    def upsert(self, driver_id: int, lat: float, lon: float) -> int:
+        """Set a driver's position, allocating a slot if needed. Returns the slot"""
+        slot = self.slot_of.get(driver_id)
+        if slot is None:
+            slot = self._allocate_slot()
+            self.slot_of[driver_id] = slot
+            self.ids[slot] = driver_id
+        self.lat[slot] = lat
+        self.lon[slot] = lon
+        return slot
+
+    def remove(self, driver_id: int) -> Optional[int]:
+        """Release a driver's slot. Returns the freed slot, or None if unknown"""
+        slot = self.slot_of.pop(driver_id, None)
+        if slot is None:
+            return None
+        self.ids[slot] = FREE_SLOT
+        self.free_slots.append(slot)
+        return slot
+
+    def clear(self):
+        self.ids[:self.high_water] = FREE_SLOT
+        self.slot_of.clear()
+        self.free_slots.clear()
+        self.high_water = 0
+
+    def get(self, driver_id: int) -> Optional[Tuple[float, float]]:
+        """Current (lat, lon) of a driver, or None if not stored"""
+        slot = self.slot_of.get(driver_id)
+        if slot is None:
+            return None
+        return float(self.lat[slot]), float(self.lon[slot])
+
+    def active_slots(self) -> np.ndarray:
+        """Slots currently holding a driver"""
+        return np.flatnonzero(self.ids[:self.high_water] != FREE_SLOT)
+
+    def distances_km(self, lat: float, lon: float, slots: np.ndarray) -> np.ndarray:
+        """Haversine distance (km) from a point to the drivers in `slots`"""
+        return haversine_km_array(lat, lon, self.lat[slots], self.lon[slots])
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                slots: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """
+        K nearest drivers by a single vectorized scan
+
+        Args:
+            lat, lon: Query point
+            k: Number of drivers to return
+            slots: Candidate slots (defaults to the whole pool)
+
+        Returns:
+            List of (distance_km, driver_id), closest first
+        """
+        if k <= 0 or not self.slot_of:
+            return []
+        if slots is not None:
+            return self.top_k(slots, self.distances_km(lat, lon, slots), k)
+
+        # Whole pool: rank the contiguous prefix in place by the haversine term
+        # (free slots masked out), then measure only the k winners
+        used = slice(0, self.high_water)
+        terms = haversine_term_array(lat, lon, self.lat[used], self.lon[used])
+        if self.free_slots:
+            terms[self.ids[used] == FREE_SLOT] = np.inf
+        k = min(k, len(self.slot_of))
+        top = np.argpartition(terms, k - 1)[:k] if self.high_water > k else np.flatnonzero(terms != np.inf)
+        return self.top_k(top, self.distances_km(lat, lon, top), k)
+
+    def top_k(self, slots: np.ndarray, distances: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """Pick the k smallest distances and map their slots back to driver ids"""
+        if len(slots) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(slots))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [(float(distances[i]), int(self.ids[slots[i]])) for i in top]
@@ -0,0 +1,62 @@
+"""
+Great circle distance helpers shared by dispatch and pricing
+
+Scalar versions take plain floats; the *_array versions take a single origin
+and NumPy arrays of destinations and compute every distance in one pass.
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+EARTH_RADIUS_MILES = 3956
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance in km (same formula as RideService.haversine_distance)"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_term_array(lat1, lon1, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    The haversine `a` term (squared half-chord) for many points
+
+    Distance grows monotonically with it, so ranking candidates by this term
+    gives the same order as ranking by distance without the arctan2/sqrt.
+    """
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = np.radians(lat2 - lat1)
+    delta_lon = np.radians(lon2 - lon1)
+
+    return np.sin(delta_lat/2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lon/2)**2
+
+
+def haversine_km_array(lat1, lon1, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vectorized haversine_km from one origin (or matching arrays) to many points"""
+    a = haversine_term_array(lat1, lon1, lat2, lon2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_miles_array(lat1, lon1, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Vectorized PricingCalculator.haversine_distance (miles)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+
+    return c * EARTH_RADIUS_MILES
@@ -0,0 +1,180 @@
+"""
+Write-behind buffer for driver GPS pings
+
+Writing every ping straight to the drivers table costs a SELECT, an UPDATE
+and a commit per sample. Drivers ping every few seconds but only their
+latest position matters, so pings are coalesced instead:
+
+1. record() keeps the newest (lat, lon) per driver in a dict; a second ping
+   from the same driver before the next flush simply overwrites the first
+2. A background task flushes the dict every flush_ms with one
+   UPDATE drivers ... FROM (VALUES ...) statement per chunk and one commit
+3. The dict is bounded: a ping from a new driver when it is full flushes
+   inline first (backpressure on the caller instead of unbounded memory)
+4. stop() flushes whatever is left, so a clean shutdown loses nothing
+
+The in-memory dispatch pool is updated by the caller immediately; only the
+database copy lags, by at most flush_ms.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import Float, Integer, bindparam, column, update, values
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from . import models
+from .database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 3 bind parameters per row; stays well under asyncpg's 32767 parameter limit
+FLUSH_CHUNK_ROWS = 5000
+
+drivers = models.Driver.__table__
+
+
+class LocationWriteBuffer:
+    """Latest-position-per-driver buffer flushed to the database in bulk"""
+
+    def __init__(self, session_factory: async_sessionmaker, flush_ms: int = 250, max_pending: int = 50_000):
+        """
+        Args:
+            session_factory: Async session factory used for flushes
+            flush_ms: Flush interval in milliseconds
+            max_pending: Most distinct drivers held before a flush is forced
+        """
+        self.session_factory = session_factory
+        self.flush_ms = flush_ms
+        self.max_pending = max_pending
+        self.pending: Dict[int, Tuple[float, float]] = {}
+        self.known_drivers: Set[int] = set()  # Drivers confirmed to exist; skips the lookup on later pings
+        self.pings = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.forced_flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self._flush_lock = asyncio.Lock()
+        self._discarded_in_flight: Optional[Set[int]] = None  # Drivers discarded while a flush is writing
+        self._task: Optional[asyncio.Task] = None
+
+    async def record(self, driver_id: int, latitude: float, longitude: float):
+        """Buffer a driver's position; only the latest one per driver is written"""
+        if driver_id not in self.pending and len(self.pending) >= self.max_pending:
+            self.forced_flushes += 1
+            await self.flush()
+        self.pending[driver_id] = (latitude, longitude)
+        self.pings += 1
+
+    def discard(self, driver_id: int):
+        """Drop a buffered position that a direct write has superseded"""
+        self.pending.pop(driver_id, None)
+        if self._discarded_in_flight is not None:
+            self._discarded_in_flight.add(driver_id)
+
+    async def flush(self) -> int:
+        """Write all buffered positions; returns the number of rows sent"""
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+            batch, self.pending = self.pending, {}
+            self._discarded_in_flight = set()
+            rows = [(driver_id, lat, lon) for driver_id, (lat, lon) in batch.items()]
+            start = time.perf_counter()
+            try:
+                async with self.session_factory() as db:
+                    conn = await db.connection()
+                    if conn.dialect.name == "postgresql":
+                        for i in range(0, len(rows), FLUSH_CHUNK_ROWS):
+                            await conn.execute(self._update_from_values(rows[i:i + FLUSH_CHUNK_ROWS]))
+                    else:
+                        # SQLite has no column list on a VALUES alias: one executemany instead
+                        await conn.execute(self._update_by_id(), [
+                            {"b_id": driver_id, "b_lat": lat, "b_lon": lon} for driver_id, lat, lon in rows
+                        ])
+                    await db.commit()
+            except Exception:
+                # Put the batch back unless a newer ping replaced it or discard() dropped it meanwhile
+                for driver_id, position in batch.items():
+                    if driver_id not in self._discarded_in_flight:
+                        self.pending.setdefault(driver_id, position)
+                self.failed_flushes += 1
+                logger.exception("Flushing %d driver locations failed; will retry", len(rows))
+                return 0
+            finally:
+                self._discarded_in_flight = None
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.rows_written += len(rows)
+            self.flushes += 1
+            return len(rows)
+
+    @staticmethod
+    def _update_from_values(rows):
+        """UPDATE drivers SET ... FROM (VALUES (id, lat, lon), ...) AS batch WHERE drivers.id = batch.id"""
+        batch = values(
+            column("id", Integer), column("latitude", Float), column("longitude", Float), name="batch"
+        ).data(rows)
+        return (
+            update(drivers)
+            .where(drivers.c.id == batch.c.id)
+            .values(latitude=batch.c.latitude, longitude=batch.c.longitude)
+        )
+
+    @staticmethod
+    def _update_by_id():
+        return (
+            update(drivers)
+            .where(drivers.c.id == bindparam("b_id"))
+            .values(latitude=bindparam("b_lat"), longitude=bindparam("b_lon"))
+        )
+
+    # ------------------------------------------------------------------
+    # Background flushing
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """Cancel the flush task and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_ms / 1000)
+            await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "max_pending": self.max_pending,
+            "flush_ms": self.flush_ms,
+            "pings": self.pings,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "forced_flushes": self.forced_flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            # Pings per row actually written; 1.0 means no coalescing happened
+            "coalescing_ratio": round(self.pings / self.rows_written, 2) if self.rows_written else None
+        }
+
+
+location_buffer = LocationWriteBuffer(
+    AsyncSessionLocal,
+    flush_ms=int(os.getenv("LOCATION_FLUSH_MS", "250")),
+    max_pending=int(os.getenv("LOCATION_BUFFER_MAX", "50000"))
+)
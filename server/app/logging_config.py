@@ -0,0 +1,145 @@
+"""
+Non-blocking, structured logging for the API process
+
+Request handlers only put records on an in-memory queue (QueueHandler);
+a QueueListener thread formats them and does the stream I/O, so a slow
+terminal or log shipper never stalls dispatch.
+
+Configured from the environment:
+    LOG_LEVEL          Root level (default INFO)
+    LOG_LEVELS         Per-subsystem levels, e.g. "app.ride_service=DEBUG,app.container_manager=WARNING"
+    LOG_FORMAT         "text" (default) or "json" (one object per line)
+    LOG_SAMPLE_RATE    Per-request events (SAMPLED_LOGGERS) kept per second and message (default 20, 0 = all)
+
+Anything passed as `extra=` is appended as key=value pairs (text) or as
+fields of the JSON object. Per-request events use %-style arguments so
+nothing is formatted unless the record is actually emitted.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, TextIO, Tuple
+
+# Loggers that emit once per request / ride; rate-limited by SamplingFilter
+SAMPLED_LOGGERS = ("app.ride_service", "app.redis_ride_service")
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def record_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """`time level logger message key=value ...`"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, extra fields included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record)
+        }
+        # QueueHandler has already merged any traceback into the message
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep at most `rate` records per second for each message template;
+    the next record that passes reports how many were dropped (`sampled_out`).
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._windows: Dict[Tuple[str, str], list] = {}  # (logger, msg) -> [second, kept, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        second = int(time.monotonic())
+        with self._lock:
+            window = self._windows.setdefault((record.name, str(record.msg)), [second, 0, 0])
+            if window[0] != second:
+                window[0], window[1] = second, 0
+            if window[1] >= self.rate:
+                window[2] += 1
+                return False
+            window[1] += 1
+            dropped, window[2] = window[2], 0
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """"a.b=DEBUG,c=WARNING" -> {"a.b": "DEBUG", "c": "WARNING"}"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(stream: Optional[TextIO] = None):
+    """Route all logging through a queue to a background listener (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "text") == "json" else KeyValueFormatter())
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    rate = int(os.getenv("LOG_SAMPLE_RATE", "20"))
+    if rate > 0:
+        sampler = SamplingFilter(rate)
+        for name in SAMPLED_LOGGERS:
+            logging.getLogger(name).addFilter(sampler)
+
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Drain the queue and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,15 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Dict
-from datetime import datetime, timedelta
-from . import crud, models, schemas
-from .database import SessionLocal, engine, get_db
+from typing import AsyncIterator, List, Dict, Literal, Optional
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+import hashlib
+import json
+from datetime import datetime
+from enum import Enum
+from . import async_crud, crud, models, schemas
+from .async_ride_manager import DispatcherBusy, async_ride_manager
+from .database import AsyncSessionLocal, SessionLocal, async_engine, engine, get_async_db, get_db
 from .ride_service import ride_service
-from .container_manager import container_manager
+from .container_manager import IS_RIDE_CONTAINER, binding_from_env, container_manager
+from .deadline_scheduler import EMERGENCY_GUARANTEE
+from .location_buffer import location_buffer
+from .logging_config import configure_logging
+from . import metrics
 from .migrations import run_migrations
 from .pricing import PricingCalculator
+from .quote_cache import quote_cache
+from .ride_events import assignment_event, ride_events
+from .road_network import eta_engine
 
+configure_logging()  # Queue-backed, see logging_config; before anything below logs
 models.Base.metadata.create_all(bind=engine)
 run_migrations()  # Run migrations to add new columns
 
@@ -22,123 +39,476 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(metrics.LatencyMiddleware)
+
+def sample_metrics():
+    """Set the sampled /metrics gauges from the live dispatch state"""
+    status = ride_service.get_queue_status()
+    metrics.QUEUE_DEPTH.labels("emergency").set(status["emergency_count"])
+    metrics.QUEUE_DEPTH.labels("normal").set(status["normal_count"])
+    metrics.DRIVER_POOL.set(status["available_drivers"])
+    metrics.sample_pool("sync", engine.pool)
+    metrics.sample_pool("async", async_engine.pool)
+    metrics.ACTIVE_CONTAINERS.set(len(container_manager.active_containers))
+    metrics.RIDE_EVENT_SUBSCRIBERS.set(ride_events.stats()["subscribers"])
+    metrics.ASYNC_RIDE_TASKS.set(len(async_ride_manager))
+
+metrics_sampler = metrics.StateSampler(sample_metrics)
+
+async def escalate_deadlines():
+    """Deadline scheduler tick: dispatch at-risk emergency rides, then persist and announce the assignments"""
+    assignments = ride_service.escalate_deadlines()
+    if not assignments:
+        return
+    async with AsyncSessionLocal() as db:
+        await async_crud.release_and_assign_rides(
+            db, [assignment["preempted"]["id"] for assignment in assignments if "preempted" in assignment],
+            [(assignment["request"]["id"], assignment["driver"]["id"]) for assignment in assignments]
+        )
+    for assignment in assignments:
+        user_id = assignment["request"].get("user_id")
+        ride_events.publish(assignment_event(assignment, user_id), user_id=user_id,
+                            driver_id=assignment["driver"]["id"])
+        publish_requeued(assignment)
+
+def publish_requeued(assignment: dict):
+    """Tell the rider whose driver an emergency ride pre-empted that they wait at the front of the queue again"""
+    ride = assignment.get("preempted")
+    if ride is not None:
+        ride_events.publish({"type": "ride_requeued", "ride_id": ride.get("id"), "user_id": ride.get("user_id")},
+                            user_id=ride.get("user_id"))
+
+@app.on_event("startup")
+async def start_background_workers():
+    ride_service.surge.start()
+    ride_service.deadlines.start(escalate_deadlines)
+    location_buffer.start()
+    metrics_sampler.start()
+    ride_events.start()
+    async_ride_manager.start()
+    if not IS_RIDE_CONTAINER:
+        container_manager.reconcile()
+        container_manager.start_pool()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    ride_service.surge.stop()
+    await ride_service.deadlines.stop()
+    container_manager.stop_pool()
+    await location_buffer.stop()  # Write the last buffered driver locations
+    await metrics_sampler.stop()
+    await ride_events.stop()
+    await async_ride_manager.stop()  # Drain running async rides, cancel stragglers
+    await async_engine.dispose()
 
 @app.post("/request_ride", response_model=schemas.RideRequest)
-def request_ride(ride: schemas.RideRequestCreate, db: Session = Depends(get_db)):
-    return crud.create_ride_request(db=db, ride=ride)
+async def request_ride(ride: schemas.RideRequestCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_ride_request(db=db, ride=ride)
+
+def list_responses(schema) -> Dict:
+    """OpenAPI description of a list_response route: projected JSON pages or an NDJSON stream"""
+    row = schema.model_json_schema(ref_template="#/components/schemas/{model}")
+    row = {"type": "object", "title": f"{row['title']}Row", "properties": row["properties"], "required": ["id"]}
+    return {200: {
+        "description": f"{row['title'][:-3]} rows ordered by id. With ?fields= a row has only id and the "
+                       "listed fields; ?format=ndjson streams one row per line",
+        "headers": {"X-Next-Cursor": {
+            "description": "?after_id= of the next page (only when a full ?limit= page was returned)",
+            "schema": {"type": "string"}
+        }},
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": row}},
+            "application/x-ndjson": {"schema": row}
+        }
+    }}
 
-@app.get("/rides/{user_id}", response_model=List[schemas.RideRequest])
-def get_rides(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_rides_by_user(db=db, user_id=user_id)
+@app.get("/rides/{user_id}", response_model=None, responses=list_responses(schemas.RideRequest))
+def get_rides(user_id: int, limit: Optional[int] = None, after_id: Optional[int] = None,
+              fields: Optional[str] = None, format: Literal["json", "ndjson"] = "json",
+              db: Session = Depends(get_db)):
+    """A user's rides by id; see list_response for paging, projection and NDJSON"""
+    return list_response(db, models.RideRequest, schemas.RideRequest, [models.RideRequest.user_id == user_id],
+                         limit, after_id, fields, format)
 
 @app.post("/register_driver", response_model=schemas.Driver)
 def register_driver(driver: schemas.DriverCreate, db: Session = Depends(get_db)):
     return crud.create_driver(db=db, driver=driver)
 
-@app.get("/drivers/available", response_model=List[schemas.Driver])
-def get_available_drivers(db: Session = Depends(get_db)):
-    return crud.get_available_drivers(db=db)
+# Largest page returned for ?limit=; NDJSON exports are not capped
+MAX_PAGE_SIZE = 1000
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def projected_columns(model, schema, fields: Optional[str]):
+    """Columns for ?fields=a,b (default: every field of the response schema); id is always included"""
+    if not fields:
+        return [getattr(model, name) for name in schema.model_fields]
+    names = dict.fromkeys(["id"] + [name.strip() for name in fields.split(",") if name.strip()])
+    unknown = [name for name in names if name not in schema.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [getattr(model, name) for name in names]
+
+def ndjson_rows(stmt):
+    # Own session: the response body is produced after the request's dependencies are gone
+    db = SessionLocal()
+    try:
+        for batch in crud.stream_rows(db, stmt):
+            yield "".join(json.dumps(row, default=json_default) + "\n" for row in batch)
+    finally:
+        db.close()
+
+def list_response(db: Session, model, schema, criteria, limit: Optional[int], after_id: Optional[int],
+                  fields: Optional[str], format: str) -> Response:
+    """
+    Listing with keyset pagination, column projection and an NDJSON export mode
+
+    Args:
+        limit: Page size (capped at MAX_PAGE_SIZE); without it every row is returned
+        after_id: Cursor - only rows with a larger id; X-Next-Cursor carries the next one
+        fields: Comma-separated columns to return instead of the full objects
+        format: "ndjson" streams one row per line from a server-side cursor
+    """
+    columns = projected_columns(model, schema, fields)
+    if format == "ndjson":
+        stmt = crud.select_page(model, *criteria, columns=columns, after_id=after_id, limit=limit)
+        return StreamingResponse(ndjson_rows(stmt), media_type="application/x-ndjson")
+    
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = crud.list_rows(db, crud.select_page(model, *criteria, columns=columns, after_id=after_id, limit=limit))
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return Response(json.dumps(rows, default=json_default), media_type="application/json", headers=headers)
+
+@app.get("/drivers/available", response_model=None, responses=list_responses(schemas.Driver))
+def get_available_drivers(limit: Optional[int] = None, after_id: Optional[int] = None,
+                          fields: Optional[str] = None, format: Literal["json", "ndjson"] = "json",
+                          db: Session = Depends(get_db)):
+    return list_response(db, models.Driver, schemas.Driver, [models.Driver.status == "available"],
+                         limit, after_id, fields, format)
 
-@app.get("/drivers", response_model=List[schemas.Driver])
-def get_all_drivers(db: Session = Depends(get_db)):
-    return crud.get_drivers(db=db)
+@app.get("/drivers", response_model=None, responses=list_responses(schemas.Driver))
+def get_all_drivers(limit: Optional[int] = None, after_id: Optional[int] = None,
+                    fields: Optional[str] = None, format: Literal["json", "ndjson"] = "json",
+                    db: Session = Depends(get_db)):
+    return list_response(db, models.Driver, schemas.Driver, [], limit, after_id, fields, format)
 
 @app.post("/register_drivers_bulk", response_model=List[schemas.Driver])
-def register_drivers_bulk(bulk_data: schemas.BulkDriverCreate, db: Session = Depends(get_db)):
-    return crud.create_bulk_drivers(db=db, drivers=bulk_data.drivers)
+async def register_drivers_bulk(bulk_data: schemas.BulkDriverCreate, db: AsyncSession = Depends(get_async_db)):
+    return await async_crud.create_bulk_drivers(db=db, drivers=bulk_data.drivers)
 
-@app.post("/assign_driver")
-def assign_driver(db: Session = Depends(get_db)):
-    # If no drivers in the queue system, try to load from database
-    if not ride_service.available_drivers:
-        available_drivers_db = crud.get_available_drivers(db)
+async def ndjson_driver_batches(chunks: AsyncIterator[bytes],
+                                batch_size: int) -> AsyncIterator[List[schemas.DriverCreate]]:
+    """Parse a streamed NDJSON body into batches of DriverCreate; 422 names the first bad line"""
+    batch, buffer, line_no = [], b"", 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                batch.append(parse_driver_line(line, line_no))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if buffer.strip():
+        batch.append(parse_driver_line(buffer, line_no + 1))
+    if batch:
+        yield batch
+
+def parse_driver_line(line: bytes, line_no: int) -> schemas.DriverCreate:
+    try:
+        return schemas.DriverCreate(**json.loads(line))
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Line {line_no}: {e}")
+
+@app.post("/register_drivers_ndjson")
+async def register_drivers_ndjson(request: Request, batch_size: int = 5000,
+                                  db: AsyncSession = Depends(get_async_db)):
+    """
+    Import drivers from an NDJSON body (one DriverCreate object per line)
+
+    The body is parsed while it streams in and inserted batch by batch, so
+    million-row imports never sit in memory. The import is one transaction:
+    a bad line rejects the whole upload. Returns the new ids as ranges.
+    """
+    inserted, batches, id_ranges = 0, 0, []
+    async for batch in ndjson_driver_batches(request.stream(), max(1, batch_size)):
+        for row in await async_crud.insert_drivers(db, batch):
+            if id_ranges and id_ranges[-1][1] + 1 == row["id"]:
+                id_ranges[-1][1] = row["id"]
+            else:
+                id_ranges.append([row["id"], row["id"]])
+        inserted += len(batch)
+        batches += 1
+    await db.commit()
+    return {"inserted": inserted, "batches": batches, "id_ranges": id_ranges}
+
+async def load_available_drivers(db: AsyncSession):
+    """If no drivers in the queue system, try to load from database"""
+    if not ride_service.has_available_drivers():
+        available_drivers_db = await async_crud.get_available_drivers(db)
         for driver in available_drivers_db:
             # Use driver location if available, otherwise use default location
             lat = driver.latitude if driver.latitude else 40.7128
             lon = driver.longitude if driver.longitude else -74.0060
-            driver_data = {
-                "id": driver.id,
-                "location": (lat, lon)
-            }
-            ride_service.available_drivers.append(driver_data)
+            ride_service.upsert_driver(driver.id, lat, lon)
+
+@app.post("/assign_driver")
+async def assign_driver(db: AsyncSession = Depends(get_async_db)):
+    await load_available_drivers(db)
     
-    assignment = ride_service.assign_driver()
+    with metrics.DISPATCH_SEARCH.labels("single").time():
+        assignment = ride_service.assign_driver()
     if assignment is None:
         raise HTTPException(status_code=404, detail="No rides or drivers available")
     
-    # Update driver status in database
-    driver_id = assignment["driver"]["id"]
-    crud.update_driver_status(db, driver_id, "busy")
-    
-    # Track ride assignment in database
-    ride_id = assignment["request"]["id"]
-    crud.assign_ride_to_driver(db, ride_id, driver_id)
+    # Mark the driver busy and track the ride assignment in one transaction
+    if "preempted" in assignment:
+        await async_crud.release_and_assign_rides(db, [assignment["preempted"]["id"]],
+                                                  [(assignment["request"]["id"], assignment["driver"]["id"])])
+        ride = None
+    else:
+        ride = await async_crud.assign_driver_to_ride(db, assignment["request"]["id"], assignment["driver"]["id"])
+    user_id = ride.user_id if ride else assignment["request"].get("user_id")
+    ride_events.publish(assignment_event(assignment, user_id), user_id=user_id, driver_id=assignment["driver"]["id"])
+    publish_requeued(assignment)
     
     return assignment
 
+@app.post("/assign_drivers_batch")
+async def assign_drivers_batch(max_rides: int = 50, candidates_per_ride: int = 8,
+                               db: AsyncSession = Depends(get_async_db)):
+    """
+    Match up to max_rides queued rides to drivers in one pass.
+    Emergency rides are matched first; each phase minimizes the total pickup
+    ETA (road time when a road graph is loaded, haversine distance at the
+    fallback speed otherwise) instead of greedily taking the nearest driver
+    ride by ride.
+    All assignments are persisted in a single transaction.
+    """
+    await load_available_drivers(db)
+    
+    with metrics.DISPATCH_SEARCH.labels("batch").time():
+        assignments = ride_service.assign_drivers_batch(max_rides=max_rides, candidates_per_ride=candidates_per_ride)
+    if not assignments:
+        raise HTTPException(status_code=404, detail="No rides or drivers available")
+    
+    await async_crud.assign_rides_to_drivers_bulk(
+        db, [(assignment["request"]["id"], assignment["driver"]["id"]) for assignment in assignments]
+    )
+    for assignment in assignments:
+        user_id = assignment["request"].get("user_id")
+        ride_events.publish(assignment_event(assignment, user_id), user_id=user_id,
+                            driver_id=assignment["driver"]["id"])
+    
+    return {
+        "assigned": len(assignments),
+        "total_distance_km": round(sum(assignment["distance_km"] for assignment in assignments), 2),
+        "assignments": assignments,
+        "queue_status": ride_service.get_queue_status()
+    }
+
 @app.post("/add_to_queue")
-def add_to_queue(ride: schemas.RideRequestCreate, db: Session = Depends(get_db)):
-    """Add ride to queue (supports priority)"""
-    priority_val = ride.priority if ride.priority else schemas.RidePriority.NORMAL
-    priority_str = priority_val.value if hasattr(priority_val, 'value') else str(priority_val)
+def add_to_queue(ride: schemas.RideRequestCreate, ride_id: int, db: Session = Depends(get_db)):
+    """
+    Queue a ride created by /request_ride (supports priority)
     
-    # Get the most recent ride for this user from database
-    db_ride = db.query(models.RideRequest).filter(
-        models.RideRequest.user_id == ride.user_id
-    ).order_by(models.RideRequest.created_at.desc()).first()
+    ?ride_id= is the id returned by /request_ride. The ride must belong to the
+    body's user_id and still be pending. It is queued with its stored
+    coordinates and priority.
+    """
+    db_ride = crud.get_ride_by_id(db, ride_id)
+    if db_ride is None or db_ride.user_id != ride.user_id:
+        raise HTTPException(status_code=404, detail=f"Ride {ride_id} not found for user {ride.user_id}")
+    if db_ride.status != "pending":
+        raise HTTPException(status_code=409, detail=f"Ride {ride_id} is {db_ride.status}, not pending")
     
-    ride_id = db_ride.id if db_ride else len(ride_service.ride_queue) + 1
+    priority_val = db_ride.priority if db_ride.priority else schemas.RidePriority.NORMAL
+    priority_str = priority_val.value if hasattr(priority_val, 'value') else str(priority_val)
     
     ride_data = {
-        "id": ride_id,
-        "user_id": ride.user_id,
-        "pickup": (ride.pickup_lat, ride.pickup_lon),
-        "destination": (ride.drop_lat, ride.drop_lon),
+        "id": db_ride.id,
+        "user_id": db_ride.user_id,
+        "pickup": (db_ride.pickup_lat, db_ride.pickup_lon),
+        "destination": (db_ride.drop_lat, db_ride.drop_lon),
         "priority": priority_str
     }
-    ride_service.add_ride_to_queue(ride_data, priority_str)
+    if db_ride.guaranteed_by is not None:
+        ride_data["guaranteed_by"] = db_ride.guaranteed_by.isoformat()
+    queue_entry = ride_service.add_ride_to_queue(ride_data, priority_str)
     queue_status = ride_service.get_queue_status()
     
     return {
         "message": f"Ride added to {priority_str} queue",
         "queue_status": queue_status,
-        "ride_id": ride_id
+        "ride_id": db_ride.id,
+        "queue_entry": queue_entry
     }
 
 @app.post("/add_driver_location")
-def add_driver_location(driver_id: int, latitude: float, longitude: float, db: Session = Depends(get_db)):
-    """Update driver's location in the database and add to available pool"""
-    driver = crud.update_driver_location(db, driver_id, latitude, longitude)
-    if not driver:
-        raise HTTPException(status_code=404, detail="Driver not found")
+async def add_driver_location(driver_id: int, latitude: float, longitude: float,
+                              db: AsyncSession = Depends(get_async_db)):
+    """Update driver's location in the available pool; the database write is batched"""
+    # Only a driver's first ping needs a lookup to reject unknown ids
+    if driver_id not in location_buffer.known_drivers:
+        if not await async_crud.get_driver_by_id(db, driver_id):
+            raise HTTPException(status_code=404, detail="Driver not found")
+        location_buffer.known_drivers.add(driver_id)
     
-    # Add driver to in-memory available pool for ride assignment
-    driver_data = {
-        "id": driver_id,
-        "location": (latitude, longitude)
-    }
-    # Remove old entry if exists
-    ride_service.available_drivers = [d for d in ride_service.available_drivers if d["id"] != driver_id]
-    # Add updated entry
-    ride_service.available_drivers.append(driver_data)
+    # Add (or move) driver in the in-memory available pool for ride assignment
+    ride_service.upsert_driver(driver_id, latitude, longitude)
+    await location_buffer.record(driver_id, latitude, longitude)
     
     return {
         "message": "Driver location updated successfully",
-        "driver_id": driver.id,
-        "latitude": driver.latitude,
-        "longitude": driver.longitude
+        "driver_id": driver_id,
+        "latitude": latitude,
+        "longitude": longitude
     }
 
+@app.post("/async_rides")
+async def submit_async_ride(ride: schemas.RideRequestCreate):
+    """
+    Hand a ride to the Redis-backed async dispatcher; returns its id at once.
+    The ride is matched to a driver from the Redis GEO pool in the background:
+    follow it with GET /async_rides/{ride_id}.
+    """
+    try:
+        ride_id = await async_ride_manager.submit({
+            "user_id": ride.user_id,
+            "pickup_location": ride.pickup_location,
+            "drop_location": ride.drop_location,
+            "pickup_lat": ride.pickup_lat,
+            "pickup_lon": ride.pickup_lon,
+            "drop_lat": ride.drop_lat,
+            "drop_lon": ride.drop_lon,
+            "priority": ride.priority.value
+        })
+    except DispatcherBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
+    return {"ride_id": ride_id, "status": "processing"}
+
+@app.get("/async_rides/{ride_id}")
+async def get_async_ride(ride_id: str):
+    """Status, stage and assigned driver of an async ride (kept for an hour after its last change)"""
+    try:
+        ride = await async_ride_manager.get_ride(ride_id)
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
+    if ride is None:
+        raise HTTPException(status_code=404, detail="Async ride not found")
+    return ride
+
+@app.post("/async_rides/{ride_id}/cancel")
+async def cancel_async_ride(ride_id: str):
+    """Cancel an async ride running on this replica; its driver goes back to the pool"""
+    if not await async_ride_manager.cancel(ride_id):
+        raise HTTPException(status_code=404, detail="No running async ride with this id on this server")
+    return await get_async_ride(ride_id)
+
+@app.post("/async_drivers")
+async def add_async_driver(driver_id: int, latitude: float, longitude: float):
+    """
+    Add (or move) a driver in the async dispatcher's Redis pool.
+    With RIDE_SERVICE_BACKEND=redis this is the same pool /add_driver_location fills.
+    """
+    try:
+        await async_ride_manager.upsert_driver(driver_id, latitude, longitude)
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
+    return {"driver_id": driver_id, "latitude": latitude, "longitude": longitude}
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics (aggregated over all workers when PROMETHEUS_MULTIPROC_DIR is set)"""
+    return Response(metrics_sampler.render(), media_type=CONTENT_TYPE_LATEST)
+
+@app.websocket("/ws/rides")
+async def ride_events_socket(websocket: WebSocket, user_id: Optional[int] = None, driver_id: Optional[int] = None):
+    """
+    Push ride events for a rider (?user_id=) and/or driver (?driver_id=)
+    
+    Sends one JSON object per event (ride_assigned, ride_requeued,
+    ride_completed, driver_status, ride_container) and {"type": "heartbeat"}
+    when idle.
+    Closed with 1013 when the client falls too far behind; reconnect and
+    refetch /active_rides once.
+    """
+    if user_id is None and driver_id is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await ride_events.serve_websocket(websocket, user_id, driver_id)
+
+@app.get("/events/rides")
+def ride_events_stream(user_id: Optional[int] = None, driver_id: Optional[int] = None):
+    """Server-Sent Events fallback for /ws/rides (same events, `event:` set to their type)"""
+    if user_id is None and driver_id is None:
+        raise HTTPException(status_code=400, detail="Pass user_id and/or driver_id")
+    return StreamingResponse(
+        ride_events.sse_stream(user_id, driver_id), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/ride_events")
+def get_ride_event_stats():
+    """Connected subscribers and published / delivered / evicted event counts"""
+    return ride_events.stats()
+
+@app.get("/deadline_scheduler")
+def get_deadline_scheduler_stats():
+    """Emergency pickup guarantee: hit rate, slack percentiles, rides at risk and escalations"""
+    return ride_service.deadlines.stats()
+
+@app.get("/eta_engine")
+def get_eta_engine_stats():
+    """Road graph size used for ETAs, or available: false when falling back to straight lines"""
+    return eta_engine.stats()
+
+@app.get("/quote_cache")
+def get_quote_cache_stats():
+    """/calculate_price quote cache size, hit rate and evictions"""
+    return quote_cache.stats()
+
+@app.get("/async_ride_manager")
+def get_async_ride_manager_stats():
+    """Async dispatcher: running rides, outcomes, rejections and Redis round trips"""
+    return async_ride_manager.stats()
+
+@app.get("/location_buffer")
+def get_location_buffer_stats():
+    """Write-behind location buffer counters, including the coalescing ratio"""
+    return location_buffer.stats()
+
+def conditional_json(request: Request, payload) -> Response:
+    """JSON response with a content ETag; 304 when the client already has it"""
+    body = json.dumps(payload).encode()
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 @app.get("/queue_status")
-def get_queue_status():
+def get_queue_status(request: Request):
     """Get detailed queue status including emergency and normal counts"""
-    return ride_service.get_queue_status()
+    return conditional_json(request, ride_service.get_queue_status())
 
 @app.get("/emergency_queue_status")
-def get_emergency_queue_status():
+def get_emergency_queue_status(request: Request):
     """Get status of emergency vs normal queues"""
-    return ride_service.get_queue_status()
+    return conditional_json(request, ride_service.get_queue_status())
 
 @app.post("/calculate_price")
 def calculate_ride_price(request: Dict, db: Session = Depends(get_db)):
@@ -179,27 +549,12 @@ def calculate_ride_price(request: Dict, db: Session = Depends(get_db)):
                 detail="Missing required coordinates: pickup_lat, pickup_lon, drop_lat, drop_lon"
             )
         
-        # Get queue status for surge pricing calculation
-        queue_status = ride_service.get_queue_status()
-        queue_length = queue_status.get("total_rides", 0)
-        available_drivers_count = queue_status.get("available_drivers", 0)
-        
-        # Calculate surge multiplier or disable it
-        if apply_surge:
-            surge_multiplier = None  # Let calculator determine it
-        else:
-            surge_multiplier = 1.0  # No surge pricing
-        
-        # Calculate fare
-        fare_breakdown = PricingCalculator.calculate_fare(
-            pickup_lat=float(pickup_lat),
-            pickup_lon=float(pickup_lon),
-            drop_lat=float(drop_lat),
-            drop_lon=float(drop_lon),
+        # Calculate fare (cached per snapped pickup/drop cell and surge epoch), with the
+        # precomputed surge of the pickup zone unless surge is disabled
+        fare_breakdown = quote_cache.quote(
+            float(pickup_lat), float(pickup_lon), float(drop_lat), float(drop_lon),
             is_emergency=is_emergency,
-            surge_multiplier=surge_multiplier,
-            queue_length=queue_length,
-            available_drivers=available_drivers_count
+            surge=ride_service.surge if apply_surge else None
         )
         
         return {
@@ -216,41 +571,112 @@ def calculate_ride_price(request: Dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error calculating price: {str(e)}")
 
 
-@app.get("/queue_details")
-def get_queue_details():
-    """Get detailed list of rides in queue"""
-    emergency_rides = []
-    normal_rides = []
-    
-    # Get emergency rides
-    for timestamp, ride in sorted(ride_service.emergency_queue):
-        emergency_rides.append({
-            "id": ride.get("id"),
-            "user_id": ride.get("user_id"),
-            "pickup": ride.get("pickup"),
-            "destination": ride.get("destination"),
-            "priority": "EMERGENCY",
-            "queued_at": timestamp.isoformat()
-        })
-    
-    # Get normal rides
-    for ride in ride_service.normal_queue:
-        normal_rides.append({
-            "id": ride.get("id"),
-            "user_id": ride.get("user_id"),
-            "pickup": ride.get("pickup"),
-            "destination": ride.get("destination"),
-            "priority": "NORMAL",
-            "queued_at": None  # Normal queue doesn't store timestamp
-        })
+@app.post("/calculate_prices")
+def calculate_ride_prices(request: Dict):
+    """
+    Calculate upfront price estimates for many trips in one call
     
-    return {
-        "emergency_rides": emergency_rides,
-        "normal_rides": normal_rides,
-        "total_emergency": len(emergency_rides),
-        "total_normal": len(normal_rides),
-        "total_rides": len(emergency_rides) + len(normal_rides)
+    Request body:
+    {
+        "trips": [
+            {
+                "pickup_lat": float,
+                "pickup_lon": float,
+                "drop_lat": float,
+                "drop_lon": float,
+                "is_emergency": bool (optional, default: false)
+            },
+            ...
+        ],
+        "apply_surge": bool (optional, default: true)
     }
+    
+    Each trip is priced with the precomputed surge of its pickup zone. Each
+    breakdown in the returned "pricing" array has the same fields as /calculate_price.
+    """
+    trips = request.get("trips")
+    apply_surge = request.get("apply_surge", True)
+    
+    if not isinstance(trips, list) or not trips:
+        raise HTTPException(status_code=400, detail="Request must include a non-empty 'trips' array")
+    
+    try:
+        columns = {key: [] for key in ("pickup_lat", "pickup_lon", "drop_lat", "drop_lon")}
+        is_emergency = []
+        for index, trip in enumerate(trips):
+            for key, values in columns.items():
+                if not isinstance(trip, dict) or trip.get(key) is None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Trip {index}: missing required coordinates: pickup_lat, pickup_lon, drop_lat, drop_lon"
+                    )
+                values.append(float(trip[key]))
+            is_emergency.append(trip.get("is_emergency", False))
+        
+        if apply_surge:
+            surge_multiplier = [
+                ride_service.surge.multiplier_for(lat, lon)
+                for lat, lon in zip(columns["pickup_lat"], columns["pickup_lon"])
+            ]
+        else:
+            surge_multiplier = 1.0
+        
+        fare_breakdowns = PricingCalculator.calculate_fares(
+            columns["pickup_lat"], columns["pickup_lon"],
+            columns["drop_lat"], columns["drop_lon"],
+            is_emergency=is_emergency,
+            surge_multiplier=surge_multiplier
+        )
+        
+        return {
+            "success": True,
+            "count": len(fare_breakdowns),
+            "pricing": fare_breakdowns,
+            "currency": "USD",
+            "message": "Prices calculated successfully",
+            "surge_applied": apply_surge
+        }
+    
+    except HTTPException:
+        raise
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid coordinate values: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating prices: {str(e)}")
+
+
+@app.get("/surge_map")
+def get_surge_map():
+    """
+    Current per-zone surge map for ops dashboards
+    
+    Lists every zone with queued rides, available drivers or an active surge,
+    with its demand/supply counters and the multiplier quotes are priced at.
+    Zones not listed are priced at base_multiplier (time-of-day surge only).
+    """
+    return ride_service.surge.surge_map()
+
+
+@app.get("/queue_details")
+def get_queue_details(request: Request, since: Optional[int] = None):
+    """
+    Get detailed list of rides in queue
+    
+    The response carries the queue version as its ETag; If-None-Match with
+    the current version returns 304. With ?since=<version> only the changes
+    after that version are returned, or the full snapshot if they are no
+    longer available.
+    """
+    version, body = ride_service.queue_snapshot()
+    etag = f'"{version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    if since is not None:
+        changes = ride_service.queue_changes(since)
+        if changes is not None:
+            return Response(json.dumps(changes), media_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.post("/request_emergency_ride", response_model=dict)
 def request_emergency_ride(ride: schemas.RideRequestCreate, db: Session = Depends(get_db)):
@@ -267,7 +693,7 @@ def request_emergency_ride(ride: schemas.RideRequestCreate, db: Session = Depend
     
     # Create ride in database with emergency fields
     now = datetime.now()
-    guaranteed_time = now + timedelta(minutes=5)
+    guaranteed_time = now + EMERGENCY_GUARANTEE
     
     db_ride = models.RideRequest(
         user_id=ride.user_id,
@@ -289,16 +715,30 @@ def request_emergency_ride(ride: schemas.RideRequestCreate, db: Session = Depend
     # Add to emergency queue
     ride_data = {
         "id": db_ride.id,
+        "user_id": ride.user_id,
         "pickup": (ride.pickup_lat, ride.pickup_lon),
         "destination": (ride.drop_lat, ride.drop_lon),
-        "priority": "emergency"
+        "priority": "emergency",
+        "guaranteed_by": guaranteed_time.isoformat()  # EDF key; the deadline scheduler escalates as it nears
     }
     ride_service.add_ride_to_queue(ride_data, "emergency")
     
     # Try to assign driver immediately if available
     assignment = None
-    if ride_service.available_drivers:
-        assignment = ride_service.assign_driver()
+    if ride_service.has_available_drivers():
+        with metrics.DISPATCH_SEARCH.labels("single").time():
+            assignment = ride_service.assign_driver()
+    if assignment is not None:
+        if "preempted" in assignment:
+            # The driver was headed to a normal pickup: that ride must not stay assigned to it
+            crud.release_and_assign_rides(db, [assignment["preempted"]["id"]],
+                                          [(assignment["request"]["id"], assignment["driver"]["id"])])
+        else:
+            crud.assign_rides_to_drivers_bulk(db, [(assignment["request"]["id"], assignment["driver"]["id"])])
+        user_id = assignment["request"].get("user_id")
+        ride_events.publish(assignment_event(assignment, user_id), user_id=user_id,
+                            driver_id=assignment["driver"]["id"])
+        publish_requeued(assignment)
     
     queue_status = ride_service.get_queue_status()
     
@@ -326,7 +766,7 @@ def request_emergency_ride_with_container(ride: schemas.RideRequestCreate, db: S
     
     # Create ride in database with emergency fields
     now = datetime.now()
-    guaranteed_time = now + timedelta(minutes=5)
+    guaranteed_time = now + EMERGENCY_GUARANTEE
     
     db_ride = models.RideRequest(
         user_id=ride.user_id,
@@ -360,8 +800,15 @@ def request_emergency_ride_with_container(ride: schemas.RideRequestCreate, db: S
     }
     
     try:
-        # Spawn emergency container with priority resources
-        container_info = container_manager.spawn_ride_container(db_ride.id, ride_data, priority="emergency")
+        # Bind to a warm emergency container (or spawn one) with priority resources
+        container_info = container_manager.acquire_ride_container(db_ride.id, ride_data, priority="emergency")
+        ride_events.publish({
+            "type": "ride_container",
+            "ride_id": db_ride.id,
+            "priority": "EMERGENCY",
+            "container_url": container_info['url'],
+            "guaranteed_by_iso": guaranteed_time.isoformat()
+        }, user_id=db_ride.user_id)
         
         return {
             'success': True,
@@ -374,6 +821,7 @@ def request_emergency_ride_with_container(ride: schemas.RideRequestCreate, db: S
             'container_port': container_info['host_port'],
             'container_url': container_info['url'],
             'container_id': container_info['container_id'][:12],
+            'warm_container': container_info['warm'],
             'container_resources': '1.0 CPUs, 512MB RAM',
             'message': f"🚨 Emergency ride container spawned! Guaranteed pickup by {guaranteed_time.strftime('%I:%M %p')}"
         }
@@ -394,6 +842,8 @@ def complete_ride(driver_id: int, db: Session = Depends(get_db)):
     driver = crud.update_driver_status(db, driver_id, "available")
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
+    ride_events.publish({"type": "driver_status", "driver_id": driver.id, "status": driver.status},
+                        driver_id=driver.id)
     
     return {
         "message": f"Driver {driver_id} is now available",
@@ -405,17 +855,23 @@ def complete_ride(driver_id: int, db: Session = Depends(get_db)):
     }
 
 @app.post("/end_ride/{ride_id}")
-def end_ride(ride_id: int, db: Session = Depends(get_db)):
+async def end_ride(ride_id: int, db: AsyncSession = Depends(get_async_db)):
     """End a ride and mark it as completed"""
-    ride = crud.complete_ride(db, ride_id)
+    # Completes the ride and makes the driver available at the drop location, in one transaction
+    ride = await async_crud.end_ride(db, ride_id)
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
     
-    # Make driver available again and update location to drop location if assigned
     if ride.driver_id:
-        crud.update_driver_status(db, ride.driver_id, "available")
-        # Update driver's location to the drop location (end of ride)
-        crud.update_driver_location(db, ride.driver_id, ride.drop_lat, ride.drop_lon)
+        # An older buffered ping must not move the driver away from the drop location on the next flush
+        location_buffer.discard(ride.driver_id)
+        ride_service.ride_ended(ride.driver_id)
+    ride_events.publish({
+        "type": "ride_completed",
+        "ride_id": ride.id,
+        "user_id": ride.user_id,
+        "driver_id": ride.driver_id
+    }, user_id=ride.user_id, driver_id=ride.driver_id)
     
     return {
         "message": f"Ride {ride_id} completed successfully",
@@ -470,6 +926,26 @@ def root():
     return {"message": "Uber API is running"}
 
 
+# Ride handed to this process when it runs as a ride container: cold containers
+# get it from the environment, warm pool containers through POST /ride_binding
+ride_binding: Dict = binding_from_env()
+
+@app.post("/ride_binding")
+def bind_ride(binding: schemas.RideBinding):
+    """Handoff API: bind an idle warm ride container to a ride"""
+    if ride_binding and ride_binding['ride_id'] != binding.ride_id:
+        raise HTTPException(status_code=409, detail=f"Container already bound to ride {ride_binding['ride_id']}")
+    ride_binding.update(binding.dict(), bound_at=datetime.now().isoformat())
+    return ride_binding
+
+@app.get("/ride_binding")
+def get_ride_binding():
+    """Ride this container serves"""
+    if not ride_binding:
+        raise HTTPException(status_code=404, detail="Container is not bound to a ride")
+    return ride_binding
+
+
 # ============================================================================
 # Container Management Endpoints - Dynamic Ride Container Spawning
 # ============================================================================
@@ -501,8 +977,8 @@ def request_ride_with_container(ride: schemas.RideRequestCreate, db: Session = D
     priority = ride.priority.value if hasattr(ride, 'priority') and ride.priority else "normal"
     
     try:
-        # Spawn a new container for this ride with appropriate priority
-        container_info = container_manager.spawn_ride_container(db_ride.id, ride_data, priority=priority)
+        # Bind the ride to a warm container of its tier, spawning one if the pool is empty
+        container_info = container_manager.acquire_ride_container(db_ride.id, ride_data, priority=priority)
         
         # Return the ride info with container details
         return {
@@ -510,7 +986,8 @@ def request_ride_with_container(ride: schemas.RideRequestCreate, db: Session = D
             'priority': priority.upper(),
             'container_port': container_info['host_port'],
             'container_url': container_info['url'],
-            'container_id': container_info['container_id'][:12]
+            'container_id': container_info['container_id'][:12],
+            'warm_container': container_info['warm']
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to spawn container: {str(e)}")
@@ -539,6 +1016,12 @@ def get_active_ride_containers() -> Dict:
     }
 
 
+@app.get("/ride_container_pool")
+def get_ride_container_pool() -> Dict:
+    """Warm container pool sizes, hits/misses and acquisition latency per tier, plus port usage"""
+    return {**container_manager.pool_stats(), 'ports': container_manager.ports.stats()}
+
+
 @app.get("/ride_container/{ride_id}")
 def get_ride_container_info(ride_id: int):
     """Get container information for a specific ride"""
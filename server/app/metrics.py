@@ -0,0 +1,172 @@
+"""
+Prometheus metrics for the API process
+
+GET /metrics renders the metrics below in the Prometheus text format:
+
+1. Per-route request latency (LatencyMiddleware, labelled by route template,
+   method and status class, so the series count stays fixed)
+2. Dispatch search time, PricingCalculator calls, quote cache hits and
+   misses, road ETA lookups and haversine fallbacks, emergency guarantee
+   hits/misses, pickup slack and deadline escalations, async dispatcher ride
+   outcomes, ride container spawn/stop durations, recorded where the work
+   happens
+3. Queue depth, driver pool size, SQLAlchemy pool usage, active ride
+   containers, ride event subscribers and running async ride tasks,
+   sampled every few seconds by StateSampler and on every scrape
+
+Recording a sample is a lock plus an add, so this stays on in production.
+
+Several workers (uvicorn --workers / gunicorn): point PROMETHEUS_MULTIPROC_DIR
+at an empty directory shared by the workers and clear it before the server
+starts. Every worker then writes its samples to files there and whichever
+worker answers /metrics aggregates all of them: counters and histograms are
+summed, the sampled gauges are summed over live workers (livesum), except
+queue depth and driver pool with the Redis backend, where every worker sees
+the same shared state (livemax).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from prometheus_client import (
+    REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+SHARED_STATE_MODE = "livemax" if os.getenv("RIDE_SERVICE_BACKEND", "memory").lower() == "redis" else "livesum"
+
+# Sub-millisecond buckets for in-memory work, up to seconds for requests and containers
+FAST_BUCKETS = (.00001, .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .1)
+REQUEST_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SLACK_BUCKETS = (-300, -120, -60, -30, 0, 30, 60, 120, 180, 240, 300)
+CONTAINER_BUCKETS = (.01, .05, .1, .25, .5, 1, 2, 3, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS
+)
+DISPATCH_SEARCH = Histogram(
+    "dispatch_search_seconds", "Time to match queued rides to drivers in memory",
+    ["mode"], buckets=FAST_BUCKETS
+)
+PRICING_CALLS = Counter("pricing_calls_total", "PricingCalculator fare calls", ["method"])
+PRICING_FARES = Counter("pricing_fares_total", "Fares computed by PricingCalculator (batch calls count every ride)")
+QUOTE_CACHE_LOOKUPS = Counter("quote_cache_lookups_total", "/calculate_price quote cache lookups", ["result"])
+ETA_QUERIES = Counter("eta_queries_total", "Road-network ETA lookups, by whether the road graph answered",
+                      ["kind", "result"])
+EMERGENCY_GUARANTEES = Counter("emergency_guarantees_total",
+                               "Emergency rides by whether the pickup guarantee was met", ["result"])
+EMERGENCY_SLACK = Histogram("emergency_pickup_slack_seconds",
+                            "guaranteed_by minus pickup time at the assigned ETA (negative: missed)",
+                            buckets=SLACK_BUCKETS)
+DEADLINE_ESCALATIONS = Counter("deadline_escalations_total", "Emergency rides dispatched by the deadline scheduler",
+                               ["action"])
+ASYNC_RIDES = Counter("async_rides_total", "Rides finished by the async dispatcher, by final status", ["status"])
+CONTAINER_SPAWN = Histogram(
+    "ride_container_acquire_seconds", "Time to hand a ride a container",
+    ["priority", "source"], buckets=CONTAINER_BUCKETS
+)
+CONTAINER_STOP = Histogram("ride_container_stop_seconds", "docker stop + rm duration", buckets=CONTAINER_BUCKETS)
+
+QUEUE_DEPTH = Gauge("ride_queue_depth", "Rides waiting for a driver", ["priority"],
+                    multiprocess_mode=SHARED_STATE_MODE)
+DRIVER_POOL = Gauge("available_drivers", "Drivers in the dispatch pool", multiprocess_mode=SHARED_STATE_MODE)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections checked out of the SQLAlchemy pool", ["engine"],
+                            multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections opened beyond pool_size", ["engine"],
+                         multiprocess_mode="livesum")
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured pool_size", ["engine"], multiprocess_mode="livesum")
+ACTIVE_CONTAINERS = Gauge("ride_containers_active", "Ride containers bound to a ride", multiprocess_mode="livesum")
+RIDE_EVENT_SUBSCRIBERS = Gauge("ride_event_subscribers", "Connected /ws/rides and /events/rides clients",
+                               multiprocess_mode="livesum")
+ASYNC_RIDE_TASKS = Gauge("async_ride_tasks", "Ride lifecycles running in the async dispatcher",
+                         multiprocess_mode="livesum")
+
+
+class LatencyMiddleware:
+    """ASGI middleware observing REQUEST_LATENCY for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI stores the matched route in the scope; its path is the template (/driver/{driver_id})
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), f"{status // 100}xx"
+            ).observe(time.perf_counter() - start)
+
+
+def sample_pool(name: str, pool):
+    # Only QueuePool-style pools report checkouts and overflow
+    if hasattr(pool, "checkedout"):
+        DB_POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        DB_POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+        DB_POOL_SIZE.labels(name).set(pool.size())
+
+
+class StateSampler:
+    """Refreshes the sampled gauges on an interval on the running event loop"""
+
+    def __init__(self, sample: Callable[[], None], interval_s: float = 5.0):
+        """
+        Args:
+            sample: Sets the gauges; called on every tick and every scrape
+            interval_s: Seconds between samples
+        """
+        self.sample = sample
+        self.interval_s = interval_s
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sample_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if MULTIPROCESS:
+            # Drop this worker's live gauges from the aggregate
+            multiprocess.mark_process_dead(os.getpid())
+
+    async def _sample_loop(self):
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Sampling metrics gauges failed")
+
+    def render(self) -> bytes:
+        """Current metrics in the Prometheus text format (all workers in multiprocess mode)"""
+        self.sample()
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return generate_latest(registry)
+        return generate_latest(REGISTRY)
@@ -1,11 +1,34 @@
-from sqlalchemy import text
 from .database import engine
+from .models import ACTIVE_RIDE_STATUSES
+
+ACTIVE = ", ".join(f"'{status}'" for status in ACTIVE_RIDE_STATUSES)
+
+# Versioned index migrations: each runs once, in order, and is recorded in
+# schema_migrations. On Postgres they are built CONCURRENTLY so a live
+# ride_requests table keeps taking writes while the index is built.
+# (version, index name, CREATE INDEX statement)
+INDEX_MIGRATIONS = [
+    (1, "ix_drivers_status_id",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_drivers_status_id ON drivers (status, id)"),
+    (2, "ix_ride_requests_user_id_id",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_ride_requests_user_id_id ON ride_requests (user_id, id)"),
+    (3, "ix_ride_requests_active_driver",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_ride_requests_active_driver "
+     f"ON ride_requests (driver_id, status) WHERE status IN ({ACTIVE})"),
+    (4, "ix_ride_requests_active_user",
+     "CREATE INDEX {concurrently} IF NOT EXISTS ix_ride_requests_active_user "
+     f"ON ride_requests (user_id, status) WHERE status IN ({ACTIVE})"),
+]
+
+# Serializes migrations when several API replicas start at once (Postgres only)
+MIGRATION_LOCK_ID = 7_412_001
 
 def run_migrations():
     """Run database migrations to add new columns"""
-    # Use raw connection with autocommit to avoid transaction issues
-    raw_conn = engine.raw_connection()
-    raw_conn.autocommit = True
+    # Autocommit so a failing ALTER doesn't abort the rest and CREATE INDEX CONCURRENTLY
+    # can run (setting .autocommit on engine.raw_connection() only touches the pool proxy)
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    raw_conn = conn.connection
     cursor = raw_conn.cursor()
     
     migrations = [
@@ -29,6 +52,40 @@ def run_migrations():
             # Column likely already exists, which is fine
             print(f"⚠️  {column_name} might already exist: {e}")
     
+    run_index_migrations(cursor)
+    
     cursor.close()
-    raw_conn.close()
+    conn.close()
     print("✨ Migration completed successfully")
+
+def run_index_migrations(cursor):
+    """Apply pending INDEX_MIGRATIONS and record each version"""
+    postgres = engine.dialect.name == "postgresql"
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    if postgres:
+        cursor.execute(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+    try:
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        for version, name, sql in INDEX_MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                cursor.execute(sql.format(concurrently="CONCURRENTLY" if postgres else ""))
+            except Exception as e:
+                # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would skip next time
+                print(f"❌ Migration {version} ({name}) failed: {e}")
+                if postgres:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                break
+            placeholder = "%s" if postgres else "?"
+            cursor.execute(
+                f"INSERT INTO schema_migrations (version, name) VALUES ({placeholder}, {placeholder})", (version, name)
+            )
+            print(f"✅ Migration {version}: {name}")
+    finally:
+        if postgres:
+            cursor.execute(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
@@ -3,6 +3,9 @@ from sqlalchemy.sql import func
 from .database import Base
 import enum
 
+# Rides still in flight; the partial indexes in migrations.py cover exactly these
+ACTIVE_RIDE_STATUSES = ("pending", "in_progress")
+
 class RidePriority(enum.Enum):
     NORMAL = "NORMAL"
     EMERGENCY = "EMERGENCY"
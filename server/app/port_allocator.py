@@ -0,0 +1,128 @@
+"""
+Port allocator for ride containers
+
+Hands out host ports from a fixed range and reclaims them when containers
+stop, so the port footprint is bounded by the number of live containers:
+
+1. Released ports go to the back of a FIFO free-list and are reused
+   before the range's high-water mark advances (least recently freed first,
+   giving the old mapping time to disappear)
+2. Ports docker reports as taken by something else ("port is already
+   allocated") are blocked for a cool-down and retried. There is no bind
+   check up front: the server usually runs in a container that talks to the
+   host's docker daemon, so its own network namespace says nothing about
+   the host's ports
+3. Ports of containers that already exist at startup are reserved
+
+All operations are O(1) except reserve(), which is only used while
+reconciling at startup.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Set
+
+
+class PortRangeExhausted(Exception):
+    """Every port in the range is in use or blocked"""
+
+
+class PortAllocator:
+    """Bounded host port range with a free-list and a cool-down for ports taken elsewhere"""
+
+    def __init__(self, start: int = 7000, end: int = 7999, block_seconds: float = 60.0):
+        """
+        Args:
+            start: First port of the range
+            end: Last port of the range (inclusive)
+            block_seconds: How long a port found in use elsewhere is skipped
+        """
+        if end < start:
+            raise ValueError(f"Invalid port range {start}-{end}")
+        self.start = start
+        self.end = end
+        self.block_seconds = block_seconds
+        self.next_unused = start  # Ports >= this have never been handed out
+        self.free: deque = deque()  # Released ports, reused FIFO
+        self.blocked: deque = deque()  # (retry_at, port) of ports taken by something else
+        self.in_use: Set[int] = set()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.in_use)
+
+    @property
+    def capacity(self) -> int:
+        return self.end - self.start + 1
+
+    def allocate(self) -> int:
+        """Next free port; raises PortRangeExhausted when none is left"""
+        with self.lock:
+            self._unblock_expired()
+            port = self._take()
+            if port is not None:
+                self.in_use.add(port)
+                return port
+        raise PortRangeExhausted(
+            f"No free port in {self.start}-{self.end} "
+            f"({len(self.in_use)} in use, {len(self.blocked)} blocked)"
+        )
+
+    def release(self, port: int):
+        """Return a port of a stopped container to the free-list"""
+        with self.lock:
+            if port in self.in_use:
+                self.in_use.remove(port)
+                self.free.append(port)
+
+    def block(self, port: int):
+        """A port turned out to be taken outside this allocator: skip it for a while"""
+        with self.lock:
+            if port in self.in_use:
+                self.in_use.remove(port)
+                self._block(port)
+
+    def reserve(self, port: int) -> bool:
+        """Mark a port used by an existing container; False if it is outside the range"""
+        if not self.start <= port <= self.end:
+            return False
+        with self.lock:
+            if port in self.in_use:
+                return True
+            if port >= self.next_unused:
+                self.free.extend(range(self.next_unused, port))
+                self.next_unused = port + 1
+            elif port in self.free:
+                self.free.remove(port)
+            else:
+                self.blocked = deque(entry for entry in self.blocked if entry[1] != port)
+            self.in_use.add(port)
+            return True
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "range": [self.start, self.end],
+                "in_use": len(self.in_use),
+                "free_list": len(self.free),
+                "blocked": len(self.blocked),
+                "never_used": self.end - self.next_unused + 1
+            }
+
+    def _take(self) -> Optional[int]:
+        if self.free:
+            return self.free.popleft()
+        if self.next_unused <= self.end:
+            port = self.next_unused
+            self.next_unused += 1
+            return port
+        return None
+
+    def _block(self, port: int):
+        self.blocked.append((time.monotonic() + self.block_seconds, port))
+
+    def _unblock_expired(self):
+        now = time.monotonic()
+        while self.blocked and self.blocked[0][0] <= now:
+            self.free.append(self.blocked.popleft()[1])
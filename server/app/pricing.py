@@ -12,6 +12,9 @@ ride fares using the following components:
 6. Emergency Surcharge - Additional 50% for emergency rides
 7. Minimum Fare - Ensures profitability on short trips
 
+Distance and time are by road when a road graph is loaded (road_network),
+otherwise great circle distance at an average city speed.
+
 Formula: 
 Total = max(
     (Base Fare + Distance Cost + Time Cost + Booking Fee) * Surge Multiplier * Emergency Multiplier,
@@ -21,7 +24,13 @@ Total = max(
 
 from math import radians, cos, sin, asin, sqrt
 from datetime import datetime, time as dt_time
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .geo import haversine_miles_array
+from .metrics import PRICING_CALLS, PRICING_FARES
+from .road_network import KM_PER_MILE, eta_engine
 
 
 class PricingCalculator:
@@ -37,6 +46,9 @@ class PricingCalculator:
     # Emergency ride surcharge (already defined as 1.5x in models.py)
     EMERGENCY_MULTIPLIER = 1.5
     
+    # Batches smaller than this are priced with the scalar calculate_fare
+    VECTORIZE_MIN_BATCH = 16
+    
     # Peak hour definitions (for surge pricing simulation)
     PEAK_MORNING = (dt_time(7, 0), dt_time(9, 30))  # 7 AM - 9:30 AM
     PEAK_EVENING = (dt_time(17, 0), dt_time(19, 30))  # 5 PM - 7:30 PM
@@ -69,6 +81,16 @@ class PricingCalculator:
         
         return c * r
     
+    @staticmethod
+    def haversine_distances(lat1, lon1, lat2, lon2) -> np.ndarray:
+        """
+        Vectorized haversine_distance over NumPy arrays of coordinates
+        
+        Returns:
+            Array of distances in miles
+        """
+        return haversine_miles_array(lat1, lon1, lat2, lon2)
+    
     @staticmethod
     def estimate_trip_time(distance_miles: float) -> float:
         """
@@ -89,6 +111,21 @@ class PricingCalculator:
         
         return time_minutes
     
+    @staticmethod
+    def estimate_trip_times(distances_miles: np.ndarray) -> np.ndarray:
+        """
+        Vectorized estimate_trip_time (same operations, same order)
+        
+        Args:
+            distances_miles: Array of trip distances in miles
+            
+        Returns:
+            Array of estimated times in minutes
+        """
+        avg_speed_mph = 25
+        time_hours = distances_miles / avg_speed_mph
+        return time_hours * 60 * 1.2  # 20% buffer
+    
     @staticmethod
     def calculate_surge_multiplier(current_time: datetime = None, 
                                    queue_length: int = 0,
@@ -170,11 +207,20 @@ class PricingCalculator:
         Returns:
             Dictionary with fare breakdown
         """
-        # Calculate distance
-        distance_miles = cls.haversine_distance(pickup_lat, pickup_lon, drop_lat, drop_lon)
+        PRICING_CALLS.labels("calculate_fare").inc()
+        PRICING_FARES.inc()
         
-        # Estimate trip time
-        estimated_time_minutes = cls.estimate_trip_time(distance_miles)
+        # Road distance and drive time when a road graph is loaded
+        route = eta_engine.route(pickup_lat, pickup_lon, drop_lat, drop_lon)
+        if route is not None:
+            distance_miles = route.distance_km / KM_PER_MILE
+            estimated_time_minutes = route.minutes
+        else:
+            # Calculate distance
+            distance_miles = cls.haversine_distance(pickup_lat, pickup_lon, drop_lat, drop_lon)
+            
+            # Estimate trip time
+            estimated_time_minutes = cls.estimate_trip_time(distance_miles)
         
         # Calculate base components
         base_fare = cls.BASE_FARE
@@ -222,6 +268,141 @@ class PricingCalculator:
         }
         
         return breakdown
+    
+    @classmethod
+    def calculate_fares(cls,
+                        pickup_lats: Sequence[float],
+                        pickup_lons: Sequence[float],
+                        drop_lats: Sequence[float],
+                        drop_lons: Sequence[float],
+                        is_emergency: Optional[Sequence[bool]] = None,
+                        surge_multiplier: Union[float, Sequence[float]] = None,
+                        queue_length: int = 0,
+                        available_drivers: int = 0) -> List[Dict]:
+        """
+        Calculate fares for many trips at once
+        
+        Distance, time and cost components are computed with NumPy over all
+        trips in one pass, and surge is evaluated once for the whole batch.
+        The arithmetic mirrors calculate_fare operation for operation, so
+        every breakdown matches calculate_fare for the same trip after rounding.
+        
+        Args:
+            pickup_lats, pickup_lons: Pickup coordinates, one per trip
+            drop_lats, drop_lons: Drop coordinates, one per trip
+            is_emergency: Emergency flag per trip (defaults to all False)
+            surge_multiplier: Surge for the whole batch, or one per trip (e.g. zone
+                surge from SurgeEngine). If None, calculates automatically
+            queue_length: Current rides in queue
+            available_drivers: Number of available drivers
+            
+        Returns:
+            List of fare breakdowns, in trip order
+        """
+        PRICING_CALLS.labels("calculate_fares").inc()
+        PRICING_FARES.inc(len(pickup_lats))
+        
+        if is_emergency is None:
+            is_emergency = [False] * len(pickup_lats)
+        
+        # Unless given, surge is evaluated once for the whole batch
+        if surge_multiplier is None:
+            surge_multiplier = cls.calculate_surge_multiplier(
+                queue_length=queue_length,
+                available_drivers=available_drivers
+            )
+        
+        if np.isscalar(surge_multiplier):
+            surge_multipliers = [surge_multiplier] * len(pickup_lats)
+        else:
+            surge_multipliers = [float(surge) for surge in surge_multiplier]
+        
+        # NumPy's fixed per-call overhead outweighs the vector win on tiny batches
+        if len(pickup_lats) < cls.VECTORIZE_MIN_BATCH:
+            return [
+                cls.calculate_fare(*trip, is_emergency=emergency, surge_multiplier=surge)
+                for *trip, emergency, surge in zip(pickup_lats, pickup_lons, drop_lats, drop_lons,
+                                                   is_emergency, surge_multipliers)
+            ]
+        
+        pickup_lats = np.asarray(pickup_lats, dtype=np.float64)
+        pickup_lons = np.asarray(pickup_lons, dtype=np.float64)
+        drop_lats = np.asarray(drop_lats, dtype=np.float64)
+        drop_lons = np.asarray(drop_lons, dtype=np.float64)
+        
+        # Distance, time and cost components for every trip
+        distances_miles = cls.haversine_distances(pickup_lats, pickup_lons, drop_lats, drop_lons)
+        estimated_times = cls.estimate_trip_times(distances_miles)
+        if eta_engine.available:
+            # Road distance and time wherever the road graph has an answer, as in calculate_fare
+            for i, trip in enumerate(zip(pickup_lats.tolist(), pickup_lons.tolist(),
+                                         drop_lats.tolist(), drop_lons.tolist())):
+                route = eta_engine.route(*trip)
+                if route is not None:
+                    distances_miles[i] = route.distance_km / KM_PER_MILE
+                    estimated_times[i] = route.minutes
+        distance_costs = distances_miles * cls.COST_PER_MILE
+        time_costs = estimated_times * cls.COST_PER_MINUTE
+        subtotals = cls.BASE_FARE + distance_costs + time_costs + cls.BOOKING_FEE
+        
+        fares_after_surge = subtotals * np.asarray(surge_multipliers, dtype=np.float64)
+        
+        emergency_multipliers = np.where(
+            np.asarray(is_emergency, dtype=bool), cls.EMERGENCY_MULTIPLIER, 1.0
+        )
+        total_fares = np.maximum(fares_after_surge * emergency_multipliers, cls.MINIMUM_FARE)
+        
+        emergency_surcharges = fares_after_surge * (emergency_multipliers - 1)
+        
+        base_fare = round(cls.BASE_FARE, 2)
+        booking_fee = round(cls.BOOKING_FEE, 2)
+        surge_rounded = {surge: round(surge, 2) for surge in set(surge_multipliers)}
+        breakdowns = []
+        for (distance_miles, estimated_time_minutes, distance_cost, time_cost, subtotal,
+             fare_after_surge, emergency_multiplier, emergency_surcharge, total_fare,
+             minimum_fare_applied, emergency, surge) in zip(
+                _round_like_python(distances_miles, 2), _round_like_python(estimated_times, 1),
+                _round_like_python(distance_costs, 2), _round_like_python(time_costs, 2),
+                _round_like_python(subtotals, 2), _round_like_python(fares_after_surge, 2),
+                emergency_multipliers.tolist(), _round_like_python(emergency_surcharges, 2),
+                _round_like_python(total_fares, 2), (total_fares == cls.MINIMUM_FARE).tolist(),
+                is_emergency, surge_multipliers):
+            breakdowns.append({
+                "distance_miles": distance_miles,
+                "estimated_time_minutes": estimated_time_minutes,
+                "base_fare": base_fare,
+                "distance_cost": distance_cost,
+                "time_cost": time_cost,
+                "booking_fee": booking_fee,
+                "subtotal": subtotal,
+                "surge_multiplier": surge_rounded[surge],
+                "surge_active": surge > 1.0,
+                "fare_after_surge": fare_after_surge,
+                "is_emergency": emergency,
+                "emergency_multiplier": emergency_multiplier,
+                "emergency_surcharge": emergency_surcharge if emergency else 0,
+                "total_fare": total_fare,
+                "minimum_fare_applied": minimum_fare_applied
+            })
+        
+        return breakdowns
+
+
+def _round_like_python(values: np.ndarray, ndigits: int) -> List[float]:
+    """
+    Round an array exactly like the builtin round(value, ndigits)
+    
+    np.round scales, rounds half-to-even and scales back, which agrees with
+    Python's correctly rounded result except when the scaled value lands
+    within floating point error of a .5 tie. Those few elements are redone
+    with the builtin so the output is identical to calculate_fare.
+    """
+    scaled = values * 10.0 ** ndigits
+    rounded = (np.rint(scaled) / 10.0 ** ndigits).tolist()
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie).tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
 
 
 # Convenience function for quick calculations
@@ -0,0 +1,135 @@
+"""
+Ordered, versioned view of the ride queues
+
+/queue_details used to sort the emergency heap and rebuild a dict per queued
+ride on every poll. RideService now keeps this view up to date as rides are
+pushed and popped instead:
+
+1. One JSON-ready row per queued ride, built once when the ride is queued,
+   kept per priority in queue order (dicts keyed by queue entry)
+2. A version that increases with every change; the full snapshot and its
+   serialized JSON are cached per version, so polling an unchanged queue
+   costs a dictionary lookup
+3. A bounded log of recent changes, so a client that already has version V
+   can fetch only what changed since V
+
+Versions start at the current time in microseconds, so they keep increasing
+across restarts and an ETag or `since` from a previous process never
+matches by accident.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Optional, Tuple
+
+PRIORITIES = ("EMERGENCY", "NORMAL")
+
+
+def queue_row(entry: int, ride_data: Dict, priority: str, queued_at: datetime) -> Dict:
+    return {
+        "entry": entry,
+        "id": ride_data.get("id"),
+        "user_id": ride_data.get("user_id"),
+        "pickup": ride_data.get("pickup"),
+        "destination": ride_data.get("destination"),
+        "priority": priority,
+        "queued_at": queued_at.isoformat(),
+        "guaranteed_by": ride_data.get("guaranteed_by")
+    }
+
+
+def snapshot_of(version: int, emergency_rides, normal_rides) -> Dict:
+    return {
+        "version": version,
+        "emergency_rides": emergency_rides,
+        "normal_rides": normal_rides,
+        "total_emergency": len(emergency_rides),
+        "total_normal": len(normal_rides),
+        "total_rides": len(emergency_rides) + len(normal_rides)
+    }
+
+
+class QueueView:
+    """Queue rows in pickup order with a version and a change log"""
+
+    def __init__(self, max_changes: int = 10_000):
+        """
+        Args:
+            max_changes: Changes kept for `since` queries; older clients get a full snapshot
+        """
+        self.version = time.time_ns() // 1000
+        self.rows: Dict[str, Dict[int, Dict]] = {priority: {} for priority in PRIORITIES}
+        self.changes: deque = deque(maxlen=max_changes)  # (version, change)
+        self._needs_sort = set()  # Priorities where a ride was queued in front of existing ones
+        self._cache: Optional[Dict] = None
+        self._cache_json: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def added(self, entry: int, ride_data: Dict, priority: str, queued_at: datetime):
+        row = queue_row(entry, ride_data, priority, queued_at)
+        with self._lock:
+            rows = self.rows[priority]
+            sort_key = self._sort_key(priority)
+            if rows and sort_key((entry, row)) < sort_key(next(reversed(rows.items()))):
+                self._needs_sort.add(priority)
+            rows[entry] = row
+            self._changed({"op": "add", "ride": row})
+
+    def removed(self, entry: int, priority: str):
+        with self._lock:
+            row = self.rows[priority].pop(entry, None)
+            if row is not None:
+                self._changed({"op": "remove", "entry": entry, "id": row["id"], "priority": priority})
+
+    def _changed(self, change: Dict):
+        self.version += 1
+        self.changes.append((self.version, change))
+        self._cache = self._cache_json = None
+
+    def snapshot(self) -> Dict:
+        """Full view at the current version (cached until the next change)"""
+        with self._lock:
+            if self._cache is None:
+                for priority in self._needs_sort:
+                    self.rows[priority] = dict(sorted(self.rows[priority].items(), key=self._sort_key(priority)))
+                self._needs_sort.clear()
+                self._cache = snapshot_of(
+                    self.version, list(self.rows["EMERGENCY"].values()), list(self.rows["NORMAL"].values())
+                )
+            return self._cache
+
+    @staticmethod
+    def _sort_key(priority: str):
+        # Emergency rides are served earliest deadline first, normal rides in FIFO (entry) order
+        if priority == "EMERGENCY":
+            return lambda item: (item[1]["guaranteed_by"] or item[1]["queued_at"], item[0])
+        return lambda item: item[0]
+
+    def snapshot_json(self) -> Tuple[int, bytes]:
+        """(version, serialized snapshot); the JSON is cached alongside the snapshot"""
+        snapshot = self.snapshot()
+        with self._lock:
+            if self._cache is snapshot:
+                if self._cache_json is None:
+                    self._cache_json = json.dumps(snapshot).encode()
+                return snapshot["version"], self._cache_json
+        # Changed while serializing; hand out this version uncached
+        return snapshot["version"], json.dumps(snapshot).encode()
+
+    def changes_since(self, version: int) -> Optional[Dict]:
+        """Changes after `version` in order, or None if they are no longer all in the log"""
+        with self._lock:
+            if version > self.version:
+                return None
+            if version == self.version:
+                return {"version": version, "since": version, "changes": []}
+            if not self.changes or self.changes[0][0] > version + 1:
+                return None
+            # Logged versions are consecutive, so the first wanted change sits at a known offset
+            start = version + 1 - self.changes[0][0]
+            changes = [change for _, change in islice(self.changes, start, None)]
+            return {"version": self.version, "since": version, "changes": changes}
@@ -0,0 +1,187 @@
+"""
+Bounded LRU cache of fare quotes for /calculate_price
+
+Riders re-quote the same trip again and again while dragging the pickup
+pin, and every quote used to rebuild the whole breakdown. Quotes are now
+cached under
+
+    (pickup cell, drop cell, is_emergency, surge epoch)
+
+where a cell is the coordinate snapped to a grid of grid_deg degrees
+(~55 m at 0.0005). A miss prices the trip between the cell centres with
+the surge of the pickup cell's zone, so a quote depends only on its key
+and every pin position inside a cell gets the same price. The surge epoch
+changes whenever SurgeEngine publishes new multipliers; entries of older
+epochs can no longer be hit and are dropped when the next quote sees the
+new epoch.
+
+Entries expire after ttl_s, and the least recently used ones are evicted
+once the cache holds max_mb of quotes (entry size measured on the first
+insert). max_mb=0 disables caching and prices the exact coordinates.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from .metrics import QUOTE_CACHE_LOOKUPS
+from .pricing import PricingCalculator
+from .surge import SurgeEngine
+
+NO_SURGE = -1  # Epoch of quotes priced without surge; they survive surge changes
+
+# OrderedDict link + hash table slot per entry, on top of the key and value objects
+ENTRY_OVERHEAD_BYTES = 100
+
+_HITS = QUOTE_CACHE_LOOKUPS.labels("hit")
+_MISSES = QUOTE_CACHE_LOOKUPS.labels("miss")
+
+
+class QuoteCache:
+    """Thread-safe LRU + TTL cache of PricingCalculator.calculate_fare breakdowns"""
+
+    def __init__(self, grid_deg: float = 0.0005, ttl_s: float = 60.0, max_mb: float = 16.0):
+        """
+        Args:
+            grid_deg: Cell size coordinates are snapped to (a divisor of the surge zone size
+                keeps every cell inside one zone)
+            ttl_s: Seconds a quote is served from the cache
+            max_mb: Approximate memory cap; 0 disables the cache
+        """
+        self.grid_deg = grid_deg
+        self.ttl_s = ttl_s
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entry_bytes: Optional[int] = None  # Measured on the first insert
+        self.max_entries = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict]]" = OrderedDict()  # key -> (expires_at, breakdown)
+        self._epoch = NO_SURGE
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cell(self, degrees: float) -> int:
+        return math.floor(degrees / self.grid_deg)
+
+    def _centre(self, cell: int) -> float:
+        return (cell + 0.5) * self.grid_deg
+
+    def quote(self, pickup_lat: float, pickup_lon: float, drop_lat: float, drop_lon: float,
+              is_emergency: bool = False, surge: Optional[SurgeEngine] = None) -> Dict:
+        """
+        Fare breakdown for a trip, from the cache when possible (a copy the caller may modify)
+
+        Args:
+            surge: Engine whose zone multiplier applies, or None to price without surge
+        """
+        is_emergency = bool(is_emergency)
+        if not self.enabled:
+            surge_multiplier = surge.multiplier_for(pickup_lat, pickup_lon) if surge is not None else 1.0
+            return PricingCalculator.calculate_fare(pickup_lat, pickup_lon, drop_lat, drop_lon,
+                                                    is_emergency=is_emergency, surge_multiplier=surge_multiplier)
+
+        # Epoch before multiplier: a tick in between can only file a fresh price under the old epoch
+        epoch = surge.epoch if surge is not None else NO_SURGE
+        cells = (self._cell(pickup_lat), self._cell(pickup_lon), self._cell(drop_lat), self._cell(drop_lon))
+        key = (cells, is_emergency, epoch)
+        breakdown = self._get(key, epoch)
+        if breakdown is not None:
+            return breakdown
+
+        pickup = (self._centre(cells[0]), self._centre(cells[1]))
+        drop = (self._centre(cells[2]), self._centre(cells[3]))
+        surge_multiplier = surge.multiplier_for(*pickup) if surge is not None else 1.0
+        breakdown = PricingCalculator.calculate_fare(*pickup, *drop, is_emergency=is_emergency,
+                                                     surge_multiplier=surge_multiplier)
+        self._put(key, breakdown)
+        return dict(breakdown)
+
+    def _get(self, key: Hashable, epoch: int) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            if epoch != NO_SURGE and epoch > self._epoch:
+                self._invalidate_before(epoch)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    _HITS.inc()
+                    return dict(entry[1])  # Callers may add request fields; the entry is shared
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+        _MISSES.inc()
+        return None
+
+    def _invalidate_before(self, epoch: int):
+        # Caller holds the lock
+        stale = [key for key in self._entries if key[2] != NO_SURGE and key[2] < epoch]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        self._epoch = epoch
+
+    def _put(self, key: Hashable, breakdown: Dict):
+        with self._lock:
+            if self.entry_bytes is None:
+                self.entry_bytes = _entry_size(key, breakdown)
+                self.max_entries = max(1, self.max_bytes // self.entry_bytes)
+            self._entries[key] = (time.monotonic() + self.ttl_s, breakdown)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "approx_bytes": len(self._entries) * (self.entry_bytes or 0),
+                "max_bytes": self.max_bytes,
+                "grid_deg": self.grid_deg,
+                "ttl_s": self.ttl_s,
+                "surge_epoch": self._epoch,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+
+def _entry_size(key: Tuple, breakdown: Dict) -> int:
+    """Bytes held by one cache entry (shared small ints, bools and interned field names excluded)"""
+    size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof((0.0, breakdown))
+    size += sum(sys.getsizeof(cell) for cell in key[0])
+    size += sys.getsizeof(breakdown) + sum(sys.getsizeof(value) for value in breakdown.values()
+                                           if isinstance(value, float))
+    return size
+
+
+quote_cache = QuoteCache(
+    grid_deg=float(os.getenv("QUOTE_CACHE_GRID_DEG", "0.0005")),
+    ttl_s=float(os.getenv("QUOTE_CACHE_TTL_S", "60")),
+    max_mb=float(os.getenv("QUOTE_CACHE_MAX_MB", "16"))
+)
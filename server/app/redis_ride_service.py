@@ -0,0 +1,662 @@
+"""
+Redis-backed RideService
+
+Keeps the dispatch state in Redis so every API replica behind the load
+balancer sees the same queues and driver pool:
+
+1. {prefix}emergency - sorted set, score = guaranteed_by (earliest deadline first)
+2. {prefix}normal    - list, RPUSH / LPOP (FIFO)
+3. {prefix}drivers   - GEO set of available drivers (GEOADD / GEOSEARCH)
+4. {prefix}surge:demand / {prefix}surge:supply - hashes of queued rides and
+   available drivers per surge zone ("<row>:<col>"), with
+   {prefix}surge:driver_zone remembering each pooled driver's zone
+5. {prefix}deadlines:stats / {prefix}deadlines:missed - guarantee hits,
+   misses and escalations, and the rides already counted as missed
+
+Queue members are "<seq>|<pickup lat>|<pickup lon>|<queued_at>|<ride json>"
+so Lua can read the pickup without JSON decoding and equal rides never
+collapse into one sorted-set member. Popping a ride and claiming its nearest
+driver happens in a single Lua script, so two replicas can never hand out the
+same ride or driver. With a road graph loaded (road_network), the driver is
+instead the fastest of the nearest few, matched and claimed like a batch.
+Every queue change increments {prefix}queue_version, which versions the
+/queue_details snapshot across replicas.
+
+The Lua scripts that add, pop or claim rides and drivers also update the
+surge hashes, so a ride queued on one replica and assigned on another leaves
+no demand behind. Each replica's RedisSurgeEngine reloads the hashes on its
+tick and prices from the shared counters. AsyncRideManager claims and returns
+drivers through the same Lua helpers.
+
+RedisDeadlineScheduler reads the waiting emergency rides straight from the
+shared queue, and whichever replica claims a ride records its hit or miss,
+so every ride is counted once. One replica per tick escalates
+({prefix}deadlines:tick lock). Drivers headed to a normal pickup are not
+tracked across replicas, so pre-emption is not supported here.
+"""
+
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from .deadline_scheduler import EMERGENCY_GUARANTEE, DeadlineScheduler, deadline_of
+from .metrics import DEADLINE_ESCALATIONS, EMERGENCY_GUARANTEES, EMERGENCY_SLACK
+from .matching import INFEASIBLE, min_cost_assignment
+from .queue_view import queue_row, snapshot_of
+from .ride_service import RideService, pickup_etas
+from .road_network import eta_engine
+from .surge import SurgeEngine, Zone
+
+logger = logging.getLogger(__name__)
+
+# GEOSEARCH radii (km) tried in turn when looking for the nearest drivers;
+# the last one covers the whole planet
+SEARCH_RADII_KM = (2, 10, 50, 250, 1000, 20040)
+
+# Shared by the scripts below (and AsyncRideManager's): surge zone of a point, counter updates that
+# never leave zeros behind, and pool changes that keep the supply counts in step
+ZONE_LUA = """
+local function zone_of(lat, lon, size)
+    lat, lon = tonumber(lat), tonumber(lon)
+    if not lat or not lon then return nil end
+    return string.format('%d:%d', math.floor(lat / size), math.floor(lon / size))
+end
+local function bump(key, zone, delta)
+    if zone and redis.call('HINCRBY', key, zone, delta) <= 0 then
+        redis.call('HDEL', key, zone)
+    end
+end
+local function pool_add(pool, supply, driver_zone, driver, lon, lat, size)
+    redis.call('GEOADD', pool, lon, lat, driver)
+    local zone = zone_of(lat, lon, size)
+    local old = redis.call('HGET', driver_zone, driver)
+    if old ~= zone then
+        if old then bump(supply, old, -1) end
+        bump(supply, zone, 1)
+        redis.call('HSET', driver_zone, driver, zone)
+    end
+end
+local function pool_remove(pool, supply, driver_zone, driver)
+    if redis.call('ZREM', pool, driver) == 0 then return 0 end
+    bump(supply, redis.call('HGET', driver_zone, driver), -1)
+    redis.call('HDEL', driver_zone, driver)
+    return 1
+end
+"""
+
+ENQUEUE_SCRIPT = ZONE_LUA + """
+local seq = redis.call('INCR', KEYS[3])
+local member = string.format('%016d', seq) .. '|' .. ARGV[3] .. '|' .. ARGV[4] .. '|' .. ARGV[2] .. '|' .. ARGV[5]
+if ARGV[1] == '1' then
+    redis.call('ZADD', KEYS[1], ARGV[6], member)
+else
+    redis.call('RPUSH', KEYS[2], member)
+end
+redis.call('INCR', KEYS[4])
+bump(KEYS[5], zone_of(ARGV[3], ARGV[4], tonumber(ARGV[7])), 1)
+return member
+"""
+
+POP_SCRIPT = ZONE_LUA + """
+local out = {}
+local limit = tonumber(ARGV[1])
+local size = tonumber(ARGV[2])
+local emergency = redis.call('ZRANGE', KEYS[1], 0, limit - 1, 'WITHSCORES')
+if #emergency > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, #emergency / 2 - 1)
+end
+for i = 1, #emergency, 2 do
+    table.insert(out, {'E', emergency[i], emergency[i + 1]})
+end
+local left = limit - #emergency / 2
+while left > 0 do
+    local member = redis.call('LPOP', KEYS[2])
+    if not member then break end
+    table.insert(out, {'N', member, ''})
+    left = left - 1
+end
+for _, popped in ipairs(out) do
+    local lat, lon = string.match(popped[2], '^%d+|([^|]*)|([^|]*)|')
+    bump(KEYS[4], zone_of(lat, lon, size), -1)
+end
+if #out > 0 then
+    redis.call('INCR', KEYS[3])
+end
+return out
+"""
+
+# Pop the next ride (emergency first) together with its nearest driver, or nothing
+ASSIGN_SCRIPT = ZONE_LUA + """
+if redis.call('ZCARD', KEYS[3]) == 0 then return false end
+local member, score
+local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #head > 0 then
+    member = head[1]
+    score = head[2]
+else
+    member = redis.call('LINDEX', KEYS[2], 0)
+    if not member then return false end
+end
+local lat, lon = string.match(member, '^%d+|([^|]*)|([^|]*)|')
+for i = 2, #ARGV do
+    local found = redis.call('GEOSEARCH', KEYS[3], 'FROMLONLAT', lon, lat,
+                             'BYRADIUS', ARGV[i], 'km', 'ASC', 'COUNT', 1, 'WITHCOORD')
+    if #found > 0 then
+        if score then
+            redis.call('ZREM', KEYS[1], member)
+        else
+            redis.call('LPOP', KEYS[2])
+        end
+        redis.call('ZREM', KEYS[3], found[1][1])
+        redis.call('INCR', KEYS[4])
+        bump(KEYS[5], zone_of(lat, lon, tonumber(ARGV[1])), -1)
+        bump(KEYS[6], redis.call('HGET', KEYS[7], found[1][1]), -1)
+        redis.call('HDEL', KEYS[7], found[1][1])
+        return {member, found[1][1], found[1][2][1], found[1][2][2]}
+    end
+end
+return false
+"""
+
+# Add or move a pooled driver, moving its supply count when it changes zone
+UPSERT_DRIVER_SCRIPT = ZONE_LUA + """
+pool_add(KEYS[1], KEYS[2], KEYS[3], ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4]))
+"""
+
+# Take a driver out of the pool (1) unless someone else already did (0)
+REMOVE_DRIVER_SCRIPT = ZONE_LUA + """
+return pool_remove(KEYS[1], KEYS[2], KEYS[3], ARGV[1])
+"""
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _split_member(member) -> Tuple[int, Optional[float], Dict]:
+    """(seq, queued_at timestamp, ride) of a queue member"""
+    seq, _, _, rest = _text(member).split("|", 3)
+    queued_at = None
+    if not rest.startswith("{"):  # Members queued before queued_at was stored are "...|<json>"
+        timestamp, rest = rest.split("|", 1)
+        queued_at = float(timestamp)
+    ride_data = json.loads(rest)
+    for key in ("pickup", "destination"):
+        if isinstance(ride_data.get(key), list):
+            ride_data[key] = tuple(ride_data[key])
+    return int(seq), queued_at, ride_data
+
+
+def _decode_member(member) -> Dict:
+    return _split_member(member)[2]
+
+
+class RedisSurgeEngine(SurgeEngine):
+    """SurgeEngine whose demand/supply counters are the Redis hashes shared by every replica"""
+
+    def __init__(self, client, demand_key: str, supply_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.redis = client
+        self.demand_key = demand_key
+        self.supply_key = supply_key
+
+    @staticmethod
+    def _counters(values: Dict) -> Dict[Zone, int]:
+        counters = {}
+        for zone, count in values.items():
+            row, col = _text(zone).split(":")
+            counters[(int(row), int(col))] = int(count)
+        return counters
+
+    def sync(self):
+        """Load the shared counters, marking the zones whose price may have moved"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hgetall(self.demand_key)
+        pipe.hgetall(self.supply_key)
+        demand, supply = (self._counters(values) for values in pipe.execute())
+        with self._lock:
+            for zone in set(self.demand) | set(demand):
+                if self.demand.get(zone, 0) != demand.get(zone, 0):
+                    self._dirty.add(zone)
+            for zone in set(self.supply) | set(supply):
+                if self.supply.get(zone, 0) != supply.get(zone, 0):
+                    self._dirty.update(self._neighbourhood(zone))
+            self.demand = defaultdict(int, demand)
+            self.supply = defaultdict(int, supply)
+
+    def tick(self, current_time: Optional[datetime] = None):
+        try:
+            self.sync()
+        except RedisError:
+            logger.warning("Could not load surge counters from Redis; pricing from the last copy", exc_info=True)
+        super().tick(current_time)
+
+
+class RedisDeadlineScheduler(DeadlineScheduler):
+    """
+    DeadlineScheduler over the shared emergency queue
+
+    The waiting rides are the members of the emergency sorted set (scored by
+    deadline), so a ride assigned on any replica stops being watched on all
+    of them. Hits, misses and escalations are HINCRBY'd into one hash; a ride
+    still queued at its deadline is counted as missed by the first tick that
+    adds it to the missed set. Pre-emption is always off.
+    """
+
+    def __init__(self, client, emergency_key: str, prefix: str = "rides:", **kwargs):
+        kwargs["preempt_before_s"] = 0.0
+        super().__init__(**kwargs)
+        self.redis = client
+        self.emergency_key = emergency_key
+        self.stats_key = f"{prefix}deadlines:stats"
+        self.missed_key = f"{prefix}deadlines:missed"  # Sorted set: ride id -> deadline
+        self.tick_key = f"{prefix}deadlines:tick"
+
+    def track(self, ride_data: Dict):
+        """Nothing to do: queued emergency rides are watched through the shared queue"""
+
+    def assigned(self, request: Dict, eta_minutes: float):
+        """Record the assignment of an emergency ride claimed by this replica: slack, hit or miss"""
+        ride_id = request.get("id")
+        deadline = deadline_of(request)
+        now = self.clock()
+        if ride_id is None or deadline is None or deadline < now - self.forget_after_s:
+            return
+        slack = deadline - (now + eta_minutes * 60)
+        with self._lock:
+            self.recent_slack_s.append(slack)
+        try:
+            if not self.redis.zrem(self.missed_key, ride_id):  # Already counted as missed at its deadline
+                self._outcome(slack >= 0)
+        except RedisError:
+            logger.warning("Could not record the guarantee outcome of ride %s in Redis", ride_id, exc_info=True)
+        EMERGENCY_SLACK.observe(slack)
+
+    def _outcome(self, hit: bool):
+        self.redis.hincrby(self.stats_key, "hits" if hit else "misses", 1)
+        EMERGENCY_GUARANTEES.labels("hit" if hit else "miss").inc()
+
+    def advance(self) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        """
+        Rides to escalate, on the one replica that takes this tick
+
+        Returns:
+            (at_risk, []): (ride id, deadline) of every queued emergency ride
+            past its widen point, earliest deadline first; ([], []) when
+            another replica has the tick
+        """
+        now = self.clock()
+        if not self.redis.set(self.tick_key, 1, nx=True, px=max(1, int(self.wheel.tick_s * 1000))):
+            return [], []
+        # Rides missed longer than forget_after_s ago are no longer watched
+        queued = self.redis.zrangebyscore(self.emergency_key, now - self.forget_after_s,
+                                          now + self.widen_before_s, withscores=True)
+        at_risk = [(_decode_member(member).get("id"), deadline) for member, deadline in queued]
+        overdue = [(ride_id, deadline) for ride_id, deadline in at_risk if ride_id is not None and deadline <= now]
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.missed_key, "-inf", now - self.forget_after_s)
+        for ride_id, deadline in overdue:
+            pipe.zadd(self.missed_key, {ride_id: deadline}, nx=True)
+        for (ride_id, _), added in zip(overdue, pipe.execute()[1:]):
+            if added:
+                self._outcome(False)
+                logger.warning("Emergency ride %s is still waiting at its guaranteed pickup time", ride_id)
+        return at_risk, []
+
+    def escalated(self, action: str, rides: int = 1):
+        """Count rides dispatched by an escalation ("widened")"""
+        self.redis.hincrby(self.stats_key, action, rides)
+        DEADLINE_ESCALATIONS.labels(action).inc(rides)
+
+    def stats(self) -> Dict:
+        """Totals over all replicas; the slack percentiles cover this replica's assignments"""
+        now = self.clock()
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hgetall(self.stats_key)
+        pipe.zcard(self.emergency_key)
+        pipe.zcount(self.emergency_key, now - self.forget_after_s, now + self.widen_before_s)
+        counts, waiting, at_risk = pipe.execute()
+        counts = {_text(key): int(value) for key, value in counts.items()}
+        with self._lock:
+            slack = sorted(self.recent_slack_s)
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        decided = hits + misses
+        return {
+            "waiting": waiting,
+            "at_risk": at_risk,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / decided, 4) if decided else None,
+            "slack_p05_s": round(slack[int(len(slack) * 0.05)], 1) if slack else None,
+            "slack_p50_s": round(slack[len(slack) // 2], 1) if slack else None,
+            "escalations": {action: counts.get(action, 0) for action in self.escalations},
+            "widen_before_s": self.widen_before_s,
+            "preempt_before_s": self.preempt_before_s,
+            "widened_candidates": self.widened_candidates
+        }
+
+
+class RedisRideService(RideService):
+    """RideService whose queues and driver pool live in Redis (shared by all replicas)"""
+
+    def __init__(self, client, prefix: str = "rides:"):
+        """
+        Args:
+            client: A redis.Redis (or fakeredis.FakeRedis) client
+            prefix: Key prefix, so several deployments can share one Redis
+        """
+        super().__init__()
+        self.redis = client
+        self.emergency_key = f"{prefix}emergency"
+        self.normal_key = f"{prefix}normal"
+        self.drivers_key = f"{prefix}drivers"
+        self.seq_key = f"{prefix}seq"
+        self.version_key = f"{prefix}queue_version"
+        self.demand_key = f"{prefix}surge:demand"
+        self.supply_key = f"{prefix}surge:supply"
+        self.driver_zone_key = f"{prefix}surge:driver_zone"
+        # Start like QueueView (microseconds) so versions never go back if Redis is flushed
+        client.setnx(self.version_key, time.time_ns() // 1000)
+        self._snapshot: Optional[Tuple[int, bytes]] = None
+        self.surge = RedisSurgeEngine(client, self.demand_key, self.supply_key)  # Counters shared by all replicas
+        settings = self.deadlines  # DEADLINE_* settings, read by RideService
+        self.deadlines = RedisDeadlineScheduler(client, self.emergency_key, prefix,
+                                                widen_before_s=settings.widen_before_s,
+                                                widened_candidates=settings.widened_candidates)
+        self._enqueue = client.register_script(ENQUEUE_SCRIPT)
+        self._pop = client.register_script(POP_SCRIPT)
+        self._assign = client.register_script(ASSIGN_SCRIPT)
+        self._upsert_driver = client.register_script(UPSERT_DRIVER_SCRIPT)
+        self._remove_driver = client.register_script(REMOVE_DRIVER_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "rides:") -> "RedisRideService":
+        import redis
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    # ------------------------------------------------------------------
+    # Queues
+    # ------------------------------------------------------------------
+
+    def add_ride_to_queue(self, ride_data: Dict, priority: str = "NORMAL") -> int:
+        """Add ride to appropriate queue based on priority; returns its queue entry number"""
+        is_emergency = "EMERGENCY" in str(priority).upper()
+        queued_at = datetime.now()
+        if is_emergency:
+            ride_data.setdefault("guaranteed_by", (queued_at + EMERGENCY_GUARANTEE).isoformat())
+        pickup = ride_data.get("pickup")
+        lat, lon = (repr(float(pickup[0])), repr(float(pickup[1]))) if pickup is not None else ("", "")
+        member = self._enqueue(
+            keys=[self.emergency_key, self.normal_key, self.seq_key, self.version_key, self.demand_key],
+            args=["1" if is_emergency else "0", queued_at.timestamp(), lat, lon, json.dumps(ride_data),
+                  deadline_of(ride_data) or queued_at.timestamp(), repr(self.surge.zone_size)]
+        )
+        entry = int(_text(member).split("|", 1)[0])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Queued ride %s", ride_data.get("id"),
+                        extra={"queue": "EMERGENCY" if is_emergency else "NORMAL", "entry": entry})
+        return entry
+
+    def get_next_ride(self) -> Optional[Dict]:
+        """Get next ride from queue, prioritizing emergency rides"""
+        popped = self._pop(keys=[self.emergency_key, self.normal_key, self.version_key, self.demand_key],
+                           args=[1, repr(self.surge.zone_size)])
+        if not popped:
+            return None
+        return _decode_member(popped[0][1])
+
+    def queue_length(self) -> int:
+        """Rides waiting in both queues (ZCARD + LLEN, both O(1))"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(self.emergency_key)
+        pipe.llen(self.normal_key)
+        return sum(pipe.execute())
+
+    def get_queue_status(self) -> Dict:
+        """Get current queue statistics"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(self.emergency_key)
+        pipe.llen(self.normal_key)
+        pipe.zcard(self.drivers_key)
+        emergency_count, normal_count, drivers = pipe.execute()
+        total = emergency_count + normal_count
+        return {
+            "emergency_count": emergency_count,
+            "normal_count": normal_count,
+            "total_rides": total,
+            "rides_in_queue": total,  # Backward compatibility
+            "available_drivers": drivers
+        }
+
+    def queued_rides(self) -> Tuple[List[Tuple[datetime, Dict]], List[Dict]]:
+        """Emergency rides as (guaranteed_by, ride) in pickup order, then normal rides in FIFO order"""
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrange(self.emergency_key, 0, -1, withscores=True)
+        pipe.lrange(self.normal_key, 0, -1)
+        emergency, normal = pipe.execute()
+        return (
+            [(datetime.fromtimestamp(score), _decode_member(member)) for member, score in emergency],
+            [_decode_member(member) for member in normal]
+        )
+
+    def queue_snapshot(self) -> Tuple[int, bytes]:
+        """(version, JSON) of the shared queue; rebuilt only when the Redis version moved"""
+        version = int(self.redis.get(self.version_key) or 0)
+        if self._snapshot is not None and self._snapshot[0] == version:
+            return self._snapshot
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self.version_key)
+        pipe.zrange(self.emergency_key, 0, -1, withscores=True)
+        pipe.lrange(self.normal_key, 0, -1)
+        version, emergency, normal = pipe.execute()
+        rows = {"EMERGENCY": [], "NORMAL": []}
+        for priority, members in (("EMERGENCY", [member for member, _ in emergency]), ("NORMAL", normal)):
+            for member in members:
+                seq, queued_at, ride = _split_member(member)
+                queued_at = datetime.fromtimestamp(queued_at) if queued_at is not None else datetime.now()
+                rows[priority].append(queue_row(seq, ride, priority, queued_at))
+        version = int(version or 0)
+        self._snapshot = (version, json.dumps(snapshot_of(version, rows["EMERGENCY"], rows["NORMAL"])).encode())
+        return self._snapshot
+
+    def queue_changes(self, since: int) -> Optional[Dict]:
+        """No change log is shared between replicas: only 'nothing changed' is answered incrementally"""
+        version = int(self.redis.get(self.version_key) or 0)
+        if since == version:
+            return {"version": version, "since": since, "changes": []}
+        return None
+
+    @property
+    def ride_queue(self):
+        """Backward compatibility - returns combined queue"""
+        emergency, normal = self.queued_rides()
+        return [ride for _, ride in emergency] + normal
+
+    # ------------------------------------------------------------------
+    # Driver pool
+    # ------------------------------------------------------------------
+
+    @property
+    def available_drivers(self) -> List[Dict]:
+        """Backward compatibility - returns a copy of the driver pool as a list (O(n))"""
+        return [{"id": driver_id, "location": location} for driver_id, location in self.iter_available_drivers()]
+
+    def iter_available_drivers(self, batch_size: int = 1000) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        """Iterate (driver_id, (lat, lon)) over the shared pool in batches"""
+        start = 0
+        while True:
+            driver_ids = self.redis.zrange(self.drivers_key, start, start + batch_size - 1)
+            if not driver_ids:
+                return
+            for driver_id, position in zip(driver_ids, self.redis.geopos(self.drivers_key, *driver_ids)):
+                if position is not None:  # Claimed since the ZRANGE
+                    yield int(_text(driver_id)), (position[1], position[0])
+            start += batch_size
+
+    def has_available_drivers(self) -> bool:
+        return self.driver_count() > 0
+
+    def driver_count(self) -> int:
+        return self.redis.zcard(self.drivers_key)
+
+    def is_driver_available(self, driver_id: int) -> bool:
+        return self.redis.zscore(self.drivers_key, driver_id) is not None
+
+    def upsert_driver(self, driver_id: int, latitude: float, longitude: float):
+        """Add a driver to the shared pool, or move it if already there"""
+        self._upsert_driver(keys=[self.drivers_key, self.supply_key, self.driver_zone_key],
+                            args=[driver_id, repr(float(longitude)), repr(float(latitude)), repr(self.surge.zone_size)])
+
+    def remove_driver(self, driver_id: int) -> bool:
+        """Remove a driver from the shared pool"""
+        return bool(self._remove_driver(keys=[self.drivers_key, self.supply_key, self.driver_zone_key],
+                                        args=[driver_id]))
+
+    def _nearby_drivers(self, pickups: List[Tuple[float, float]], k: int) -> List[List[Tuple[float, int, Tuple]]]:
+        """Up to k nearest (distance_km, driver_id, (lat, lon)) per pickup, widening the radius as needed"""
+        results: List[Optional[List]] = [None] * len(pickups)
+        pending = list(range(len(pickups)))
+        for radius in SEARCH_RADII_KM:
+            if not pending:
+                break
+            pipe = self.redis.pipeline(transaction=False)
+            for index in pending:
+                lat, lon = pickups[index]
+                pipe.geosearch(self.drivers_key, longitude=lon, latitude=lat, radius=radius, unit="km",
+                               sort="ASC", count=k, withcoord=True)
+            still_pending = []
+            for index, found in zip(pending, pipe.execute()):
+                if len(found) < k and radius != SEARCH_RADII_KM[-1]:
+                    still_pending.append(index)
+                    continue
+                lat, lon = pickups[index]
+                results[index] = [
+                    (self.haversine_distance(lat, lon, coord[1], coord[0]), int(_text(driver_id)), (coord[1], coord[0]))
+                    for driver_id, coord in found
+                ]
+            pending = still_pending
+        return [found or [] for found in results]
+
+    # ------------------------------------------------------------------
+    # Assignment
+    # ------------------------------------------------------------------
+
+    def assign_driver(self) -> Optional[Dict]:
+        """Atomically pop the next ride (emergency first) and claim its nearest driver"""
+        if eta_engine.available:
+            # Fastest of the nearest few by road: matched and claimed like a batch of one
+            assignments = self.assign_drivers_batch(max_rides=1)
+            return assignments[0] if assignments else None
+        result = self._assign(
+            keys=[self.emergency_key, self.normal_key, self.drivers_key, self.version_key,
+                  self.demand_key, self.supply_key, self.driver_zone_key],
+            args=[repr(self.surge.zone_size), *SEARCH_RADII_KM]
+        )
+        if not result:
+            return None
+        member, driver_id, lon, lat = result
+        request = _decode_member(member)
+        location = (float(lat), float(lon))
+
+        pickup_lat, pickup_lon = request["pickup"]
+        distance_km = self.haversine_distance(pickup_lat, pickup_lon, *location)
+        [(eta_minutes, _)] = pickup_etas(request["pickup"], [(distance_km, int(_text(driver_id)), location)])
+        return self._assignment(request, int(_text(driver_id)), location, distance_km, eta_minutes)
+
+    def _assignment(self, request: Dict, driver_id: int, location: Tuple[float, float],
+                    distance_km: float, eta_minutes: float) -> Dict:
+        self.deadlines.assigned(request, eta_minutes)
+        logger.info("Assigned driver %s to ride %s (%.2f km)", driver_id, request.get("id"), distance_km)
+        return {
+            "driver": {"id": driver_id, "location": location},
+            "request": request,
+            "distance_km": round(distance_km, 2),
+            "eta_minutes": round(eta_minutes, 1)
+        }
+
+    def preempt_driver(self, ride_id: int, deadline: float) -> Optional[Dict]:
+        """Not supported: which drivers are headed to a normal pickup is not shared between replicas"""
+        return None  # RedisDeadlineScheduler never asks for pre-emption
+
+    def assign_drivers_batch(self, max_rides: int = 50, candidates_per_ride: int = 8) -> List[Dict]:
+        """
+        Drain up to max_rides queued rides and match them to drivers at once
+
+        Same matching as RideService.assign_drivers_batch. Rides are popped
+        atomically; each chosen driver is claimed with ZREM, and a ride whose
+        driver was taken by another replica in the meantime is matched again.
+        Unmatched rides go back to the front of their queue.
+        """
+        if max_rides <= 0 or not self.has_available_drivers():
+            return []
+        popped = self._pop(keys=[self.emergency_key, self.normal_key, self.version_key, self.demand_key],
+                           args=[max_rides, repr(self.surge.zone_size)])
+        entries = [(_text(source), member, score) for source, member, score in popped]
+
+        assignments = []
+        unmatched = self._match_entries([e for e in entries if e[0] == "E"], candidates_per_ride, assignments)
+        unmatched += self._match_entries([e for e in entries if e[0] == "N"], candidates_per_ride, assignments)
+
+        # Put unmatched rides back where they were, with their demand
+        emergency = {member: float(score) for source, member, score in unmatched if source == "E"}
+        normal = [member for source, member, _ in unmatched if source == "N"]
+        pipe = self.redis.pipeline(transaction=True)
+        if emergency:
+            pipe.zadd(self.emergency_key, emergency)
+        if normal:
+            pipe.lpush(self.normal_key, *reversed(normal))
+        if emergency or normal:
+            pipe.incr(self.version_key)
+        for _, member, _ in unmatched:
+            pickup = _decode_member(member).get("pickup")
+            if pickup is not None:
+                pipe.hincrby(self.demand_key, "%d:%d" % self.surge.zone_of(*pickup), 1)
+        pipe.execute()
+        return assignments
+
+    def _match_entries(self, entries: List, candidates_per_ride: int, assignments: List[Dict]) -> List:
+        pending = [(entry, _decode_member(entry[1])) for entry in entries]
+        while pending:
+            k = min(candidates_per_ride, self.driver_count())
+            if k == 0:
+                break
+            candidate_lists = self._nearby_drivers([ride["pickup"] for _, ride in pending], k)
+            locations = {driver_id: location for nearby in candidate_lists for _, driver_id, location in nearby}
+            driver_ids = sorted(locations)
+            if not driver_ids:
+                break
+            column_of = {driver_id: col for col, driver_id in enumerate(driver_ids)}
+
+            cost = np.full((len(pending), len(driver_ids)), INFEASIBLE)
+            distances = np.zeros_like(cost)
+            for row, ((_, ride), nearby) in enumerate(zip(pending, candidate_lists)):
+                for (_, driver_id, _), (eta_minutes, distance_km) in zip(nearby, pickup_etas(ride["pickup"], nearby)):
+                    cost[row, column_of[driver_id]] = eta_minutes
+                    distances[row, column_of[driver_id]] = distance_km
+
+            pairs = min_cost_assignment(cost)
+            if not pairs:
+                break
+
+            # Claim the chosen drivers; one already taken by another replica leaves its ride pending
+            pipe = self.redis.pipeline(transaction=False)
+            for _, col in pairs:
+                self._remove_driver(keys=[self.drivers_key, self.supply_key, self.driver_zone_key],
+                                    args=[driver_ids[col]], client=pipe)
+            matched_rows = set()
+            for (row, col), claimed in zip(pairs, pipe.execute()):
+                if not claimed:
+                    continue
+                matched_rows.add(row)
+                ride = pending[row][1]
+                driver_id = driver_ids[col]
+                assignments.append(self._assignment(ride, driver_id, locations[driver_id],
+                                                    float(distances[row, col]), float(cost[row, col])))
+            pending = [item for row, item in enumerate(pending) if row not in matched_rows]
+        return [entry for entry, _ in pending]
@@ -0,0 +1,287 @@
+"""
+Push channel for ride events (assignments, completions, status changes)
+
+Riders and drivers used to poll /active_rides/... every 10 s: one database
+query per open app per poll, and up to 10 s before a rider saw a match.
+Endpoints that change a ride now publish an event here instead, and it is
+fanned out to whoever is subscribed to the ride's user or driver:
+
+1. RideEventHub keeps subscribers per topic ("user:<id>", "driver:<id>") on
+   the event loop; publish() can be called from sync endpoints (threadpool)
+   and hops onto the loop
+2. Each subscriber has a bounded queue. One that falls max_queue events
+   behind, or does not take a frame within SEND_TIMEOUT_S, is evicted: the
+   WebSocket is closed with 1013 (try again later) or the SSE stream ends,
+   and the client reconnects and refetches its rides once
+3. With RIDE_SERVICE_BACKEND=redis, RedisEventBridge sends every event
+   through one Redis pub/sub channel and each replica delivers what it
+   receives to its own subscribers, so a rider connected to one replica
+   hears about an assignment made on another
+
+Served as a WebSocket (/ws/rides) and as Server-Sent Events (/events/rides)
+for clients or proxies without WebSocket support.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Set
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_S = 15.0  # Below common proxy idle timeouts; also how disconnected sockets are noticed
+SEND_TIMEOUT_S = 5.0
+EVICTED = object()  # Queued for a subscriber that was dropped for falling behind
+CLOSED = object()  # Queued when the client disconnected
+
+
+def topics_for(user_id: Optional[int] = None, driver_id: Optional[int] = None) -> List[str]:
+    topics = []
+    if user_id is not None:
+        topics.append(f"user:{user_id}")
+    if driver_id is not None:
+        topics.append(f"driver:{driver_id}")
+    return topics
+
+
+def assignment_event(assignment: Dict, user_id: Optional[int]) -> Dict:
+    return {
+        "type": "ride_assigned",
+        "ride_id": assignment["request"].get("id"),
+        "user_id": user_id,
+        "driver_id": assignment["driver"]["id"],
+        "distance_km": assignment["distance_km"],
+        "eta_minutes": assignment["eta_minutes"]
+    }
+
+
+class Subscriber:
+    """One connected client: its topics and a bounded queue of pending events"""
+
+    def __init__(self, topics: List[str], max_queue: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue + 1)  # +1 keeps room for EVICTED
+        self.max_queue = max_queue
+        self.evicted = False
+
+    async def next_event(self, timeout: float):
+        """Next event, EVICTED, or None if nothing arrived within timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RideEventHub:
+    """In-process pub/sub of ride events keyed by user and driver"""
+
+    def __init__(self, max_queue: int = 100):
+        """
+        Args:
+            max_queue: Events a subscriber may fall behind before it is evicted
+        """
+        self.max_queue = max_queue
+        self.topics: Dict[str, Set[Subscriber]] = {}
+        self.bridge: Optional["RedisEventBridge"] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        if self.bridge is not None:
+            self.bridge.start(self)
+
+    async def stop(self):
+        if self.bridge is not None:
+            await self.bridge.stop()
+
+    def subscribe(self, user_id: Optional[int] = None, driver_id: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(topics_for(user_id, driver_id), self.max_queue)
+        for topic in subscriber.topics:
+            self.topics.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.topics[topic]
+
+    def publish(self, event: Dict, user_id: Optional[int] = None, driver_id: Optional[int] = None):
+        """Send event to the subscribers of user_id and driver_id (on every replica when bridged)"""
+        topics = topics_for(user_id, driver_id)
+        if not topics or self.loop is None:
+            return
+        self.published += 1
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._emit(topics, event)
+        else:
+            self.loop.call_soon_threadsafe(self._emit, topics, event)
+
+    def _emit(self, topics: List[str], event: Dict):
+        if self.bridge is not None:
+            self.bridge.publish(topics, event)
+        else:
+            self.deliver(topics, event)
+
+    def deliver(self, topics: List[str], event: Dict):
+        """Queue event for local subscribers; must run on the event loop"""
+        seen = set()
+        for topic in topics:
+            for subscriber in list(self.topics.get(topic, ())):
+                if subscriber in seen:
+                    continue
+                seen.add(subscriber)
+                if subscriber.queue.qsize() >= subscriber.max_queue:
+                    self.evict(subscriber)
+                else:
+                    subscriber.queue.put_nowait(event)
+                    self.delivered += 1
+
+    def evict(self, subscriber: Subscriber):
+        """Drop a subscriber that is not keeping up; its connection closes on the next read"""
+        if subscriber.evicted:
+            return
+        self.evicted += 1
+        self._end(subscriber, EVICTED)
+        logger.warning("Evicted slow ride event subscriber", extra={"topics": ",".join(subscriber.topics)})
+
+    def _end(self, subscriber: Subscriber, reason):
+        subscriber.evicted = True
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(reason)
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len({s for subscribers in self.topics.values() for s in subscribers}),
+            "topics": len(self.topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "evicted": self.evicted,
+            "bridged": self.bridge is not None
+        }
+
+    # ------------------------------------------------------------------
+    # Transports
+    # ------------------------------------------------------------------
+
+    async def serve_websocket(self, websocket: WebSocket, user_id: Optional[int], driver_id: Optional[int]):
+        """Stream events to an accepted WebSocket until it disconnects or is evicted"""
+        subscriber = self.subscribe(user_id, driver_id)
+        reader = asyncio.get_running_loop().create_task(self._until_disconnect(websocket, subscriber))
+        try:
+            while True:
+                event = await subscriber.next_event(HEARTBEAT_S)
+                if event is CLOSED:
+                    return
+                if event is EVICTED:
+                    await websocket.close(code=1013)
+                    return
+                await asyncio.wait_for(websocket.send_json(event or {"type": "heartbeat"}), SEND_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            self.evict(subscriber)
+            await websocket.close(code=1013)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # Client went away (RuntimeError: sending after the socket closed)
+        finally:
+            reader.cancel()
+            self.unsubscribe(subscriber)
+
+    async def _until_disconnect(self, websocket: WebSocket, subscriber: Subscriber):
+        # Clients only listen; reading is how a disconnect is noticed without waiting for a heartbeat
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        if not subscriber.evicted:
+            self._end(subscriber, CLOSED)
+
+    async def sse_stream(self, user_id: Optional[int], driver_id: Optional[int]):
+        """text/event-stream body; ends when the subscriber is evicted"""
+        subscriber = self.subscribe(user_id, driver_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscriber.next_event(HEARTBEAT_S)
+                if event is EVICTED:
+                    return
+                if event is None:
+                    yield ": heartbeat\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class RedisEventBridge:
+    """Relays hub events between replicas through one Redis pub/sub channel"""
+
+    def __init__(self, url: str, channel: str = "rides:events"):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.Redis.from_url(url)
+        self.channel = channel
+        self._pending: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, hub: RideEventHub):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen(hub))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.redis.aclose()
+
+    def publish(self, topics: List[str], event: Dict):
+        task = asyncio.get_running_loop().create_task(
+            self.redis.publish(self.channel, json.dumps({"topics": topics, "event": event}))
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._published)
+
+    def _published(self, task: asyncio.Task):
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Publishing ride event to Redis failed: %s", task.exception())
+
+    async def _listen(self, hub: RideEventHub):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            payload = json.loads(message["data"])
+                            hub.deliver(payload["topics"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ride event bridge lost its Redis subscription; resubscribing")
+                await asyncio.sleep(1)
+
+
+def create_ride_event_hub() -> RideEventHub:
+    """Hub for this process, bridged through Redis when the dispatch state is shared there"""
+    hub = RideEventHub(max_queue=int(os.getenv("RIDE_EVENTS_MAX_QUEUE", "100")))
+    if os.getenv("RIDE_SERVICE_BACKEND", "memory").lower() == "redis":
+        hub.bridge = RedisEventBridge(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return hub
+
+
+ride_events = create_ride_event_hub()
@@ -1,64 +1,165 @@
 import math
 import heapq
+import itertools
 import logging
-from typing import List, Dict, Optional, Tuple
+import os
+from typing import Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 from collections import deque
+import numpy as np
+from .deadline_scheduler import EMERGENCY_GUARANTEE, create_deadline_scheduler, deadline_of
+from .geo import haversine_km_array
+from .matching import INFEASIBLE, min_cost_assignment
+from .queue_view import QueueView
+from .road_network import eta_engine
+from .spatial_index import DriverGridIndex
+from .surge import SurgeEngine
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# With a road graph loaded, this many nearest drivers are re-ranked by road ETA
+ETA_CANDIDATES = int(os.getenv("ETA_CANDIDATES", "8"))
+FALLBACK_SPEED_KMH = 30  # Straight-line ETA when there is no road answer
+
+def pickup_etas(pickup: Tuple[float, float],
+                nearby: List[Tuple[float, int, Tuple[float, float]]]) -> List[Tuple[float, float]]:
+    """
+    (eta_minutes, distance_km) for each (distance_km, driver_id, location)
+    candidate to reach the pickup: by road where the ETA engine answers,
+    straight line at FALLBACK_SPEED_KMH otherwise
+    """
+    routes = eta_engine.routes_to(*pickup, [location for _, _, location in nearby])
+    return [
+        (route.minutes, route.distance_km) if route is not None else (distance / FALLBACK_SPEED_KMH * 60, distance)
+        for (distance, _, _), route in zip(nearby, routes)
+    ]
+
 class RideService:
     def __init__(self):
-        self.emergency_queue: List[Tuple] = []  # Priority heap (timestamp, ride_data)
-        self.normal_queue: deque = deque()  # FIFO queue for normal rides
-        self.available_drivers: List[Dict] = []
-    
-    def add_ride_to_queue(self, ride_data: Dict, priority: str = "NORMAL"):
-        """Add ride to appropriate queue based on priority"""
-        priority_str = str(priority).upper()
-        logger.info(f"add_ride_to_queue called with priority={priority!r}, priority_str={priority_str!r}")
-        logger.info(f"Check: 'EMERGENCY' in priority_str = {'EMERGENCY' in priority_str}")
-        if "EMERGENCY" in priority_str:
-            # Add to priority heap (min heap by timestamp)
-            logger.info("Adding to EMERGENCY queue")
-            heapq.heappush(self.emergency_queue, (datetime.now(), ride_data))
+        self.emergency_queue: List[Tuple] = []  # EDF heap of (guaranteed_by, entry, ride_data)
+        self.normal_queue: deque = deque()  # FIFO queue of (queued_at, entry, ride_data)
+        self.queue_view = QueueView()  # Ordered, versioned rows for /queue_details
+        self._entries = itertools.count(1)  # Queue entry numbers: unique, so heap ties never compare dicts
+        self.driver_index = DriverGridIndex()  # Spatial index of available drivers
+        self.surge = SurgeEngine()  # Per-zone demand/supply counters and surge multipliers
+        self.deadlines = create_deadline_scheduler()  # Emergency guarantee timers and escalation
+        # Drivers headed to a normal pickup: driver_id -> (ride, pickup due timestamp); pre-emptible until then
+        self.en_route: Dict[int, Tuple[Dict, float]] = {}
+        self.en_route_index = DriverGridIndex()
+    
+    def add_ride_to_queue(self, ride_data: Dict, priority: str = "NORMAL") -> int:
+        """Add ride to appropriate queue based on priority; returns its queue entry number"""
+        queued_at, entry = datetime.now(), next(self._entries)
+        if "EMERGENCY" in str(priority).upper():
+            # Add to the EDF heap: earliest pickup guarantee first
+            queue = "EMERGENCY"
+            ride_data.setdefault("guaranteed_by", (queued_at + EMERGENCY_GUARANTEE).isoformat())
+            heapq.heappush(self.emergency_queue, (datetime.fromisoformat(ride_data["guaranteed_by"]), entry, ride_data))
+            self.deadlines.track(ride_data)
         else:
             # Add to normal FIFO queue
-            logger.info("Adding to NORMAL queue")
-            self.normal_queue.append(ride_data)
+            queue = "NORMAL"
+            self.normal_queue.append((queued_at, entry, ride_data))
+        self.queue_view.added(entry, ride_data, queue, queued_at)
+        self._track_demand(ride_data, self.surge.ride_queued)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Queued ride %s", ride_data.get("id"), extra={"queue": queue, "entry": entry})
+        return entry
+    
+    def _track_demand(self, ride_data: Dict, update):
+        pickup = ride_data.get("pickup")
+        if pickup is not None:
+            update(*pickup)
     
     def get_next_ride(self) -> Optional[Dict]:
         """Get next ride from queue, prioritizing emergency rides"""
         if self.emergency_queue:
-            _, ride_data = heapq.heappop(self.emergency_queue)
-            return ride_data
+            _, entry, ride_data = heapq.heappop(self.emergency_queue)
+            self.queue_view.removed(entry, "EMERGENCY")
         elif self.normal_queue:
-            return self.normal_queue.popleft()
-        return None
+            _, entry, ride_data = self.normal_queue.popleft()
+            self.queue_view.removed(entry, "NORMAL")
+        else:
+            return None
+        self._track_demand(ride_data, self.surge.ride_dequeued)
+        return ride_data
+    
+    def queue_length(self) -> int:
+        """Rides waiting in both queues (O(1))"""
+        return len(self.emergency_queue) + len(self.normal_queue)
     
     def get_queue_status(self) -> Dict:
         """Get current queue statistics"""
-        total = len(self.emergency_queue) + len(self.normal_queue)
+        total = self.queue_length()
         return {
             "emergency_count": len(self.emergency_queue),
             "normal_count": len(self.normal_queue),
             "total_rides": total,
             "rides_in_queue": total,  # Backward compatibility
-            "available_drivers": len(self.available_drivers)
+            "available_drivers": self.driver_count()
         }
     
+    def queued_rides(self) -> Tuple[List[Tuple[datetime, Dict]], List[Dict]]:
+        """Emergency rides as (guaranteed_by, ride) in pickup order, then normal rides in FIFO order"""
+        return (
+            [(guaranteed_by, ride) for guaranteed_by, _, ride in sorted(self.emergency_queue)],
+            [ride for _, _, ride in self.normal_queue]
+        )
+    
+    def queue_snapshot(self) -> Tuple[int, bytes]:
+        """(version, JSON) of the ordered queue view; cached until the queue changes"""
+        return self.queue_view.snapshot_json()
+    
+    def queue_changes(self, since: int) -> Optional[Dict]:
+        """Queue changes after version `since`, or None when a full snapshot is needed"""
+        return self.queue_view.changes_since(since)
+    
     @property
     def ride_queue(self):
-        """Backward compatibility - returns combined queue"""
-        combined = []
-        # Emergency rides first
-        for _, ride in sorted(self.emergency_queue):
-            combined.append(ride)
-        # Then normal rides
-        combined.extend(list(self.normal_queue))
-        return combined
+        """Backward compatibility - returns combined queue (sorts and copies; use queue_length() for sizes)"""
+        emergency, normal = self.queued_rides()
+        return [ride for _, ride in emergency] + normal
+    
+    @property
+    def available_drivers(self) -> List[Dict]:
+        """Backward compatibility - returns a copy of the driver pool as a list (O(n))"""
+        return [{"id": driver_id, "location": location} for driver_id, location in self.driver_index]
+    
+    def iter_available_drivers(self) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        """Iterate (driver_id, (lat, lon)) over the available pool without copying it"""
+        return iter(self.driver_index)
+    
+    def has_available_drivers(self) -> bool:
+        return bool(self.driver_index)
+    
+    def driver_count(self) -> int:
+        return len(self.driver_index)
+    
+    def is_driver_available(self, driver_id: int) -> bool:
+        return driver_id in self.driver_index
+    
+    def upsert_driver(self, driver_id: int, latitude: float, longitude: float):
+        """Add a driver to the available pool, or move it if already there (O(1))"""
+        en_route = self.en_route.get(driver_id)
+        if en_route is not None:
+            if en_route[1] > self.deadlines.clock():
+                # Still headed to a normal pickup: track it for pre-emption, keep it out of the pool
+                self.en_route_index.insert(driver_id, latitude, longitude)
+                return
+            self._arrived(driver_id)
+        old_location = self.driver_index.get(driver_id)
+        self.driver_index.insert(driver_id, latitude, longitude)
+        self.surge.driver_moved(old_location, (latitude, longitude))
+    
+    def remove_driver(self, driver_id: int) -> bool:
+        """Remove a driver from the available pool (O(1))"""
+        location = self.driver_index.get(driver_id)
+        if location is None:
+            return False
+        self.driver_index.remove(driver_id)
+        self.surge.driver_moved(location, None)
+        return True
     
     def haversine_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two points using Haversine formula"""
@@ -74,9 +175,13 @@ class RideService:
         
         return R * c
     
+    def haversine_distances(self, lat: float, lon: float, lats, lons):
+        """Vectorized haversine_distance from one point to arrays of points (km)"""
+        return haversine_km_array(lat, lon, lats, lons)
+    
     def assign_driver(self) -> Optional[Dict]:
         """Assign nearest driver to next ride request (prioritizing emergency rides)"""
-        if not self.available_drivers:
+        if not self.driver_index:
             return None
         
         # Get next ride from priority queue
@@ -86,30 +191,248 @@ class RideService:
         
         pickup_lat, pickup_lon = request["pickup"]
         
-        # Find nearest driver
-        nearest_driver = None
-        min_distance = float('inf')
+        # Find nearest driver via the spatial index; with a road graph, the fastest of the nearest few
+        nearby = self._located(self.driver_index.nearest(
+            pickup_lat, pickup_lon, k=ETA_CANDIDATES if eta_engine.available else 1
+        ))
+        etas = pickup_etas(request["pickup"], nearby)
+        best = min(range(len(nearby)), key=lambda i: etas[i][0])
+        eta_minutes, distance_km = etas[best]
         
-        for driver in self.available_drivers:
-            driver_lat, driver_lon = driver["location"]
-            distance = self.haversine_distance(pickup_lat, pickup_lon, driver_lat, driver_lon)
-            
-            if distance < min_distance:
-                min_distance = distance
-                nearest_driver = driver
+        # An emergency ride the nearest free driver would reach late takes a driver headed to a normal pickup
+        deadline = deadline_of(request)
+        if deadline is not None and self.deadlines.preempt_before_s > 0 and self.en_route:
+            budget_minutes = (deadline - self.deadlines.clock()) / 60
+            if eta_minutes > budget_minutes:
+                en_route = self._nearest_en_route(request, budget_minutes)
+                if en_route is not None:
+                    self.deadlines.escalated("preempted")
+                    return self._take_en_route(request, *en_route)
+        
+        return self._claim_driver(request, nearby[best][1], distance_km, eta_minutes)
+    
+    def _located(self, nearby: List[Tuple[float, int]]) -> List[Tuple[float, int, Tuple[float, float]]]:
+        return [(distance, driver_id, self.driver_index.get(driver_id)) for distance, driver_id in nearby]
+    
+    def _claim_driver(self, request: Dict, driver_id: int, distance_km: float, eta_minutes: float,
+                      location: Optional[Tuple[float, float]] = None) -> Dict:
+        """Remove an assigned driver from the available pool and describe the assignment"""
+        nearest_driver = {
+            "id": driver_id,
+            "location": location or self.driver_index.get(driver_id)
+        }
         
-        # Remove assigned driver from available list
-        self.available_drivers.remove(nearest_driver)
+        # Remove assigned driver from available pool
+        self.remove_driver(driver_id)
+        self.deadlines.assigned(request, eta_minutes)
+        if "EMERGENCY" not in str(request.get("priority")).upper():
+            self.en_route[driver_id] = (request, self.deadlines.clock() + eta_minutes * 60)
+            self.en_route_index.insert(driver_id, *nearest_driver["location"])
         
-        # Calculate ETA (30 km/h average speed)
-        eta_minutes = (min_distance / 30) * 60
+        logger.info("Assigned driver %s to ride %s (%.2f km)", driver_id, request.get("id"), distance_km)
         
         return {
             "driver": nearest_driver,
             "request": request,
-            "distance_km": round(min_distance, 2),
+            "distance_km": round(distance_km, 2),
             "eta_minutes": round(eta_minutes, 1)
         }
+    
+    def assign_drivers_batch(self, max_rides: int = 50, candidates_per_ride: int = 8) -> List[Dict]:
+        """
+        Drain up to max_rides queued rides and match them to drivers at once
+        
+        Emergency rides are matched first over the whole pool, then normal
+        rides over the drivers that are left. Each phase solves a min-cost
+        bipartite matching (total pickup ETA) where every ride may only
+        take one of its `candidates_per_ride` nearest drivers. Rides that
+        cannot be matched go back to the front of their queue.
+        
+        Returns:
+            List of assignments in the same format as assign_driver
+        """
+        if not self.driver_index or max_rides <= 0:
+            return []
+        
+        emergency_entries = []
+        while self.emergency_queue and len(emergency_entries) < max_rides:
+            emergency_entries.append(heapq.heappop(self.emergency_queue))
+        normal_entries = []
+        while self.normal_queue and len(emergency_entries) + len(normal_entries) < max_rides:
+            normal_entries.append(self.normal_queue.popleft())
+        
+        assignments = []
+        unmatched_emergency = self._match_rides(emergency_entries, "EMERGENCY", candidates_per_ride, assignments)
+        unmatched_normal = self._match_rides(normal_entries, "NORMAL", candidates_per_ride, assignments)
+        
+        # Put unmatched rides back where they were
+        for entry in unmatched_emergency:
+            heapq.heappush(self.emergency_queue, entry)
+        self.normal_queue.extendleft(reversed(unmatched_normal))
+        
+        return assignments
+    
+    def _match_rides(self, items: List, priority: str, candidates_per_ride: int, assignments: List[Dict]) -> List:
+        """
+        Min-cost match queue entries (queued_at, entry, ride) against nearby available drivers
+        
+        Repeats on the leftovers while it keeps making progress, since a ride
+        whose candidates were all taken may still have other drivers nearby.
+        Matched rides leave the queue view; unmatched items are returned in
+        their original order.
+        """
+        pending = list(items)
+        while pending and self.driver_index:
+            candidate_lists = [
+                self.driver_index.nearest(*item[2]["pickup"], k=candidates_per_ride)
+                for item in pending
+            ]
+            driver_ids = sorted({driver_id for nearby in candidate_lists for _, driver_id in nearby})
+            column_of = {driver_id: col for col, driver_id in enumerate(driver_ids)}
+            
+            cost = np.full((len(pending), len(driver_ids)), INFEASIBLE)
+            distances = np.zeros_like(cost)
+            for row, (item, nearby) in enumerate(zip(pending, candidate_lists)):
+                for (_, driver_id), (eta_minutes, distance_km) in zip(
+                        nearby, pickup_etas(item[2]["pickup"], self._located(nearby))):
+                    cost[row, column_of[driver_id]] = eta_minutes
+                    distances[row, column_of[driver_id]] = distance_km
+            
+            pairs = min_cost_assignment(cost)
+            if not pairs:
+                break
+            for row, col in pairs:
+                _, entry, ride = pending[row]
+                self.queue_view.removed(entry, priority)
+                self._track_demand(ride, self.surge.ride_dequeued)
+                assignments.append(self._claim_driver(ride, driver_ids[col], float(distances[row, col]),
+                                                      float(cost[row, col])))
+            
+            matched_rows = {row for row, _ in pairs}
+            pending = [item for row, item in enumerate(pending) if row not in matched_rows]
+        return pending
+    
+    def escalate_deadlines(self) -> List[Dict]:
+        """
+        One DeadlineScheduler tick: dispatch the emergency rides whose guarantee is at risk
+        
+        Rides close to their deadline first try to pre-empt a driver headed to a
+        normal pickup (preempt_driver), then every ride at risk is batch-matched
+        over its widened candidates. Returns the assignments; a pre-emption
+        carries the displaced normal ride as "preempted".
+        """
+        at_risk, preempt = self.deadlines.advance()
+        if not at_risk:
+            return []
+        
+        assignments = []
+        for ride_id, deadline in preempt:
+            assignment = self.preempt_driver(ride_id, deadline)
+            if assignment is not None:
+                self.deadlines.escalated("preempted")
+                assignments.append(assignment)
+        
+        # EDF: the rides at risk are the head of the emergency queue
+        waiting = min(len(at_risk) - len(assignments), self.get_queue_status()["emergency_count"])
+        if waiting > 0 and self.has_available_drivers():
+            matched = self.assign_drivers_batch(max_rides=waiting,
+                                                candidates_per_ride=self.deadlines.widened_candidates)
+            if matched:
+                self.deadlines.escalated("widened", len(matched))
+            assignments.extend(matched)
+        return assignments
+    
+    def preempt_driver(self, ride_id: int, deadline: float) -> Optional[Dict]:
+        """
+        Give a queued emergency ride the driver headed to a normal pickup that reaches it soonest
+        
+        Only when no free driver can reach the pickup by `deadline` (timestamp)
+        and that driver can. The normal ride goes back to the front of the
+        normal queue.
+        """
+        item = next((item for item in self.emergency_queue if item[2].get("id") == ride_id), None)
+        if item is None:
+            return None
+        request = item[2]
+        budget_minutes = (deadline - self.deadlines.clock()) / 60
+        
+        free = self._located(self.driver_index.nearest(*request["pickup"], k=self.deadlines.widened_candidates))
+        if free and min(eta for eta, _ in pickup_etas(request["pickup"], free)) <= budget_minutes:
+            return None  # A free driver makes it; the widened batch match will assign one
+        
+        best = self._nearest_en_route(request, budget_minutes)
+        if best is None:
+            return None
+        self.emergency_queue.remove(item)
+        heapq.heapify(self.emergency_queue)
+        self.queue_view.removed(item[1], "EMERGENCY")
+        self._track_demand(request, self.surge.ride_dequeued)
+        return self._take_en_route(request, *best)
+    
+    def _nearest_en_route(self, request: Dict,
+                          budget_minutes: float) -> Optional[Tuple[int, Tuple[float, float], float, float]]:
+        """(driver_id, location, distance_km, eta_minutes) of the en-route driver first at the pickup, within budget"""
+        now = self.deadlines.clock()
+        busy = []
+        for distance, driver_id in self.en_route_index.nearest(*request["pickup"], k=self.deadlines.widened_candidates):
+            if self.en_route[driver_id][1] <= now:
+                self._arrived(driver_id)  # Reached its pickup by now: no longer pre-emptible
+            else:
+                busy.append((distance, driver_id, self.en_route_index.get(driver_id)))
+        if not busy:
+            return None
+        etas = pickup_etas(request["pickup"], busy)
+        best = min(range(len(busy)), key=lambda i: etas[i][0])
+        eta_minutes, distance_km = etas[best]
+        if eta_minutes > budget_minutes:
+            return None
+        return busy[best][1], busy[best][2], distance_km, eta_minutes
+    
+    def _take_en_route(self, request: Dict, driver_id: int, location: Tuple[float, float], distance_km: float,
+                       eta_minutes: float) -> Dict:
+        """Reassign an en-route driver to an emergency ride; its normal ride goes back to the queue"""
+        displaced = self.en_route[driver_id][0]
+        self._arrived(driver_id)
+        self._requeue_front(displaced)
+        
+        assignment = self._claim_driver(request, driver_id, distance_km, eta_minutes, location=location)
+        assignment["preempted"] = displaced
+        logger.info("Pre-empted driver %s from ride %s for emergency ride %s", driver_id, displaced.get("id"),
+                    request.get("id"))
+        return assignment
+    
+    def _requeue_front(self, ride_data: Dict):
+        """Put a normal ride back at the head of the normal queue"""
+        queued_at = datetime.now()
+        entry = self.normal_queue[0][1] - 1 if self.normal_queue else next(self._entries)
+        self.normal_queue.appendleft((queued_at, entry, ride_data))
+        self.queue_view.added(entry, ride_data, "NORMAL", queued_at)
+        self._track_demand(ride_data, self.surge.ride_queued)
+    
+    def ride_ended(self, driver_id: int):
+        """The driver's ride was completed: it is no longer headed to a pickup"""
+        self._arrived(driver_id)
+    
+    def _arrived(self, driver_id: int):
+        """The driver is no longer on its way to a normal pickup"""
+        if self.en_route.pop(driver_id, None) is not None:
+            self.en_route_index.remove(driver_id)
+
+def create_ride_service() -> RideService:
+    """
+    Build the dispatch backend selected by RIDE_SERVICE_BACKEND
+    
+    "memory" (default) keeps queues and drivers in this process, which is right
+    for a single server. "redis" shares them through REDIS_URL so several API
+    replicas behind a load balancer dispatch from the same state.
+    """
+    backend = os.getenv("RIDE_SERVICE_BACKEND", "memory").lower()
+    if backend == "redis":
+        from .redis_ride_service import RedisRideService
+        return RedisRideService.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    if backend != "memory":
+        raise ValueError(f"Unknown RIDE_SERVICE_BACKEND {backend!r} (expected 'memory' or 'redis')")
+    return RideService()
 
 # Global instance
-ride_service = RideService()
\ No newline at end of file
+ride_service = create_ride_service()
\ No newline at end of file
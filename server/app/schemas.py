@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from enum import Enum
 
 class RidePriority(str, Enum):
@@ -54,4 +54,9 @@ class RideRequest(BaseModel):
         from_attributes = True
 
 class BulkDriverCreate(BaseModel):
-    drivers: List[DriverCreate]
\ No newline at end of file
+    drivers: List[DriverCreate]
+
+class RideBinding(BaseModel):
+    ride_id: int
+    priority: str = "normal"
+    ride_data: Dict = {}
\ No newline at end of file
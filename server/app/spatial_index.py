@@ -0,0 +1,156 @@
+"""
+Spatial index over the available driver pool
+
+Drivers are bucketed into a uniform latitude/longitude grid so that finding
+the nearest driver to a pickup only looks at the cells around it instead of
+every driver in the pool:
+
+1. Insert / Move / Delete - O(1): a driver's slot lives in exactly one cell
+2. K-Nearest Search - expanding rings of cells around the pickup, stopping as
+   soon as no unvisited cell can hold a closer driver than the k-th best found
+
+Positions themselves live in a DriverLocationStore, so each ring of
+candidates is measured with one vectorized haversine pass.
+"""
+
+import math
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .driver_store import DriverLocationStore
+from .geo import KM_PER_DEGREE
+
+
+class DriverGridIndex:
+    """Uniform grid index of driver locations supporting k-nearest queries"""
+
+    def __init__(self, cell_size_deg: float = 0.005):
+        """
+        Args:
+            cell_size_deg: Edge length of a grid cell in degrees (~550 m at 0.005)
+        """
+        self.cell_size = cell_size_deg
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}  # cell -> store slots
+        self.store = DriverLocationStore()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, driver_id: int) -> bool:
+        return driver_id in self.store
+
+    def __iter__(self) -> Iterator[Tuple[int, Tuple[float, float]]]:
+        return iter(self.store)
+
+    def cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Grid cell (row, col) containing a coordinate"""
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def get(self, driver_id: int) -> Optional[Tuple[float, float]]:
+        """Current (lat, lon) of a driver, or None if not indexed"""
+        return self.store.get(driver_id)
+
+    def insert(self, driver_id: int, lat: float, lon: float):
+        """Insert a driver, or move it if it is already indexed"""
+        new_cell = self.cell_of(lat, lon)
+        old_location = self.store.get(driver_id)
+        slot = self.store.upsert(driver_id, lat, lon)
+        if old_location is not None:
+            old_cell = self.cell_of(*old_location)
+            if old_cell == new_cell:
+                return
+            self._discard_from_cell(old_cell, slot)
+        self.cells.setdefault(new_cell, set()).add(slot)
+
+    def remove(self, driver_id: int) -> bool:
+        """Remove a driver from the index. Returns False if it was not indexed"""
+        location = self.store.get(driver_id)
+        if location is None:
+            return False
+        slot = self.store.remove(driver_id)
+        self._discard_from_cell(self.cell_of(*location), slot)
+        return True
+
+    def clear(self):
+        self.cells.clear()
+        self.store.clear()
+
+    def _discard_from_cell(self, cell: Tuple[int, int], slot: int):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(slot)
+            if not members:
+                del self.cells[cell]
+
+    def _ring_cells(self, row: int, col: int, radius: int) -> Iterator[Tuple[int, int]]:
+        """Cells at exactly Chebyshev distance `radius` from (row, col)"""
+        if radius == 0:
+            yield (row, col)
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield (row - radius, c)
+            yield (row + radius, c)
+        for r in range(row - radius + 1, row + radius):
+            yield (r, col - radius)
+            yield (r, col + radius)
+
+    def _ring_clearance_km(self, lat: float, radius: int) -> float:
+        """
+        Lower bound on the distance from a point to any cell outside the
+        first `radius` rings around its own cell
+        """
+        cell_height_km = self.cell_size * KM_PER_DEGREE
+        widest_lat = min(abs(lat) + (radius + 1) * self.cell_size, 89.9)
+        cell_width_km = cell_height_km * math.cos(math.radians(widest_lat))
+        return radius * min(cell_height_km, cell_width_km)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[float, int]]:
+        """
+        Find the k drivers closest to a point
+
+        Args:
+            lat, lon: Query point (usually the pickup)
+            k: Number of drivers to return
+
+        Returns:
+            List of (distance_km, driver_id), closest first
+        """
+        if k <= 0 or not self.store:
+            return []
+
+        row, col = self.cell_of(lat, lon)
+        ring_slots: List[np.ndarray] = []
+        ring_distances: List[np.ndarray] = []
+        seen = 0
+        kth_distance = math.inf
+        radius = 0
+
+        while seen < len(self.store):
+            ring_size = 8 * radius if radius else 1
+            if ring_size > len(self.cells):
+                # Sparse pool: walking empty rings costs more than one full scan
+                return self.store.nearest(lat, lon, k)
+
+            members: List[int] = []
+            for cell in self._ring_cells(row, col, radius):
+                cell_slots = self.cells.get(cell)
+                if cell_slots:
+                    members.extend(cell_slots)
+
+            if members:
+                slots = np.array(members, dtype=np.intp)
+                ring_slots.append(slots)
+                ring_distances.append(self.store.distances_km(lat, lon, slots))
+                seen += len(members)
+                if seen >= k:
+                    distances = np.concatenate(ring_distances)
+                    kth_distance = np.partition(distances, k - 1)[k - 1]
+
+            if kth_distance <= self._ring_clearance_km(lat, radius):
+                break
+            radius += 1
+
+        slots = np.concatenate(ring_slots)
+        distances = np.concatenate(ring_distances)
+        return self.store.top_k(slots, distances, k)
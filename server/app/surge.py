@@ -0,0 +1,196 @@
+"""
+Zone-based surge engine
+
+Instead of one global surge computed from the whole queue on every quote,
+the city is split into square zones and each zone keeps live counters:
+
+1. Demand - rides currently queued with a pickup in the zone
+2. Supply - available drivers currently in the zone
+
+Counters are updated incrementally by RideService as rides enter and leave
+the queue and as drivers move. On every tick the multipliers of zones whose
+counters changed are recomputed with PricingCalculator.calculate_surge_multiplier
+(zone demand vs. supply in the zone and its 8 neighbours), so pricing a quote
+is a single dictionary lookup. A backlog downtown no longer raises prices in
+quiet suburbs: zones without queued rides only get the time-of-day surge.
+"""
+
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from .pricing import PricingCalculator
+
+Zone = Tuple[int, int]
+
+
+class SurgeEngine:
+    """Per-zone demand/supply counters with periodically precomputed multipliers"""
+
+    def __init__(self, zone_size_deg: float = 0.02, tick_seconds: float = 5.0):
+        """
+        Args:
+            zone_size_deg: Edge length of a surge zone in degrees (~2.2 km at 0.02)
+            tick_seconds: How often changed zones are re-priced
+        """
+        self.zone_size = zone_size_deg
+        self.tick_seconds = tick_seconds
+        self.demand: Dict[Zone, int] = defaultdict(int)
+        self.supply: Dict[Zone, int] = defaultdict(int)
+        self.multipliers: Dict[Zone, float] = {}
+        self.base_multiplier = 1.0  # Time-of-day surge for zones without demand
+        self.epoch = 0  # Incremented whenever any published multiplier changes
+        self.updated_at: Optional[datetime] = None
+        self._dirty: Set[Zone] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def zone_of(self, lat: float, lon: float) -> Zone:
+        return (math.floor(lat / self.zone_size), math.floor(lon / self.zone_size))
+
+    def _neighbourhood(self, zone: Zone):
+        row, col = zone
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                yield (row + d_row, col + d_col)
+
+    # ------------------------------------------------------------------
+    # Incremental counter updates (called by RideService)
+    # ------------------------------------------------------------------
+
+    def ride_queued(self, lat: float, lon: float):
+        zone = self.zone_of(lat, lon)
+        with self._lock:
+            self.demand[zone] += 1
+            self._dirty.add(zone)
+
+    def ride_dequeued(self, lat: float, lon: float):
+        zone = self.zone_of(lat, lon)
+        with self._lock:
+            self._decrement(self.demand, zone)
+            self._dirty.add(zone)
+
+    def driver_moved(self, old: Optional[Tuple[float, float]], new: Optional[Tuple[float, float]]):
+        """A driver entered the pool (old=None), left it (new=None) or moved"""
+        old_zone = self.zone_of(*old) if old is not None else None
+        new_zone = self.zone_of(*new) if new is not None else None
+        if old_zone == new_zone:
+            return
+        with self._lock:
+            if old_zone is not None:
+                self._decrement(self.supply, old_zone)
+                self._dirty.update(self._neighbourhood(old_zone))
+            if new_zone is not None:
+                self.supply[new_zone] += 1
+                self._dirty.update(self._neighbourhood(new_zone))
+
+    @staticmethod
+    def _decrement(counters: Dict[Zone, int], zone: Zone):
+        count = counters.get(zone, 0) - 1
+        if count > 0:
+            counters[zone] = count
+        else:
+            counters.pop(zone, None)
+
+    # ------------------------------------------------------------------
+    # Pricing
+    # ------------------------------------------------------------------
+
+    def multiplier_for(self, lat: float, lon: float) -> float:
+        """Current surge multiplier for a pickup point (a single lookup)"""
+        return self.multipliers.get(self.zone_of(lat, lon), self.base_multiplier)
+
+    def zone_multiplier(self, zone: Zone, current_time: datetime) -> float:
+        """Surge for one zone from its demand and its neighbourhood's supply"""
+        demand = self.demand.get(zone, 0)
+        supply = sum(self.supply.get(neighbour, 0) for neighbour in self._neighbourhood(zone))
+        return PricingCalculator.calculate_surge_multiplier(
+            current_time=current_time,
+            queue_length=demand,
+            available_drivers=supply
+        )
+
+    def tick(self, current_time: Optional[datetime] = None):
+        """Re-price zones whose counters changed since the last tick"""
+        if current_time is None:
+            current_time = datetime.now()
+
+        with self._lock:
+            # Time-only surge: no queue and at least one driver
+            base = PricingCalculator.calculate_surge_multiplier(
+                current_time=current_time, queue_length=0, available_drivers=1
+            )
+            if base != self.base_multiplier:
+                # Peak hours started or ended: every zone's price moves
+                self.base_multiplier = base
+                self._dirty.update(self.multipliers)
+                self._dirty.update(self.demand)
+                changed = True
+            else:
+                changed = False
+
+            dirty, self._dirty = self._dirty, set()
+            multipliers = dict(self.multipliers)
+            for zone in dirty:
+                if self.demand.get(zone, 0) == 0:
+                    changed |= multipliers.pop(zone, None) is not None
+                    continue
+                multiplier = self.zone_multiplier(zone, current_time)
+                if multipliers.get(zone) != multiplier:
+                    multipliers[zone] = multiplier
+                    changed = True
+
+            if changed:
+                # Publish a new dict so lock-free readers never see a half-updated map
+                self.multipliers = multipliers
+                self.epoch += 1
+            self.updated_at = current_time
+
+    def surge_map(self) -> Dict:
+        """Snapshot of every zone with demand, supply or a published surge"""
+        with self._lock:
+            zones = set(self.multipliers) | set(self.demand) | set(self.supply)
+            rows = []
+            for zone in sorted(zones):
+                row, col = zone
+                rows.append({
+                    "zone": [row, col],
+                    "center": [(row + 0.5) * self.zone_size, (col + 0.5) * self.zone_size],
+                    "demand": self.demand.get(zone, 0),
+                    "supply": self.supply.get(zone, 0),
+                    "multiplier": self.multipliers.get(zone, self.base_multiplier)
+                })
+            return {
+                "zone_size_deg": self.zone_size,
+                "tick_seconds": self.tick_seconds,
+                "epoch": self.epoch,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+                "base_multiplier": self.base_multiplier,
+                "zones": rows
+            }
+
+    # ------------------------------------------------------------------
+    # Background ticking
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start re-pricing zones every tick_seconds on a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.tick()
+        self._thread = threading.Thread(target=self._run, name="surge-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.tick_seconds)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.tick_seconds):
+            self.tick()
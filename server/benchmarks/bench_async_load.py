@@ -0,0 +1,168 @@
+"""
+Benchmark: hot endpoint latency and throughput under concurrency
+
+Run from the server/ directory against a running server:
+    python -m benchmarks.bench_async_load --url http://localhost:8000 [--concurrency 200 --requests 5000]
+    python -m benchmarks.bench_async_load --json after.json --baseline before.json
+
+Registers `--drivers` drivers, then keeps `--concurrency` requests in flight
+across a mix of POST /request_ride, /add_driver_location, /assign_driver and
+/end_ride, and reports p50/p99 latency and requests/sec per endpoint.
+Start the server the way production does (e.g. gunicorn with uvicorn workers
+on Postgres) and run once on the sync build and once on the async build;
+--json saves a run and --baseline prints the comparison against a saved one.
+Needs httpx (pip install httpx).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+# Relative weight of each endpoint in the request mix
+MIX = {
+    "request_ride": 4,
+    "add_driver_location": 10,
+    "assign_driver": 2,
+    "end_ride": 2,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def register_drivers(client, count, rng):
+    drivers = [
+        {"name": f"load-{i}", "car_no": f"LOAD-{i}",
+         "latitude": rng.uniform(*LAT_RANGE), "longitude": rng.uniform(*LON_RANGE)}
+        for i in range(count)
+    ]
+    response = await client.post("/register_drivers_bulk", json={"drivers": drivers})
+    response.raise_for_status()
+    return [driver["id"] for driver in response.json()]
+
+
+def make_request(kind, rng, driver_ids, ride_ids):
+    if kind == "request_ride":
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        return "/request_ride", {"json": {
+            "user_id": rng.randint(1, 1000), "pickup_location": "load", "drop_location": "load",
+            "pickup_lat": lat, "pickup_lon": lon, "drop_lat": lat + 0.02, "drop_lon": lon + 0.02
+        }}
+    if kind == "add_driver_location":
+        return "/add_driver_location", {"params": {
+            "driver_id": rng.choice(driver_ids),
+            "latitude": rng.uniform(*LAT_RANGE), "longitude": rng.uniform(*LON_RANGE)
+        }}
+    if kind == "end_ride" and ride_ids:
+        return f"/end_ride/{rng.choice(ride_ids)}", {}
+    return "/assign_driver", {}
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    kinds = [kind for kind, weight in MIX.items() for _ in range(weight)]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    ride_ids = []
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        driver_ids = await register_drivers(client, args.drivers, rng)
+        remaining = args.requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                kind = rng.choice(kinds)
+                path, kwargs = make_request(kind, rng, driver_ids, ride_ids)
+                kind = path.split("/")[1]
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, **kwargs)
+                except httpx.HTTPError:
+                    errors[kind] += 1
+                    continue
+                latencies[kind].append(time.perf_counter() - start)
+                if response.status_code >= 500:
+                    errors[kind] += 1
+                elif kind == "request_ride" and response.status_code == 200:
+                    ride_ids.append(response.json()["id"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = {"concurrency": args.concurrency, "elapsed_s": elapsed, "endpoints": {}}
+    all_latencies = []
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        all_latencies.extend(values)
+        results["endpoints"][kind] = {
+            "requests": len(values),
+            "errors": errors[kind],
+            "p50_ms": percentile(values, 50) * 1e3,
+            "p99_ms": percentile(values, 99) * 1e3,
+            "rps": len(values) / elapsed,
+        }
+    all_latencies.sort()
+    results["endpoints"]["all"] = {
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "p50_ms": percentile(all_latencies, 50) * 1e3,
+        "p99_ms": percentile(all_latencies, 99) * 1e3,
+        "rps": len(all_latencies) / elapsed,
+    }
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"concurrency {results['concurrency']}, {results['elapsed_s']:.1f}s")
+    print(f"{'endpoint':<22} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for kind, row in results["endpoints"].items():
+        print(f"{kind:<22} {row['requests']:>9} {row['errors']:>7} {row['p50_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['rps']:>9.0f}")
+        if baseline and kind in baseline["endpoints"]:
+            base = baseline["endpoints"][kind]
+            print(f"{'  vs baseline':<22} {'':>9} {'':>7} {base['p50_ms']:>9.1f} "
+                  f"{base['p99_ms']:>9.1f} {base['rps']:>9.0f}  "
+                  f"({row['rps'] / base['rps'] if base['rps'] else 0:.2f}x req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Save results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Benchmark: AsyncRideManager against Redis
+
+Run from the server/ directory:
+    python -m benchmarks.bench_async_rides --redis-url redis://localhost:6379
+    python -m benchmarks.bench_async_rides            # in-process fakeredis when no --redis-url
+
+Keys go under a fresh bench:<id>: prefix and are deleted afterwards, so a
+shared Redis is safe. Each phase checks the dispatcher's guarantees and
+fails loudly when one breaks:
+
+    dispatch      --rides submitted at once to --drivers drivers around
+                  Manhattan: submit -> driver_assigned latency p50/p99, rides/s
+                  and Redis round trips per ride and per transition. Every
+                  ride completes, no driver is held by two rides at once,
+                  and every driver is back in the pool at the end
+    contention    --rides rides for --drivers / 10 drivers: rides wait and
+                  retry, drivers are reused, claim conflicts are counted
+    backpressure  submits beyond max_active raise DispatcherBusy
+    cancel        half of the assigned rides are cancelled: written as
+                  cancelled, their drivers back in the pool
+    shutdown      stop() with rides mid-trip: finished ones stay completed,
+                  the rest are cancelled after drain_s, the pool is whole
+    http          POST /async_drivers, POST /async_rides and GET
+                  /async_rides/{id} until the ride completes
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+LAT_RANGE = (40.70, 40.80)
+LON_RANGE = (-74.02, -73.93)
+
+
+def make_client_factory(redis_url):
+    """Callable returning a new async client on the benchmark's Redis"""
+    if redis_url:
+        import redis.asyncio as redis
+        return lambda: redis.Redis.from_url(redis_url, decode_responses=True)
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+
+def instrumented(base):
+    """AsyncRideManager subclass timing assignments and checking no driver is held twice"""
+
+    class BenchRideManager(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.submitted_at = {}
+            self.assigned_at = {}
+            self.driver_of = {}
+            self.held = set()
+
+        async def submit(self, ride_data):
+            start = time.perf_counter()
+            ride_id = await super().submit(ride_data)
+            self.submitted_at[ride_id] = start
+            return ride_id
+
+        async def _claim_driver(self, ride_id, driver_id, *args):
+            claimed = await super()._claim_driver(ride_id, driver_id, *args)
+            if claimed:
+                if driver_id in self.held:
+                    raise AssertionError(f"driver {driver_id} claimed while still on a ride")
+                self.held.add(driver_id)
+                self.driver_of[ride_id] = driver_id
+                self.assigned_at[ride_id] = time.perf_counter()
+            return claimed
+
+        async def _finish(self, ride_id, status, driver_at=None):
+            if driver_at is not None:
+                self.held.discard(driver_at[0])  # Before the GEOADD makes it claimable again
+            await super()._finish(ride_id, status, driver_at=driver_at)
+
+        async def _abort_ride(self, ride_id, status, error):
+            self.held.discard(self.driver_of.get(ride_id))
+            await super()._abort_ride(ride_id, status, error)
+
+        async def wait_idle(self):
+            while self._tasks:
+                await asyncio.wait(set(self._tasks.values()))
+
+    return BenchRideManager
+
+
+def ride(rng: random.Random):
+    return {
+        "user_id": rng.randint(1, 10_000), "pickup_location": "a", "drop_location": "b",
+        "pickup_lat": rng.uniform(*LAT_RANGE), "pickup_lon": rng.uniform(*LON_RANGE),
+        "drop_lat": rng.uniform(*LAT_RANGE), "drop_lon": rng.uniform(*LON_RANGE), "priority": "NORMAL"
+    }
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+
+async def add_drivers(manager, count: int, rng: random.Random):
+    async with manager.redis.pipeline(transaction=False) as pipe:
+        for driver_id in range(1, count + 1):
+            pipe.geoadd(manager.drivers_key, (rng.uniform(*LON_RANGE), rng.uniform(*LAT_RANGE), driver_id))
+        await pipe.execute()
+
+
+async def statuses(manager, ride_ids):
+    async with manager.redis.pipeline(transaction=False) as pipe:
+        for ride_id in ride_ids:
+            pipe.hget(manager._ride_key(ride_id), "status")
+        return await pipe.execute()
+
+
+async def pool_size(manager) -> int:
+    return await manager.redis.zcard(manager.drivers_key)
+
+
+def percentiles_ms(samples_s):
+    ordered = sorted(samples_s)
+    return (f"p50 {statistics.median(ordered) * 1000:7.2f} ms   "
+            f"p99 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000:7.2f} ms")
+
+
+async def run_dispatch(new_manager, args, rng):
+    from app.async_ride_manager import RIDE_STAGES
+
+    manager = new_manager(max_active=args.rides, stage_s=args.stage_s)
+    await add_drivers(manager, args.drivers, rng)
+    start = time.perf_counter()
+    ride_ids = [await manager.submit(ride(rng)) for _ in range(args.rides)]
+    await manager.wait_idle()
+    elapsed = time.perf_counter() - start
+
+    check(manager.outcomes["completed"] == args.rides, f"not every ride completed: {manager.stats()}")
+    check(set(await statuses(manager, ride_ids)) == {"completed"}, "ride hash not written as completed")
+    check(await pool_size(manager) == args.drivers, "drivers missing from the pool after their rides")
+    latencies = [manager.assigned_at[ride_id] - manager.submitted_at[ride_id] for ride_id in ride_ids]
+    transitions = 3 + len(RIDE_STAGES)  # Per ride: submit, claim, stages, completion
+    searches = manager.round_trips - transitions * args.rides
+    print(f"dispatch     {args.rides:,} rides, {args.drivers:,} drivers: {args.rides / elapsed:,.0f} rides/s "
+          f"through their whole lifecycle (stage_s {args.stage_s})")
+    print(f"             submit -> driver_assigned {percentiles_ms(latencies)}")
+    print(f"             {manager.round_trips / args.rides:.1f} Redis round trips per ride: {transitions} "
+          f"transitions at 1 each + {searches / args.rides:.1f} GEOSEARCH; the old stub made 7 un-pipelined "
+          f"HSETs per ride")
+    await manager.stop()
+
+
+async def run_contention(new_manager, args, rng):
+    drivers = max(1, args.drivers // 10)
+    manager = new_manager(max_active=args.rides, stage_s=args.stage_s, retry_s=0.01,
+                          match_timeout_s=args.rides * 0.1)
+    await add_drivers(manager, drivers, rng)
+    start = time.perf_counter()
+    for _ in range(args.rides):
+        await manager.submit(ride(rng))
+    await manager.wait_idle()
+    check(manager.outcomes["completed"] == args.rides, f"rides left unmatched: {manager.stats()}")
+    check(await pool_size(manager) == drivers, "drivers missing from the pool after contention")
+    print(f"contention   {args.rides:,} rides for {drivers:,} drivers done in {time.perf_counter() - start:.1f} s, "
+          f"{manager.claim_conflicts:,} claim conflicts, no driver held twice")
+    await manager.stop()
+
+
+async def run_backpressure(new_manager, DispatcherBusy, rng):
+    manager = new_manager(max_active=10, stage_s=0.5)
+    await add_drivers(manager, 50, rng)
+    busy = 0
+    for _ in range(20):
+        try:
+            await manager.submit(ride(rng))
+        except DispatcherBusy:
+            busy += 1
+    check(busy == 10 and len(manager) == 10, f"expected 10 running and 10 rejected, got {len(manager)} / {busy}")
+    await manager.stop()
+    print(f"backpressure 20 submits at max_active 10: {busy} rejected with DispatcherBusy")
+
+
+async def run_cancel(new_manager, rng):
+    manager = new_manager(stage_s=5)
+    await add_drivers(manager, 40, rng)
+    ride_ids = [await manager.submit(ride(rng)) for _ in range(40)]
+    while len(manager.assigned_at) < len(ride_ids):
+        await asyncio.sleep(0.01)
+    check(await pool_size(manager) == 0, "assigned drivers still in the pool")
+    cancelled = ride_ids[::2]
+    for ride_id in cancelled:
+        check(await manager.cancel(ride_id), f"ride {ride_id} was not running")
+    check(set(await statuses(manager, cancelled)) == {"cancelled"}, "cancelled rides not written as cancelled")
+    check(await pool_size(manager) == len(cancelled), "cancelled rides' drivers not back in the pool")
+    manager.drain_s = 0
+    await manager.stop()
+    print(f"cancel       {len(cancelled)}/{len(ride_ids)} assigned rides cancelled: status cancelled, "
+          f"drivers back in the pool")
+
+
+async def run_shutdown(new_manager, DispatcherBusy, rng):
+    manager = new_manager(stage_s=0.3, drain_s=0.2)
+    await add_drivers(manager, 100, rng)
+    ride_ids = []
+    for _ in range(4):  # Batches 0.3 s apart: the early ones finish, the late ones are still riding after drain_s
+        ride_ids += [await manager.submit(ride(rng)) for _ in range(25)]
+        await asyncio.sleep(0.3)
+    start = time.perf_counter()
+    await manager.stop()
+    drained = time.perf_counter() - start
+    found = await statuses(manager, ride_ids)
+    check(set(found) <= {"completed", "cancelled"}, f"unexpected final states {set(found)}")
+    check(await pool_size(manager) == 100, "drivers lost on shutdown")
+    try:
+        await manager.submit(ride(rng))
+        check(False, "submit accepted after stop()")
+    except DispatcherBusy:
+        pass
+    print(f"shutdown     stop() took {drained:.2f} s (drain_s {manager.drain_s}): "
+          f"{found.count('completed')} completed, {found.count('cancelled')} cancelled, pool whole, "
+          f"new rides refused")
+
+
+def run_http(new_manager, rng):
+    from fastapi.testclient import TestClient
+    from app import main as api
+
+    api.async_ride_manager = new_manager(stage_s=0.05)
+    with TestClient(api.app) as client:
+        for driver_id in range(1, 6):
+            client.post("/async_drivers", params={"driver_id": driver_id, "latitude": rng.uniform(*LAT_RANGE),
+                                                  "longitude": rng.uniform(*LON_RANGE)}).raise_for_status()
+        response = client.post("/async_rides", json=ride(rng))
+        response.raise_for_status()
+        ride_id = response.json()["ride_id"]
+        seen = []
+        for _ in range(200):
+            status = client.get(f"/async_rides/{ride_id}").json()
+            if not seen or seen[-1] != (status["status"], status.get("stage")):
+                seen.append((status["status"], status.get("stage")))
+            if status["status"] == "completed":
+                break
+            time.sleep(0.01)
+        check(seen[-1][0] == "completed", f"ride did not complete over HTTP: {seen}")
+        check(client.get(f"/async_rides/{uuid.uuid4()}").status_code == 404, "unknown ride not a 404")
+        stats = client.get("/async_ride_manager").json()
+    print(f"http         driver {status['driver_id']} at {status['eta_minutes']} min; states seen: "
+          f"{' -> '.join(stage or state for state, stage in seen)}; stats {stats['completed']} completed")
+
+
+async def cleanup(client_factory, prefix: str):
+    client = client_factory()
+    keys = [key async for key in client.scan_iter(f"{prefix}*")]
+    if keys:
+        await client.delete(*keys)
+    await client.connection_pool.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL"),
+                        help="Redis to run against (default: $REDIS_URL, else in-process fakeredis)")
+    parser.add_argument("--rides", type=int, default=2000)
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--stage-s", type=float, default=0.01, help="Simulated time between ride stages")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'async_rides.db')}"
+    os.environ.setdefault("RIDE_POOL_NORMAL", "0")
+    os.environ.setdefault("RIDE_POOL_EMERGENCY", "0")
+    logging.disable(logging.WARNING)
+
+    from app.async_ride_manager import AsyncRideManager, DispatcherBusy
+
+    rng = random.Random(args.seed)
+    client_factory = make_client_factory(args.redis_url)
+    prefix = f"bench:{uuid.uuid4().hex[:8]}:"
+    manager_class = instrumented(AsyncRideManager)
+    phases = iter(range(1000))
+
+    def new_manager(**kwargs):
+        # A fresh pool per phase; managers share the Redis but not their keys
+        return manager_class(client_factory(), prefix=f"{prefix}{next(phases)}:", **kwargs)
+
+    print(f"redis        {args.redis_url or 'fakeredis (in-process)'}")
+    try:
+        asyncio.run(run_dispatch(new_manager, args, rng))
+        asyncio.run(run_contention(new_manager, args, rng))
+        asyncio.run(run_backpressure(new_manager, DispatcherBusy, rng))
+        asyncio.run(run_cancel(new_manager, rng))
+        asyncio.run(run_shutdown(new_manager, DispatcherBusy, rng))
+        run_http(new_manager, rng)
+    finally:
+        asyncio.run(cleanup(client_factory, prefix))
+
+
+if __name__ == "__main__":
+    main()
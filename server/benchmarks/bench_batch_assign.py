@@ -0,0 +1,135 @@
+"""
+Benchmark: repeated assign_driver vs assign_drivers_batch
+
+Run from the server/ directory:
+    python -m benchmarks.bench_batch_assign [--rides 500 --drivers 2000]
+    python -m benchmarks.bench_batch_assign --http   # through the FastAPI app
+
+Service mode drives RideService directly and reports dispatch throughput and
+total pickup ETA (greedy nearest-driver vs min-cost batch matching).
+HTTP mode runs the same comparison through POST /assign_driver (one call per
+ride) and POST /assign_drivers_batch against a throwaway SQLite database.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def build_workload(rides: int, drivers: int, emergency_share: float, seed: int):
+    rng = random.Random(seed)
+    driver_points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(drivers)]
+    ride_points = [
+        (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), rng.random() < emergency_share)
+        for _ in range(rides)
+    ]
+    return driver_points, ride_points
+
+
+def fill_service(service, driver_points, ride_points):
+    for driver_id, (lat, lon) in enumerate(driver_points, start=1):
+        service.upsert_driver(driver_id, lat, lon)
+    for ride_id, (lat, lon, emergency) in enumerate(ride_points, start=1):
+        ride_data = {"id": ride_id, "pickup": (lat, lon), "destination": (lat, lon)}
+        service.add_ride_to_queue(ride_data, "EMERGENCY" if emergency else "NORMAL")
+
+
+def report(label, assignments, elapsed):
+    total_eta = sum(a["eta_minutes"] for a in assignments)
+    print(f"{label:<28} {len(assignments):>6} rides {len(assignments) / elapsed:>10.0f} rides/s "
+          f"total ETA {total_eta:>9.1f} min")
+
+
+def run_service(args, driver_points, ride_points):
+    from app.ride_service import RideService
+
+    greedy = RideService()
+    fill_service(greedy, driver_points, ride_points)
+    start = time.perf_counter()
+    assignments = []
+    while True:
+        assignment = greedy.assign_driver()
+        if assignment is None:
+            break
+        assignments.append(assignment)
+    report("greedy assign_driver", assignments, time.perf_counter() - start)
+
+    batched = RideService()
+    fill_service(batched, driver_points, ride_points)
+    start = time.perf_counter()
+    assignments = []
+    while True:
+        batch = batched.assign_drivers_batch(max_rides=args.batch_size)
+        if not batch:
+            break
+        assignments.extend(batch)
+    report(f"batch (K={args.batch_size})", assignments, time.perf_counter() - start)
+
+
+def run_http(args, driver_points, ride_points):
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from fastapi.testclient import TestClient
+    from app.main import app, ride_service
+    from app.queue_view import QueueView
+
+    # Context manager so startup/shutdown run and the async engine is disposed
+    with TestClient(app) as client:
+        client.post("/register_drivers_bulk", json={"drivers": [
+            {"name": f"driver-{i}", "car_no": f"CAR-{i}", "latitude": lat, "longitude": lon}
+            for i, (lat, lon) in enumerate(driver_points)
+        ]})
+
+        def reset():
+            ride_service.driver_index.clear()
+            ride_service.emergency_queue.clear()
+            ride_service.normal_queue.clear()
+            ride_service.queue_view = QueueView()
+            fill_service(ride_service, driver_points, ride_points)
+
+        reset()
+        start = time.perf_counter()
+        assignments = []
+        while True:
+            response = client.post("/assign_driver")
+            if response.status_code != 200:
+                break
+            assignments.append(response.json())
+        report("POST /assign_driver xN", assignments, time.perf_counter() - start)
+
+        reset()
+        start = time.perf_counter()
+        assignments = []
+        while True:
+            response = client.post(f"/assign_drivers_batch?max_rides={args.batch_size}")
+            if response.status_code != 200:
+                break
+            assignments.extend(response.json()["assignments"])
+        report("POST /assign_drivers_batch", assignments, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rides", type=int, default=500)
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--emergency-share", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--http", action="store_true", help="Benchmark through the FastAPI endpoints")
+    args = parser.parse_args()
+
+    driver_points, ride_points = build_workload(args.rides, args.drivers, args.emergency_share, args.seed)
+    if args.http:
+        run_http(args, driver_points, ride_points)
+    else:
+        run_service(args, driver_points, ride_points)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: driver GPS ping handling in the in-memory pool
+
+Run from the server/ directory:
+    python -m benchmarks.bench_driver_pings [--drivers 50000 --rate 10000]
+
+Replays random location pings for a pool of `--drivers` drivers, with a
+small share of pings being removals (the driver got assigned). Compares the
+old list-based pool (list comprehension rebuild + append per ping,
+list.remove per assignment) with RideService.upsert_driver/remove_driver,
+and reports how much of one core `--rate` pings/sec would consume.
+"""
+
+import argparse
+import random
+import time
+
+from app.ride_service import RideService
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def make_pings(rng, drivers, count, remove_share):
+    return [
+        (rng.randrange(drivers), rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), rng.random() < remove_share)
+        for _ in range(count)
+    ]
+
+
+def replay_list(pool, pings):
+    for driver_id, lat, lon, remove in pings:
+        if remove:
+            for driver in pool:
+                if driver["id"] == driver_id:
+                    pool.remove(driver)
+                    break
+            continue
+        pool = [d for d in pool if d["id"] != driver_id]
+        pool.append({"id": driver_id, "location": (lat, lon)})
+    return pool
+
+
+def replay_service(service, pings):
+    for driver_id, lat, lon, remove in pings:
+        if remove:
+            service.remove_driver(driver_id)
+        else:
+            service.upsert_driver(driver_id, lat, lon)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=50_000)
+    parser.add_argument("--rate", type=int, default=10_000, help="Target pings per second")
+    parser.add_argument("--list-pings", type=int, default=300, help="Pings replayed on the slow list pool")
+    parser.add_argument("--remove-share", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    initial = [(i, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for i in range(args.drivers)]
+
+    pool = [{"id": i, "location": (lat, lon)} for i, lat, lon in initial]
+    pings = make_pings(rng, args.drivers, args.list_pings, args.remove_share)
+    start = time.perf_counter()
+    replay_list(pool, pings)
+    list_per_ping = (time.perf_counter() - start) / len(pings)
+
+    service = RideService()
+    for i, lat, lon in initial:
+        service.upsert_driver(i, lat, lon)
+    pings = make_pings(rng, args.drivers, args.rate, args.remove_share)
+    start = time.perf_counter()
+    replay_service(service, pings)
+    service_per_ping = (time.perf_counter() - start) / len(pings)
+
+    print(f"pool: {args.drivers} drivers, target {args.rate} pings/sec")
+    for label, per_ping in (("list rebuild", list_per_ping), ("RideService", service_per_ping)):
+        print(f"{label:<13} {per_ping * 1e6:>10.2f} us/ping  max {1 / per_ping:>12.0f} pings/s  "
+              f"core usage at target {per_ping * args.rate * 100:>8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
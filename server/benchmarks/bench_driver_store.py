@@ -0,0 +1,82 @@
+"""
+Benchmark: dict-per-driver pool vs DriverLocationStore
+
+Run from the server/ directory:
+    python -m benchmarks.bench_driver_store [--drivers 100000]
+
+Reports bytes per driver of the two representations and the time of one
+full-pool nearest-driver scan (scalar math loop vs one NumPy pass).
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from app.driver_store import DriverLocationStore
+from app.geo import haversine_km
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def dict_pool_bytes(pool):
+    total = sys.getsizeof(pool)
+    for driver in pool:
+        lat, lon = driver["location"]
+        total += sys.getsizeof(driver) + sys.getsizeof(driver["id"]) + sys.getsizeof(driver["location"])
+        total += sys.getsizeof(lat) + sys.getsizeof(lon)
+    return total
+
+
+def scan_dicts(pool, lat, lon):
+    best = None
+    min_distance = float('inf')
+    for driver in pool:
+        driver_lat, driver_lon = driver["location"]
+        distance = haversine_km(lat, lon, driver_lat, driver_lon)
+        if distance < min_distance:
+            min_distance = distance
+            best = driver
+    return min_distance, best["id"]
+
+
+def best_of(repeats, fn, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pool = []
+    store = DriverLocationStore()
+    for driver_id in range(args.drivers):
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        pool.append({"id": driver_id, "location": (lat, lon)})
+        store.upsert(driver_id, lat, lon)
+
+    array_bytes = (store.lat.itemsize + store.lon.itemsize + store.ids.itemsize)
+    print(f"drivers: {args.drivers}")
+    print(f"dict pool:   {dict_pool_bytes(pool) / args.drivers:8.1f} bytes/driver")
+    print(f"array store: {array_bytes:8.1f} bytes/driver (+ id->slot dict entry)")
+
+    query = (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+    assert scan_dicts(pool, *query)[1] == store.nearest(*query)[0][1]
+    scalar = best_of(args.repeats, scan_dicts, pool, *query)
+    vector = best_of(args.repeats, store.nearest, *query)
+    print(f"full scan, scalar loop: {scalar:8.2f} ms")
+    print(f"full scan, NumPy pass:  {vector:8.2f} ms  ({scalar / vector:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Simulation: the emergency pickup guarantee at 1k emergency rides per minute
+
+Run from the server/ directory:
+    python -m benchmarks.bench_emergency_deadlines [--emergency-per-min 1000 --minutes 10]
+
+Drives RideService on a simulated clock in one-second steps (DeadlineScheduler
+gets the simulation time as its clock, so nothing sleeps):
+
+    arrivals      --emergency-per-min emergency and --normal-per-min normal
+                  rides (Poisson), pickups and drops uniform over a
+                  --city-km square. Emergency rides get guaranteed_by = now +
+                  5 min and are tried at once, as /request_emergency_ride does
+    dispatch      every --dispatch-every seconds up to --batch queued rides
+                  are matched (/assign_drivers_batch)
+    drivers       --drivers at 30 km/h: an assigned driver reaches the pickup
+                  after its ETA, drives the trip and rejoins the pool at the
+                  drop-off. A pre-empted driver turns towards the emergency
+                  pickup instead
+
+The same arrivals run twice:
+
+    baseline      pre-emption off (preempt_before_s=0); the timer wheel
+                  only counts missed deadlines
+    scheduler     escalate_deadlines() every second: at-risk rides are
+                  batch-matched over widened candidates, and rides about to
+                  miss take a driver headed to a normal pickup, as do rides
+                  whose nearest free driver would be late on arrival
+
+Reported per policy: guarantee hit rate over the emergency rides decided,
+slack p05/p50, rides still waiting at the end, widened and pre-empted
+dispatches, and the wall time of a scheduler tick.
+"""
+
+import argparse
+import heapq
+import logging
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+KM_PER_DEGREE = 111.195
+ORIGIN = (40.72, -74.00)
+SPEED_KMH = 30
+
+
+class SimClock:
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def point(rng: random.Random, city_km: float):
+    lat = ORIGIN[0] + rng.uniform(0, city_km) / KM_PER_DEGREE
+    lon = ORIGIN[1] + rng.uniform(0, city_km) / (KM_PER_DEGREE * math.cos(math.radians(ORIGIN[0])))
+    return lat, lon
+
+
+def arrivals(args, seed: int):
+    """Per simulated second: list of (is_emergency, pickup, drop)"""
+    rng = random.Random(seed)
+    seconds = []
+    for _ in range(int(args.minutes * 60)):
+        rides = [(True, point(rng, args.city_km), point(rng, args.city_km))
+                 for _ in range(poisson(rng, args.emergency_per_min / 60))]
+        rides += [(False, point(rng, args.city_km), point(rng, args.city_km))
+                  for _ in range(poisson(rng, args.normal_per_min / 60))]
+        rng.shuffle(rides)
+        seconds.append(rides)
+    return seconds
+
+
+def poisson(rng: random.Random, mean: float) -> int:
+    threshold, count, product = math.exp(-mean), 0, rng.random()
+    while product > threshold:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def simulate(args, schedule, escalate: bool):
+    from app.deadline_scheduler import EMERGENCY_GUARANTEE, DeadlineScheduler
+    from app.ride_service import RideService
+
+    clock = SimClock(time.time())
+    service = RideService()
+    service.deadlines = DeadlineScheduler(preempt_before_s=120.0 if escalate else 0.0, clock=clock)
+    rng = random.Random(args.seed)
+    for driver_id in range(1, args.drivers + 1):
+        service.upsert_driver(driver_id, *point(rng, args.city_km))
+
+    trips = {}  # ride id -> drop
+    jobs = {}  # driver id -> job number; a pre-empted driver's old arrival is stale
+    arrivals_heap = []  # (free_at, job, driver_id, drop)
+    tick_times = []
+    ride_id = 0
+
+    def dispatched(assignment):
+        driver_id = assignment["driver"]["id"]
+        request = assignment["request"]
+        pickup, drop = request["pickup"], trips[request["id"]]
+        trip_km = service.haversine_distance(*pickup, *drop)
+        free_at = clock.now + assignment["eta_minutes"] * 60 + trip_km / SPEED_KMH * 3600
+        jobs[driver_id] = jobs.get(driver_id, 0) + 1
+        heapq.heappush(arrivals_heap, (free_at, jobs[driver_id], driver_id, drop))
+
+    for second, rides in enumerate(schedule):
+        clock.now += 1
+        while arrivals_heap and arrivals_heap[0][0] <= clock.now:
+            _, job, driver_id, drop = heapq.heappop(arrivals_heap)
+            if jobs[driver_id] == job:
+                service.upsert_driver(driver_id, *drop)
+
+        for is_emergency, pickup, drop in rides:
+            ride_id += 1
+            trips[ride_id] = drop
+            ride_data = {"id": ride_id, "user_id": ride_id, "pickup": pickup, "destination": drop,
+                         "priority": "EMERGENCY" if is_emergency else "NORMAL"}
+            if is_emergency:
+                ride_data["guaranteed_by"] = datetime.fromtimestamp(clock.now + EMERGENCY_GUARANTEE.total_seconds()
+                                                                    ).isoformat()
+                service.add_ride_to_queue(ride_data, "EMERGENCY")
+                if service.has_available_drivers():
+                    dispatched(service.assign_driver())
+            else:
+                service.add_ride_to_queue(ride_data, "NORMAL")
+
+        if second % args.dispatch_every == 0:
+            for assignment in service.assign_drivers_batch(max_rides=args.batch):
+                dispatched(assignment)
+
+        start = time.perf_counter()
+        if escalate:
+            for assignment in service.escalate_deadlines():
+                dispatched(assignment)
+        else:
+            service.deadlines.advance()
+        tick_times.append(time.perf_counter() - start)
+
+    return service, tick_times
+
+
+def report(name: str, service, tick_times):
+    stats = service.deadlines.stats()
+    status = service.get_queue_status()
+    ordered = sorted(tick_times)
+    print(f"{name:<12} hit rate {stats['hit_rate']:.1%} ({stats['hits']:,} hit, {stats['misses']:,} missed), "
+          f"slack p05 {stats['slack_p05_s']:+.0f} s p50 {stats['slack_p50_s']:+.0f} s; "
+          f"{status['emergency_count']:,} emergency / {status['normal_count']:,} normal still queued")
+    print(f"{'':<12} {stats['escalations']['widened']:,} widened, {stats['escalations']['preempted']:,} "
+          f"pre-empted; tick p50 {statistics.median(ordered) * 1000:.2f} ms, "
+          f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:.2f} ms")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emergency-per-min", type=float, default=1000)
+    parser.add_argument("--normal-per-min", type=float, default=1000)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--drivers", type=int, default=9_000)
+    parser.add_argument("--city-km", type=float, default=6)
+    parser.add_argument("--dispatch-every", type=int, default=5, help="Seconds between batch dispatches")
+    parser.add_argument("--batch", type=int, default=200, help="Rides per batch dispatch")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'deadlines.db')}"
+    os.environ.setdefault("RIDE_POOL_NORMAL", "0")
+    os.environ.setdefault("RIDE_POOL_EMERGENCY", "0")
+    logging.disable(logging.WARNING)
+
+    schedule = arrivals(args, args.seed)
+    emergency = sum(is_emergency for rides in schedule for is_emergency, _, _ in rides)
+    print(f"simulated    {args.minutes:.0f} min, {emergency:,} emergency + "
+          f"{sum(map(len, schedule)) - emergency:,} normal rides, {args.drivers:,} drivers in a "
+          f"{args.city_km:.0f} km square")
+    baseline = report("baseline", *simulate(args, schedule, escalate=False))
+    scheduler = report("scheduler", *simulate(args, schedule, escalate=True))
+    if scheduler["hit_rate"] is not None and baseline["hit_rate"] is not None \
+            and scheduler["hit_rate"] + 1e-9 < baseline["hit_rate"]:
+        raise AssertionError("escalation lowered the guarantee hit rate")
+
+
+if __name__ == "__main__":
+    main()
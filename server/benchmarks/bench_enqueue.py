@@ -0,0 +1,164 @@
+"""
+Benchmark: enqueue cost as the ride queue grows to 100k
+
+Run from the server/ directory:
+    python -m benchmarks.bench_enqueue [--depths 0 1000 10000 100000]
+
+For every depth the queues are pre-filled (a --emergency-share of rides in
+the emergency heap, the rest in the FIFO queue) and then timed per enqueue:
+
+    legacy        add_ride_to_queue + len(ride_queue) + 1, the old fallback
+                  ride id (sorts the heap and copies both queues)
+    service       add_ride_to_queue + queue_length()
+    http          POST /add_to_queue?ride_id=..., in-process against a
+                  throwaway SQLite database holding the pending rides (one
+                  primary-key lookup per call)
+
+Flat service/http columns mean the enqueue cost no longer depends on how
+many rides are waiting.
+
+    python -m benchmarks.bench_enqueue --logging
+
+instead compares enqueue throughput with logging enabled, written to
+/dev/null: the old setup (basicConfig stream handler on the calling thread,
+three f-string INFO lines per enqueue) against app.logging_config (queue
+handler + listener thread, %-style arguments, per-message sampling), with
+the per-ride INFO event on and off.
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def ride(ride_id: int, rng):
+    lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+    return {"id": ride_id, "user_id": ride_id, "pickup": (lat, lon), "destination": (lat, lon)}
+
+
+def prefill(service, depth: int, emergency_share: float, rng):
+    for ride_id in range(1, depth + 1):
+        service.add_ride_to_queue(ride(ride_id, rng), "EMERGENCY" if rng.random() < emergency_share else "NORMAL")
+
+
+def per_call_us(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def legacy_enqueue(service, legacy_logger):
+    """add_ride_to_queue with the per-enqueue logging it used to do"""
+    def enqueue(ride_data, priority="NORMAL"):
+        priority_str = str(priority).upper()
+        legacy_logger.info(f"add_ride_to_queue called with priority={priority!r}, priority_str={priority_str!r}")
+        legacy_logger.info(f"Check: 'EMERGENCY' in priority_str = {'EMERGENCY' in priority_str}")
+        legacy_logger.info(f"Adding to {'EMERGENCY' if 'EMERGENCY' in priority_str else 'NORMAL'} queue")
+        return service.add_ride_to_queue(ride_data, priority)
+    return enqueue
+
+
+def run_logging(args):
+    from app import logging_config
+    from app.ride_service import RideService
+
+    rng = random.Random(args.seed)
+    devnull = open(os.devnull, "w")
+    service_logger = logging.getLogger("app.ride_service")
+
+    def throughput(label, enqueue):
+        start = time.perf_counter()
+        for i in range(args.calls):
+            enqueue(ride(i, rng), "EMERGENCY" if i % 5 == 0 else "NORMAL")
+        elapsed = time.perf_counter() - start
+        print(f"{label:<44} {args.calls / elapsed:>10.0f} enqueues/s")
+
+    # Old setup: basicConfig's handler formats and writes on the calling thread
+    legacy_logger = logging.getLogger("bench.legacy")
+    legacy_logger.addHandler(logging.StreamHandler(devnull))
+    legacy_logger.setLevel(logging.INFO)
+    legacy_logger.propagate = False
+    service_logger.setLevel(logging.WARNING)  # Its new INFO line is not part of the old setup
+    throughput("blocking handler, 3 f-string INFO lines", legacy_enqueue(RideService(), legacy_logger))
+
+    logging_config.configure_logging(stream=devnull)
+    service_logger.setLevel(logging.INFO)
+    throughput("queue handler, sampled INFO per ride", RideService().add_ride_to_queue)
+    service_logger.setLevel(logging.WARNING)
+    throughput("queue handler, per-ride INFO off", RideService().add_ride_to_queue)
+    logging_config.stop_logging()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1000, 10_000, 100_000])
+    parser.add_argument("--calls", type=int, default=2000, help="Timed enqueues per depth and path")
+    parser.add_argument("--legacy-calls", type=int, default=50, help="Timed legacy enqueues (O(n log n) each)")
+    parser.add_argument("--emergency-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--logging", action="store_true", help="Compare logging setups instead of queue depths")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'enqueue.db')}"
+    os.environ.setdefault("RIDE_POOL_NORMAL", "0")
+    os.environ.setdefault("RIDE_POOL_EMERGENCY", "0")
+    if args.logging:
+        run_logging(args)
+        return
+    logging.disable(logging.INFO)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import insert
+    from app import main, models
+    from app.database import SessionLocal
+    from app.ride_service import RideService
+
+    rng = random.Random(args.seed)
+    payload = {"user_id": 1, "pickup_location": "a", "drop_location": "b",
+               "pickup_lat": 40.71, "pickup_lon": -74.0, "drop_lat": 40.75, "drop_lon": -73.98}
+
+    print(f"{'depth':>8} {'legacy us/op':>14} {'service us/op':>14} {'http us/op':>12}")
+    next_id = 1  # Rides inserted for the http column; ids never repeat across depths
+    with TestClient(main.app) as client:
+        for depth in args.depths:
+            service = RideService()
+            prefill(service, depth, args.emergency_share, rng)
+
+            def legacy(i):
+                service.add_ride_to_queue(ride(depth + i, rng))
+                return len(service.ride_queue) + 1
+            legacy_us = per_call_us(legacy, args.legacy_calls)
+
+            def constant(i):
+                service.add_ride_to_queue(ride(depth + i, rng))
+                return service.queue_length()
+            service_us = per_call_us(constant, args.calls)
+
+            # The endpoint uses the module-level service; swap in the pre-filled one
+            main.ride_service = service
+            first_id, next_id = next_id, next_id + args.calls
+            with SessionLocal() as db:
+                # /add_to_queue only queues pending rides that already exist
+                db.execute(insert(models.RideRequest.__table__), [
+                    dict(payload, id=first_id + i, status="pending") for i in range(args.calls)
+                ])
+                db.commit()
+
+            def http(i):
+                response = client.post("/add_to_queue", params={"ride_id": first_id + i}, json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/add_to_queue failed: {response.status_code} {response.text}")
+            http_us = per_call_us(http, args.calls)
+
+            print(f"{depth:>8} {legacy_us:>14.1f} {service_us:>14.1f} {http_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
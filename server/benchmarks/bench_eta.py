@@ -0,0 +1,196 @@
+"""
+Benchmark: road-network ETA engine on a city-sized graph
+
+Run from the server/ directory:
+    python -m benchmarks.bench_eta [--grid 300 --queries 500]
+    python -m benchmarks.bench_eta --osm city.osm   # a real OpenStreetMap extract
+
+Without --osm a synthetic city is generated: a --grid x --grid street grid
+(100 m blocks, 90k nodes and ~330k directed edges at 300) with 50 km/h
+avenues every 10th street, one-way residential streets, a few percent of
+blocks closed, and a river down the middle crossed by --bridges bridges.
+
+Reports graph preparation (contraction hierarchy, cache save/load),
+snapping, and query latency with p50/p99:
+
+    route         point-to-point contraction hierarchy query (pricing),
+                  against plain Dijkstra on the same pairs (answers checked)
+    routes_to     a pickup's k nearest drivers (dispatch), for each of
+                  --candidates
+
+and dispatch quality: how often the straight-line nearest driver is not
+the fastest by road, and the pickup ETA that choosing by road saves.
+"""
+
+import argparse
+import heapq
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.geo import KM_PER_DEGREE
+from app.road_network import EtaEngine, RoadGraph
+from app.spatial_index import DriverGridIndex
+
+ORIGIN = (40.70, -74.02)
+BLOCK_M = 100
+
+
+def city_graph(size: int, bridges: int, seed: int):
+    rng = random.Random(seed)
+    lat_step = BLOCK_M / (KM_PER_DEGREE * 1000)
+    lon_step = lat_step / math.cos(math.radians(ORIGIN[0]))
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat = ORIGIN[0] + rows * lat_step + np.array([rng.uniform(-0.1, 0.1) for _ in range(size * size)]) * lat_step
+    lon = ORIGIN[1] + cols * lon_step + np.array([rng.uniform(-0.1, 0.1) for _ in range(size * size)]) * lon_step
+
+    river = size // 2
+    bridge_rows = {int((i + 0.5) * size / bridges) for i in range(bridges)}
+    edge_u, edge_v, speeds = [], [], []
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for d_row, d_col in ((0, 1), (1, 0)):
+                next_row, next_col = row + d_row, col + d_col
+                if next_row >= size or next_col >= size:
+                    continue
+                if d_col and col == river and row not in bridge_rows:
+                    continue
+                avenue = (row % 10 == 0) if d_col else (col % 10 == 0)
+                if not avenue and rng.random() < 0.03:
+                    continue  # Closed block
+                speed = 50 if avenue else 25
+                oneway = 0 if avenue or rng.random() < 0.5 else (1 if (row + col) % 2 else -1)
+                next_node = next_row * size + next_col
+                if oneway >= 0:
+                    edge_u.append(node)
+                    edge_v.append(next_node)
+                    speeds.append(speed)
+                if oneway <= 0:
+                    edge_u.append(next_node)
+                    edge_v.append(node)
+                    speeds.append(speed)
+    return RoadGraph.from_edges(lat, lon, np.array(edge_u), np.array(edge_v), np.array(speeds, dtype=np.float64))
+
+
+def dijkstra(graph: RoadGraph, source, target) -> float:
+    """Plain one-directional Dijkstra over the original edges, for comparison"""
+    finish = {node: seconds for node, seconds, _ in graph._entries(target)}
+    best = graph._along_segment(source, target)[0]
+    dist = {}
+    heap = [(seconds, node) for node, seconds, _ in graph._exits(source)]
+    heapq.heapify(heap)
+    while heap:
+        seconds, node = heapq.heappop(heap)
+        if seconds >= best:
+            break
+        if node in dist:
+            continue
+        dist[node] = seconds
+        if node in finish:
+            best = min(best, seconds + finish[node])
+        for next_node, edge_s, _ in graph.out_edges[node]:
+            if next_node not in dist:
+                heapq.heappush(heap, (seconds + edge_s, next_node))
+    return best
+
+
+def percentiles(samples_s):
+    ordered = sorted(samples_s)
+    p50 = statistics.median(ordered) * 1000
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+    return f"p50 {p50:7.2f} ms   p99 {p99:7.2f} ms"
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def random_point(graph: RoadGraph, rng: random.Random):
+    node = rng.randrange(len(graph))
+    return float(graph.lat[node]) + rng.uniform(-3e-4, 3e-4), float(graph.lon[node]) + rng.uniform(-3e-4, 3e-4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--osm", help="OpenStreetMap XML extract instead of the synthetic city")
+    parser.add_argument("--grid", type=int, default=300, help="Synthetic city: streets per side")
+    parser.add_argument("--bridges", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--drivers", type=int, default=5000)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    build_s, graph = timed(RoadGraph.from_osm, args.osm) if args.osm else \
+        timed(city_graph, args.grid, args.bridges, args.seed)
+    print(f"graph        {len(graph):,} nodes, {len(graph.edge_u):,} edges, {len(graph.segment_a):,} segments "
+          f"built in {build_s:.1f} s")
+    contract_s, _ = timed(graph.contract)
+    cache = os.path.join(tempfile.mkdtemp(), "city.eta.npz")
+    save_s, _ = timed(graph.save, cache)
+    load_s, graph = timed(RoadGraph.load, cache)
+    shortcuts = sum(map(len, graph.up_out)) + sum(map(len, graph.up_in)) - len(graph.edge_u)
+    print(f"prepare      contracted in {contract_s:.1f} s ({shortcuts:,} shortcuts), cache "
+          f"{os.path.getsize(cache) / 1e6:.0f} MB saved {save_s:.2f} s, loaded {load_s:.2f} s")
+    engine = EtaEngine(graph)
+
+    points = [random_point(graph, rng) for _ in range(args.queries * 2)]
+    snap_times = [timed(graph.snap, lat, lon, engine.max_snap_m)[0] for lat, lon in points]
+    print(f"snap         {percentiles(snap_times)}")
+
+    # Point-to-point, hierarchy vs plain Dijkstra
+    pairs = [(graph.snap(*points[2 * i], engine.max_snap_m), graph.snap(*points[2 * i + 1], engine.max_snap_m))
+             for i in range(args.queries)]
+    pairs = [(source, target) for source, target in pairs if source and target]
+    hierarchy_times, dijkstra_times = [], []
+    for source, target in pairs:
+        elapsed, (fast, _) = timed(graph.shortest, source, target)
+        hierarchy_times.append(elapsed)
+        elapsed, plain = timed(dijkstra, graph, source, target)
+        dijkstra_times.append(elapsed)
+        if not math.isclose(fast, plain, rel_tol=1e-9, abs_tol=1e-6):
+            raise AssertionError(f"hierarchy {fast} s != Dijkstra {plain} s")
+    print(f"route CH     {percentiles(hierarchy_times)}   ({len(pairs)} random pairs across the city)")
+    print(f"route plain  {percentiles(dijkstra_times)}   (Dijkstra, same answers)")
+
+    # One-to-many from k nearest drivers, as dispatch asks
+    index = DriverGridIndex()
+    for driver_id in range(args.drivers):
+        index.insert(driver_id, *random_point(graph, rng))
+    pickups = points[:args.queries]
+    for k in args.candidates:
+        times = []
+        for lat, lon in pickups:
+            nearby = index.nearest(lat, lon, k=k)
+            elapsed, _ = timed(engine.routes_to, lat, lon, [index.get(driver_id) for _, driver_id in nearby])
+            times.append(elapsed)
+        print(f"routes_to {k:<3}{percentiles(times)}   ({args.drivers:,} drivers)")
+
+    # Dispatch quality: straight-line nearest vs fastest by road among the same candidates
+    k = max(args.candidates)
+    differs, saved = 0, []
+    for lat, lon in pickups:
+        nearby = index.nearest(lat, lon, k=k)
+        routes = engine.routes_to(lat, lon, [index.get(driver_id) for _, driver_id in nearby])
+        if routes[0] is None:
+            continue
+        fastest = min((route.minutes for route in routes if route is not None))
+        if fastest < routes[0].minutes - 1e-9:
+            differs += 1
+            saved.append(routes[0].minutes - fastest)
+    print(f"dispatch     nearest driver by straight line is not the fastest by road for {differs}/{len(pickups)} "
+          f"pickups; choosing by road saves {statistics.mean(saved) if saved else 0:.1f} min on those "
+          f"(max {max(saved, default=0):.1f})")
+
+
+if __name__ == "__main__":
+    main()
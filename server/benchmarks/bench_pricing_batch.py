@@ -0,0 +1,63 @@
+"""
+Benchmark: per-quote cost of calculate_fare vs calculate_fares
+
+Run from the server/ directory:
+    python -m benchmarks.bench_pricing_batch [--sizes 1 100 10000]
+
+For each batch size, prices the same random trips once per trip with
+calculate_fare (surge recomputed every call, like /calculate_price) and once
+with a single calculate_fares call, and reports microseconds per quote.
+"""
+
+import argparse
+import random
+import time
+
+from app.pricing import PricingCalculator
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def timed(repeats, fn):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'batch':>7} {'calculate_fare us/quote':>24} {'calculate_fares us/quote':>25} {'speedup':>8}")
+    for size in args.sizes:
+        trips = [
+            (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+            for _ in range(size)
+        ]
+        emergency = [rng.random() < 0.1 for _ in range(size)]
+        columns = list(zip(*trips))
+
+        def one_by_one():
+            for trip, is_emergency in zip(trips, emergency):
+                PricingCalculator.calculate_fare(*trip, is_emergency=is_emergency, queue_length=12,
+                                                 available_drivers=5)
+
+        def batched():
+            PricingCalculator.calculate_fares(*columns, is_emergency=emergency, queue_length=12,
+                                              available_drivers=5)
+
+        single = timed(args.repeats, one_by_one) / size * 1e6
+        batch = timed(args.repeats, batched) / size * 1e6
+        print(f"{size:>7} {single:>24.2f} {batch:>25.2f} {single / batch:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: /calculate_price with and without the quote cache
+
+Run from the server/ directory:
+    python -m benchmarks.bench_quote_cache [--riders 1000 --edits 20]
+
+Every rider picks a random trip around Manhattan and re-quotes it --edits
+times while "dragging the pickup pin" (each edit moves the pickup up to
+--jitter-m meters). The same quote stream is priced:
+
+    exact         surge lookup + PricingCalculator.calculate_fare per quote
+    cached        QuoteCache.quote (grid --grid-deg, cap --max-mb)
+    http          POST /calculate_price in-process, cache off vs on
+
+and the report gives the hit rate, how far the snapped quotes are from the
+exact fares, and what a surge epoch change and a small --max-mb do to the
+entries (invalidations, evictions).
+"""
+
+import argparse
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+METERS_PER_DEG = 111_195
+
+
+def quote_stream(args, rng: random.Random):
+    quotes = []
+    for _ in range(args.riders):
+        pickup = [rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)]
+        drop = (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+        emergency = rng.random() < 0.1
+        for _ in range(args.edits):
+            quotes.append((pickup[0], pickup[1], drop[0], drop[1], emergency))
+            step = args.jitter_m / METERS_PER_DEG
+            pickup[0] += rng.uniform(-step, step)
+            pickup[1] += rng.uniform(-step, step) / math.cos(math.radians(pickup[0]))
+    return quotes
+
+
+def per_quote_us(fn, quotes) -> float:
+    start = time.perf_counter()
+    for quote in quotes:
+        fn(*quote)
+    return (time.perf_counter() - start) / len(quotes) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--riders", type=int, default=1000)
+    parser.add_argument("--edits", type=int, default=20, help="Quotes per rider while the pin moves")
+    parser.add_argument("--jitter-m", type=float, default=15, help="Largest pin move between quotes")
+    parser.add_argument("--grid-deg", type=float, default=0.0005)
+    parser.add_argument("--max-mb", type=float, default=16)
+    parser.add_argument("--http-quotes", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'quotes.db')}"
+    os.environ.setdefault("RIDE_POOL_NORMAL", "0")
+    os.environ.setdefault("RIDE_POOL_EMERGENCY", "0")
+    logging.disable(logging.INFO)
+
+    from fastapi.testclient import TestClient
+    from app import main as api
+    from app.pricing import PricingCalculator
+    from app.quote_cache import QuoteCache
+    from app.surge import SurgeEngine
+
+    rng = random.Random(args.seed)
+    quotes = quote_stream(args, rng)
+    surge = SurgeEngine()
+    for _ in range(5000):
+        surge.ride_queued(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+    surge.tick()
+
+    def exact(pickup_lat, pickup_lon, drop_lat, drop_lon, emergency):
+        return PricingCalculator.calculate_fare(pickup_lat, pickup_lon, drop_lat, drop_lon, is_emergency=emergency,
+                                                surge_multiplier=surge.multiplier_for(pickup_lat, pickup_lon))
+
+    cache = QuoteCache(grid_deg=args.grid_deg, max_mb=args.max_mb)
+
+    def cached(pickup_lat, pickup_lon, drop_lat, drop_lon, emergency):
+        return cache.quote(pickup_lat, pickup_lon, drop_lat, drop_lon, is_emergency=emergency, surge=surge)
+
+    exact_us = per_quote_us(exact, quotes)
+    cached_us = per_quote_us(cached, quotes)
+    stats = cache.stats()
+    print(f"{len(quotes):,} quotes ({args.riders:,} riders x {args.edits} pin edits of up to {args.jitter_m:.0f} m)")
+    print(f"exact        {exact_us:8.1f} us/quote")
+    print(f"cached       {cached_us:8.1f} us/quote   hit rate {stats['hit_rate']:.1%}, {stats['entries']:,} entries, "
+          f"~{stats['approx_bytes'] / 1e6:.1f} MB ({stats['approx_bytes'] // max(stats['entries'], 1)} B/entry)")
+
+    deviations = [abs(cached(*quote)["total_fare"] - exact(*quote)["total_fare"]) for quote in quotes[::10]]
+    relative = [abs(cached(*quote)["total_fare"] / exact(*quote)["total_fare"] - 1) for quote in quotes[::10]]
+    print(f"snapping     fare differs from the exact quote by ${sum(deviations) / len(deviations):.3f} on average "
+          f"(max ${max(deviations):.2f}, {max(relative):.2%})")
+
+    # A surge change bumps the epoch; the next quote drops every entry priced under the old one
+    surge.ride_queued(40.75, -73.98)
+    for _ in range(30):
+        surge.ride_queued(40.75, -73.98)
+    surge.tick()
+    cached(*quotes[0])
+    print(f"surge tick   epoch {stats['surge_epoch']} -> {surge.epoch}: {cache.stats()['invalidations']:,} entries "
+          f"invalidated")
+
+    small = QuoteCache(grid_deg=args.grid_deg, max_mb=0.5)
+    for quote in quotes:
+        small.quote(*quote[:4], is_emergency=quote[4], surge=surge)
+    small_stats = small.stats()
+    print(f"0.5 MB cap   {small_stats['entries']:,} entries kept, {small_stats['evictions']:,} evicted, "
+          f"hit rate {small_stats['hit_rate']:.1%}")
+
+    with TestClient(api.app) as client:
+        api.ride_service.surge = surge
+
+        def http(pickup_lat, pickup_lon, drop_lat, drop_lon, emergency):
+            response = client.post("/calculate_price", json={
+                "pickup_lat": pickup_lat, "pickup_lon": pickup_lon, "drop_lat": drop_lat, "drop_lon": drop_lon,
+                "is_emergency": emergency
+            })
+            if response.status_code != 200:
+                raise RuntimeError(f"/calculate_price failed: {response.status_code} {response.text}")
+
+        sample = quotes[:args.http_quotes]
+        api.quote_cache = QuoteCache(max_mb=0)
+        off_us = per_quote_us(http, sample)
+        api.quote_cache = QuoteCache(grid_deg=args.grid_deg, max_mb=args.max_mb)
+        on_us = per_quote_us(http, sample)
+        print(f"http         {off_us:8.1f} us/quote cache off, {on_us:8.1f} us/quote cache on "
+              f"(hit rate {api.quote_cache.stats()['hit_rate']:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Benchmark: database load of ride status updates at 10k connected clients
+
+Run from the server/ directory:
+    python -m benchmarks.bench_ride_events [--clients 10000 --duration 30 --assign-rate 20]
+
+Starts the API under uvicorn in a child process (throwaway SQLite, statement
+counter on both engines) and compares, for --clients riders:
+
+    polling     every rider GETs /active_rides/user/{id} every --poll-interval
+                seconds, the UI's old behaviour. --poll-sample real polls are
+                timed and counted; the QPS at --clients is that statement
+                count per poll x clients / poll interval
+    push        every rider holds a /ws/rides WebSocket open for --duration
+                seconds while rides are queued and assigned at --assign-rate
+                per second. Measured: database statements per second with
+                the sockets idle and with assignments flowing (including the
+                one /active_rides refetch each notified rider does), and
+                assignment -> event delivery latency
+
+Needs the `websockets` client package (installed with uvicorn[standard]).
+The child needs one descriptor per socket, as does this process; raise
+`ulimit -n` above --clients if connections fail.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def serve(port: int):
+    """Child process: the app plus a route reporting statements executed so far"""
+    import logging
+    import uvicorn
+    from sqlalchemy import event
+    from app.database import async_engine, engine
+    from app.main import app
+
+    statements = {"count": 0}
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements["count"] += 1
+
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", count)
+
+    @app.get("/_bench/statements")
+    def get_statement_count():
+        return statements
+
+    logging.disable(logging.WARNING)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="error", ws="websockets", backlog=4096)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def statement_count(http) -> int:
+    return (await http.get("/_bench/statements")).json()["count"]
+
+
+async def run_polling(http, args):
+    start_count = await statement_count(http)
+    start = time.perf_counter()
+    for user_id in range(1, args.poll_sample + 1):
+        await http.get(f"/active_rides/user/{user_id}")
+    elapsed = time.perf_counter() - start
+    per_poll = (await statement_count(http) - start_count) / args.poll_sample
+    qps = per_poll * args.clients / args.poll_interval
+    print(f"polling     {per_poll:.1f} statements/poll, {elapsed / args.poll_sample * 1000:.2f} ms/poll -> "
+          f"{qps:,.0f} statements/s at {args.clients:,} clients every {args.poll_interval:.0f} s")
+
+
+async def run_push(http, base_ws, args):
+    import websockets
+
+    received = {}  # ride_id -> receive time
+    refetches = []
+
+    async def client(user_id: int, opened: list):
+        async with websockets.connect(f"{base_ws}/ws/rides?user_id={user_id}", max_queue=16) as ws:
+            opened.append(user_id)
+            async for message in ws:
+                event = json.loads(message)
+                if event["type"] == "ride_assigned":
+                    received[event["ride_id"]] = time.perf_counter()
+                    # What the UI does on an event: refetch its rides once
+                    refetches.append(asyncio.create_task(http.get(f"/active_rides/user/{user_id}")))
+
+    opened = []
+    start = time.perf_counter()
+    tasks = []
+    for first in range(1, args.clients + 1, 500):
+        batch = [asyncio.create_task(client(user_id, opened))
+                 for user_id in range(first, min(first + 500, args.clients + 1))]
+        tasks.extend(batch)
+        while len(opened) < len(tasks) and not any(task.done() for task in batch):
+            await asyncio.sleep(0.01)
+    failed = [task for task in tasks if task.done()]
+    if failed:
+        raise RuntimeError(f"{len(failed)} WebSocket clients failed: {failed[0].exception()!r}")
+    print(f"push        {args.clients:,} WebSockets open in {time.perf_counter() - start:.1f} s")
+
+    window = args.duration / 2
+    before = await statement_count(http)
+    await asyncio.sleep(window)
+    idle_qps = (await statement_count(http) - before) / window
+    print(f"push idle   {idle_qps:,.1f} statements/s")
+
+    rng = random.Random(args.seed)
+    sent = {}
+    before = await statement_count(http)
+    start = time.perf_counter()
+    while time.perf_counter() - start < window:
+        tick = time.perf_counter()
+        for _ in range(args.assign_rate):
+            user_id = rng.randint(1, args.clients)
+            ride = {"user_id": user_id, "pickup_location": "a", "drop_location": "b",
+                    "pickup_lat": 40.71, "pickup_lon": -74.0, "drop_lat": 40.75, "drop_lon": -73.98}
+            ride_id = (await http.post("/request_ride", json=ride)).json()["id"]
+            await http.post("/add_to_queue", params={"ride_id": ride_id}, json=ride)
+            assign_start = time.perf_counter()
+            if (await http.post("/assign_driver")).status_code == 200:
+                sent[ride_id] = assign_start
+        await asyncio.sleep(max(0.0, 1 - (time.perf_counter() - tick)))
+    await asyncio.sleep(0.5)
+    await asyncio.gather(*refetches)
+    busy_qps = (await statement_count(http) - before) / (time.perf_counter() - start)
+    latencies = sorted((received[ride_id] - at) * 1000 for ride_id, at in sent.items() if ride_id in received)
+    print(f"push busy   {busy_qps:,.1f} statements/s with {len(sent) / window:.0f} assignments/s "
+          f"(request + queue + assign + one refetch per notified rider)")
+    if latencies:
+        print(f"            {len(latencies)}/{len(sent)} events delivered, latency p50 "
+              f"{statistics.median(latencies):.1f} ms, p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run(args, port: int):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as http:
+        for _ in range(200):
+            try:
+                await http.get("/")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        await http.post("/register_drivers_bulk", json={"drivers": [
+            {"name": f"events-{i}", "car_no": f"EV-{i}", "latitude": 40.7, "longitude": -74.0}
+            for i in range(args.drivers)
+        ]})
+        await run_polling(http, args)
+        await run_push(http, f"ws://127.0.0.1:{port}", args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds with sockets open (half idle, half busy)")
+    parser.add_argument("--assign-rate", type=int, default=20, help="Rides queued and assigned per second")
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--poll-interval", type=float, default=10)
+    parser.add_argument("--poll-sample", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)  # Child process mode
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    if args.serve:
+        serve(args.serve)
+        return
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'events.db')}",
+        "RIDE_POOL_NORMAL": "0",
+        "RIDE_POOL_EMERGENCY": "0",
+    }
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_ride_events", "--serve", str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
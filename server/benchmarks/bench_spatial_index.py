@@ -0,0 +1,76 @@
+"""
+Benchmark: nearest-driver dispatch, linear scan vs DriverGridIndex
+
+Run from the server/ directory:
+    python -m benchmarks.bench_spatial_index [--rides 1000]
+
+For each pool size a fresh pool of random drivers around Manhattan is built
+and `--rides` random pickups are dispatched. The linear scan reproduces the
+old RideService.assign_driver (haversine over every driver + list.remove).
+"""
+
+import argparse
+import random
+import time
+
+from app.geo import haversine_km
+from app.spatial_index import DriverGridIndex
+
+LAT_RANGE = (40.55, 40.90)
+LON_RANGE = (-74.10, -73.75)
+
+
+def random_point(rng: random.Random):
+    return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+
+def dispatch_linear(drivers, pickups):
+    for pickup_lat, pickup_lon in pickups:
+        nearest_driver = None
+        min_distance = float('inf')
+        for driver in drivers:
+            driver_lat, driver_lon = driver["location"]
+            distance = haversine_km(pickup_lat, pickup_lon, driver_lat, driver_lon)
+            if distance < min_distance:
+                min_distance = distance
+                nearest_driver = driver
+        drivers.remove(nearest_driver)
+
+
+def dispatch_indexed(index: DriverGridIndex, pickups):
+    for pickup_lat, pickup_lon in pickups:
+        [(_, driver_id)] = index.nearest(pickup_lat, pickup_lon, k=1)
+        index.remove(driver_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rides", type=int, default=1000, help="Rides dispatched per pool size")
+    parser.add_argument("--pools", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'drivers':>8} {'linear ms/ride':>15} {'index ms/ride':>14} {'speedup':>8}")
+    for pool_size in args.pools:
+        rng = random.Random(args.seed)
+        locations = [random_point(rng) for _ in range(pool_size)]
+        rides = min(args.rides, pool_size)
+        pickups = [random_point(rng) for _ in range(rides)]
+
+        drivers = [{"id": i, "location": loc} for i, loc in enumerate(locations)]
+        start = time.perf_counter()
+        dispatch_linear(drivers, pickups)
+        linear = (time.perf_counter() - start) / rides * 1000
+
+        index = DriverGridIndex()
+        for i, (lat, lon) in enumerate(locations):
+            index.insert(i, lat, lon)
+        start = time.perf_counter()
+        dispatch_indexed(index, pickups)
+        indexed = (time.perf_counter() - start) / rides * 1000
+
+        print(f"{pool_size:>8} {linear:>15.4f} {indexed:>14.4f} {linear / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark harness: timing, percentiles, JSON results and baseline comparison
+
+Used by benchmarks/suite.py. A benchmark is a callable run `iterations`
+times, each call timed on its own; an optional untimed `setup(i)` runs
+before every call (e.g. to refill a queue the operation drains). With
+repeats > 1 the fastest run is kept, which filters out scheduler noise.
+"""
+
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Metrics compared against a baseline and whether higher is better
+COMPARED_METRICS = {"ops_per_sec": True, "p50_us": False, "p99_us": False}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(fn: Callable[[int], object], iterations: int, setup: Optional[Callable[[int], object]] = None,
+            repeats: int = 1) -> Dict:
+    """Time `iterations` calls of fn(i), `repeats` times, and summarize the fastest run"""
+    best = None
+    perf_counter_ns = time.perf_counter_ns
+    for _ in range(repeats):
+        latencies = []
+        for i in range(iterations):
+            if setup is not None:
+                setup(i)
+            start = perf_counter_ns()
+            fn(i)
+            latencies.append(perf_counter_ns() - start)
+        summary = summarize(latencies)
+        if best is None or summary["ops_per_sec"] > best["ops_per_sec"]:
+            best = summary
+    best["repeats"] = repeats
+    return best
+
+
+def summarize(latencies_ns: List[int]) -> Dict:
+    latencies = sorted(latencies_ns)
+    total_s = sum(latencies) / 1e9
+    return {
+        "iterations": len(latencies),
+        "ops_per_sec": len(latencies) / total_s if total_s else 0.0,
+        "mean_us": total_s * 1e6 / len(latencies) if latencies else 0.0,
+        "p50_us": percentile(latencies, 50) / 1e3,
+        "p95_us": percentile(latencies, 95) / 1e3,
+        "p99_us": percentile(latencies, 99) / 1e3,
+    }
+
+
+def metadata(args: Dict) -> Dict:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "args": args,
+    }
+
+
+def save(path: str, results: Dict[str, Dict], meta: Dict):
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict]:
+    """
+    Compare results with a baseline run
+
+    Args:
+        results: name -> summary of the current run
+        baseline: name -> summary of the stored run
+        threshold: Relative change that counts as a regression (0.10 = 10%)
+
+    Returns:
+        One row per benchmark and metric present in both runs
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            rows.append({
+                "benchmark": name,
+                "metric": metric,
+                "baseline": old,
+                "current": new,
+                "change": change,
+                "regression": worse > threshold,
+            })
+    return rows
+
+
+def print_results(results: Dict[str, Dict]):
+    print(f"{'benchmark':<36} {'ops/s':>12} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10}")
+    for name, row in results.items():
+        print(f"{name:<36} {row['ops_per_sec']:>12.0f} {row['p50_us']:>10.1f} "
+              f"{row['p95_us']:>10.1f} {row['p99_us']:>10.1f}")
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"\n{'benchmark':<36} {'metric':<12} {'baseline':>12} {'current':>12} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<36} {row['metric']:<12} {row['baseline']:>12.1f} "
+              f"{row['current']:>12.1f} {row['change'] * 100:>+7.1f}%{flag}")
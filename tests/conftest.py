@@ -0,0 +1,15 @@
+"""
+Shared setup: the API code lives in server/ and reads DATABASE_URL on import,
+so point it at a throwaway SQLite file before any test imports app.
+"""
+
+import os
+import sys
+import tempfile
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+sys.path.insert(0, SERVER_DIR)
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tests.db')}"
+os.environ.setdefault("RIDE_POOL_NORMAL", "0")
+os.environ.setdefault("RIDE_POOL_EMERGENCY", "0")
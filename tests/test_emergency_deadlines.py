@@ -0,0 +1,51 @@
+"""Emergency pickup guarantee: deadline escalation and pre-emption (benchmarks/bench_emergency_deadlines.py)"""
+
+import argparse
+from datetime import datetime
+
+from benchmarks.bench_emergency_deadlines import SimClock, arrivals, simulate
+
+# 200 emergency + 200 normal rides a minute for 800 drivers in a 4 km square: tight enough to pre-empt
+SMALL = argparse.Namespace(emergency_per_min=200, normal_per_min=200, minutes=4, drivers=800, city_km=4,
+                           dispatch_every=5, batch=200, seed=42)
+
+
+def test_escalation_raises_the_guarantee_hit_rate():
+    schedule = arrivals(SMALL, SMALL.seed)
+    baseline = simulate(SMALL, schedule, escalate=False)[0].deadlines.stats()
+    scheduler = simulate(SMALL, schedule, escalate=True)[0].deadlines.stats()
+
+    assert baseline["escalations"]["preempted"] == 0
+    assert scheduler["escalations"]["preempted"] > 0
+    assert scheduler["hit_rate"] >= 0.95
+    assert scheduler["hit_rate"] > baseline["hit_rate"]
+
+
+def test_preempted_ride_is_requeued_at_the_front():
+    from app.deadline_scheduler import DeadlineScheduler
+    from app.ride_service import RideService
+
+    clock = SimClock(datetime.now().timestamp())
+    service = RideService()
+    service.deadlines = DeadlineScheduler(clock=clock)
+    service.upsert_driver(1, 40.700, -74.000)
+
+    # Driver 1 heads to a normal pickup ~3 km away; another normal ride waits behind it
+    service.add_ride_to_queue({"id": 1, "user_id": 1, "pickup": (40.727, -74.000), "destination": (40.75, -74.0)})
+    assert service.assign_driver()["driver"]["id"] == 1
+    service.add_ride_to_queue({"id": 2, "user_id": 2, "pickup": (40.710, -74.000), "destination": (40.75, -74.0)})
+
+    # An emergency ride next to the driver, 100 s from its deadline, with no free driver left
+    guaranteed_by = datetime.fromtimestamp(clock.now + 100).isoformat()
+    service.add_ride_to_queue({"id": 3, "user_id": 3, "pickup": (40.701, -74.000), "destination": (40.75, -74.0),
+                               "guaranteed_by": guaranteed_by}, "EMERGENCY")
+    assignments = []
+    for _ in range(3):  # Timers fire on the ticks after they come due: widen, then preempt
+        clock.now += 1
+        assignments += service.escalate_deadlines()
+
+    [assignment] = assignments
+    assert assignment["request"]["id"] == 3 and assignment["driver"]["id"] == 1
+    assert assignment["preempted"]["id"] == 1
+    assert [ride["id"] for ride in service.ride_queue] == [1, 2]
+    assert service.deadlines.stats()["hits"] == 1
@@ -0,0 +1,22 @@
+"""Every hot crud query must use an index (benchmarks/check_query_plans.py on a small seed)"""
+
+import random
+
+from benchmarks.check_query_plans import check_plans
+
+
+def test_hot_queries_use_indexes():
+    from app import models
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations()
+    db = SessionLocal()
+    try:
+        plans = check_plans(db, engine, drivers=2_000, rides=20_000, users=2_000, rng=random.Random(42))
+    finally:
+        db.close()
+
+    scanned = {name: (seq_scans, lines) for name, lines, seq_scans in plans if seq_scans}
+    assert not scanned, f"Sequential scans: {scanned}"